@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+from __future__ import unicode_literals, print_function
+
+"""
+Compare the speed of the AES-128 CBC decryption of aes_cbc_decrypt, which
+works on lists of ints, with aes_cbc_decrypt_bytes, and with pycryptodome
+if it is installed.
+"""
+
+# Allow direct execution
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haruhi_dl.aes import aes_cbc_decrypt, aes_cbc_decrypt_bytes
+from haruhi_dl.utils import bytes_to_intlist, intlist_to_bytes
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+
+def bench(name, decrypt, data, expected=None):
+    start = time.time()
+    result = decrypt(data)
+    elapsed = time.time() - start
+    print('%-22s %8.3fs %8.3f MB/s' % (name, elapsed, len(data) / elapsed / 1e6))
+    if expected is not None and result != expected:
+        print('MISMATCH in %s' % name)
+        return None
+    return result
+
+
+def main():
+    key = os.urandom(16)
+    iv = os.urandom(16)
+    # The list-based implementation is too slow for a whole fragment
+    small = os.urandom(64 * 1024)
+    large = os.urandom(4 * 1024 * 1024)
+
+    expected = bench(
+        'aes_cbc_decrypt', lambda data: intlist_to_bytes(aes_cbc_decrypt(
+            bytes_to_intlist(data), bytes_to_intlist(key), bytes_to_intlist(iv))),
+        small)
+    ok = bench('aes_cbc_decrypt_bytes', lambda data: aes_cbc_decrypt_bytes(data, key, iv), small, expected) is not None
+    bench('aes_cbc_decrypt_bytes', lambda data: aes_cbc_decrypt_bytes(data, key, iv), large)
+    if AES is not None:
+        ok = bench(
+            'pycryptodome', lambda data: AES.new(key, AES.MODE_CBC, iv).decrypt(data),
+            small, expected) is not None and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
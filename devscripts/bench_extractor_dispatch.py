@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+from __future__ import unicode_literals, print_function
+
+"""
+Compare finding the extractor for a URL by trying every suitable() in turn
+with narrowing the extractors down with ExtractorIndex first.
+
+The URLs are the ones from test/test_all_urls.py and the test cases of the
+extractors. The first matching extractor is checked to be the same for both.
+"""
+
+# Allow direct execution
+import io
+import os
+import re
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test.helper import gettestcases
+from haruhi_dl.extractor import gen_extractor_classes
+from haruhi_dl.extractor.dispatch import ExtractorIndex
+
+
+def all_urls_test_urls():
+    fn = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test', 'test_all_urls.py')
+    with io.open(fn, encoding='utf-8') as f:
+        return re.findall(r"'([^'\s]+://[^'\s]+)'", f.read())
+
+
+def first_match(ies, url):
+    for ie in ies:
+        if ie.suitable(url):
+            return ie
+
+
+def main():
+    urls = list(all_urls_test_urls()) + [tc['url'] for tc in gettestcases(True)]
+    ies = gen_extractor_classes()
+
+    # Warm up the regex cache of every extractor, so that neither side pays
+    # for compiling them
+    for url in urls:
+        first_match(ies, url)
+
+    start = time.time()
+    linear = [first_match(ies, url) for url in urls]
+    linear_time = time.time() - start
+
+    start = time.time()
+    index = ExtractorIndex(ies)
+    build_time = time.time() - start
+
+    start = time.time()
+    candidates = [index.candidates(url) for url in urls]
+    indexed = [first_match(c, url) for c, url in zip(candidates, urls)]
+    indexed_time = time.time() - start
+
+    mismatches = [
+        (url, a, b) for url, a, b in zip(urls, linear, indexed) if a is not b]
+    for url, a, b in mismatches:
+        print('MISMATCH %s: %s != %s' % (url, a and a.ie_key(), b and b.ie_key()))
+
+    print('%d URLs, %d extractors' % (len(urls), len(ies)))
+    print('index built in %.3fs' % build_time)
+    print('linear:  %.3fs (%.1fus/URL)' % (linear_time, linear_time / len(urls) * 1e6))
+    print('indexed: %.3fs (%.1fus/URL), %.1f candidates/URL on average' % (
+        indexed_time, indexed_time / len(urls) * 1e6,
+        sum(map(len, candidates)) / float(len(urls))))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
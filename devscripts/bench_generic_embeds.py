@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+from __future__ import unicode_literals, print_function
+
+"""
+Compare looking for the embeds of GenericIE._EMBED_IES in whole webpages
+with looking for the ones of GenericIE._TAG_EMBED_IES in the tags
+collected by GenericIE._scan_embed_tags().
+
+Takes webpages saved with --write-pages (e.g. when running the tests of
+GenericIE), as .dump files or directories of them. Without any, a
+generated webpage is used.
+"""
+
+# Allow direct execution
+import io
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haruhi_dl.compat import compat_urllib_parse_unquote
+from haruhi_dl.extractor.generic import GenericIE
+
+
+def read_webpages(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for webpage in read_webpages(
+                    os.path.join(path, fn) for fn in sorted(os.listdir(path)) if fn.endswith('.dump')):
+                yield webpage
+            continue
+        with io.open(path, 'rb') as f:
+            # The same unescaping as in GenericIE
+            yield path, compat_urllib_parse_unquote(f.read().decode('utf-8', 'replace'))
+
+
+def generated_webpage(size=1000000):
+    random.seed(0)
+    # Mostly text and markup, with a few scripts and the odd embed
+    snippets = [
+        ('lorem ipsum dolor sit amet', 30), ('<p>', 10), ('</p>', 10), ('<div class="content">', 10),
+        ('</div>', 10), ('<a href="https://example.com/page/%d">link</a>', 10),
+        ('<img src="/static/img%d.png">', 5), ('<script>var config = {"id": %d};</script>', 2),
+        ('<script src="/static/app%d.js"></script>', 1), ('<meta property="og:image" content="/%d.jpg">', 1),
+        ('<iframe src="https://player.vimeo.com/video/%d" width="640"></iframe>', 0.01),
+    ]
+    population = [snippet for snippet, _ in snippets]
+    weights = [weight for _, weight in snippets]
+    parts = []
+    length = 0
+    while length < size:
+        snippet = random.choices(population, weights)[0]
+        if '%d' in snippet:
+            snippet %= random.randint(1, 99999)
+        parts.append(snippet)
+        length += len(snippet)
+    return ' '.join(parts)
+
+
+def find_embeds(webpage, url, use_tags):
+    found = []
+    embed_tags = GenericIE._scan_embed_tags(webpage) if use_tags else None
+    for embie in GenericIE._EMBED_IES:
+        page = embed_tags if use_tags and embie in GenericIE._TAG_EMBED_IES else webpage
+        found.append(embie._extract_urls(page, url=url))
+    return found
+
+
+def main(paths):
+    webpages = list(read_webpages(paths)) if paths else [('generated', generated_webpage())]
+    url = 'https://example.com/'
+    total = {False: 0, True: 0}
+    mismatches = 0
+    for name, webpage in webpages:
+        results = {}
+        for use_tags in (False, True):
+            start = time.time()
+            results[use_tags] = find_embeds(webpage, url, use_tags)
+            total[use_tags] += time.time() - start
+        if results[False] != results[True]:
+            mismatches += 1
+            print('MISMATCH in %s' % name)
+    size = sum(len(webpage) for _, webpage in webpages)
+    print('%d webpages, %.1f MB' % (len(webpages), size / 1e6))
+    print('whole webpages: %.3fs' % total[False])
+    print('embed tags:     %.3fs' % total[True])
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -16,6 +16,7 @@ if os.path.exists(lazy_extractors_filename):
 
 from haruhi_dl.extractor import _ALL_CLASSES
 from haruhi_dl.extractor.common import InfoExtractor, SearchInfoExtractor, SelfhostedInfoExtractor
+from haruhi_dl.extractor.dispatch import url_literals
 
 with open('devscripts/lazy_load_template.py', 'rt') as f:
     module_template = f.read()
@@ -28,6 +29,7 @@ module_contents = [
 ie_template = '''
 class {name}({bases}):
     _VALID_URL = {valid_url!r}
+    _URL_LITERALS = {url_literals!r}
     _module = '{module}'
 '''
 
@@ -61,6 +63,7 @@ def build_lazy_ie(ie, name):
         name=name,
         bases=', '.join(map(get_base_name, ie.__bases__)),
         valid_url=valid_url,
+        url_literals=url_literals(ie),
         module=ie.__module__)
     if ie._SELFHOSTED is True:
         s += sh_additions_template.format(
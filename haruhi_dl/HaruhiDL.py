@@ -4,11 +4,13 @@
 from __future__ import absolute_import, unicode_literals
 
 import collections
+import concurrent.futures
 import contextlib
 import copy
 import datetime
 import errno
 import fileinput
+import functools
 import io
 import itertools
 import json
@@ -21,6 +23,7 @@ import shutil
 import subprocess
 import socket
 import sys
+import threading
 import time
 import tokenize
 import traceback
@@ -63,7 +66,7 @@ from .utils import (
     HaruhiDLError,
     int_or_none,
     ISO3166Utils,
-    locked_file,
+    LazyField,
     make_HTTPS_handler,
     MaxDownloadsReached,
     orderedSet,
@@ -77,6 +80,7 @@ from .utils import (
     register_socks_protocols,
     render_table,
     replace_extension,
+    run_concurrently,
     SameFileError,
     sanitize_filename,
     sanitize_path,
@@ -93,10 +97,14 @@ from .utils import (
     HaruhiDLCookieJar,
     HaruhiDLCookieProcessor,
     HaruhiDLHandler,
+    HTTPConnectionPool,
     HaruhiDLRedirectHandler,
 )
-from .cache import Cache
+from .archive import DownloadArchive
+from .cache import Cache, HTTPCache
 from .extractor import get_info_extractor, gen_extractor_classes, _LAZY_LOADER
+from .extractor.common import InfoExtractor
+from .extractor.dispatch import ExtractorIndex
 from .downloader import get_suitable_downloader
 from .downloader.rtmp import rtmpdump_version
 from .playwright import PlaywrightHelper
@@ -114,6 +122,31 @@ if compat_os_name == 'nt':
     import ctypes
 
 
+class _EntryTurns(object):
+    """
+    Lets concurrently processed playlist entries count their downloads in
+    playlist order: turn(idx) blocks until the entries before idx have had
+    their turn, and passes the turn on to idx + 1 when left. Once the turn
+    of idx has passed, turn(idx) only serializes with the other entries.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._next = 0
+
+    @contextlib.contextmanager
+    def turn(self, idx):
+        with self._cond:
+            while self._next < idx:
+                self._cond.wait()
+            try:
+                yield
+            finally:
+                if self._next == idx:
+                    self._next += 1
+                    self._cond.notify_all()
+
+
 class HaruhiDL(object):
     """HaruhiDL class.
 
@@ -174,6 +207,9 @@ class HaruhiDL(object):
     playlist_items:    Specific indices of playlist to download.
     playlistreverse:   Download playlist items in reverse order.
     playlistrandom:    Download playlist items in random order.
+    concurrent_playlist_entries: Number of playlist items to process at
+                       the same time (default is 1). autonumber follows the
+                       playlist order.
     matchtitle:        Download only matching titles.
     rejecttitle:       Reject downloads for matching titles.
     logger:            Log messages to a logging.Logger instance.
@@ -195,6 +231,13 @@ class HaruhiDL(object):
     skip_download:     Skip the actual download of the video file
     cachedir:          Location of the cache files in the filesystem.
                        False to disable filesystem cache.
+    cache_backend:     'sqlite' (default if available) to store the cache in
+                       a single database file, or 'dir' for a file per entry.
+    http_cache:        Keep the HTTP responses received by extractors in the
+                       cache directory, and reuse or revalidate them as their
+                       headers allow rather than downloading them again.
+    http_cache_size:   Maximum size of the HTTP cache in bytes (100 MiB by
+                       default); the least recently used responses are evicted.
     noplaylist:        Download single video instead of a playlist if in doubt.
     age_limit:         An integer representing the user's age in years.
                        Unsuitable videos for the given age are skipped.
@@ -210,6 +253,8 @@ class HaruhiDL(object):
     download_archive:  File name of a file where all downloads are recorded.
                        Videos already present in the file are not downloaded
                        again.
+    break_on_existing: Stop going through a playlist once this many entries
+                       in a row are present in the download archive.
     cookiefile:        File name where cookies should be read from and dumped to.
     nocheckcertificate:Do not verify SSL certificates
     prefer_insecure:   Use HTTP instead of HTTPS to retrieve information.
@@ -307,7 +352,7 @@ class HaruhiDL(object):
     nopart, updatetime, buffersize, ratelimit, min_filesize, max_filesize, test,
     noresizebuffer, retries, continuedl, noprogress, consoletitle,
     xattr_set_filesize, external_downloader_args, hls_use_mpegts,
-    http_chunk_size.
+    http_chunk_size, concurrent_fragment_downloads, http_connections.
 
     The following options are used by the post processors:
     prefer_ffmpeg:     If False, use avconv instead of ffmpeg if both are available,
@@ -343,6 +388,9 @@ class HaruhiDL(object):
     _playlist_level = 0
     _playlist_urls = set()
     _screen_file = None
+    _download_archive = None
+    _ies_index = None
+    _ies_lookups = 0
 
     def __init__(self, params=None, auto_init=True):
         """Create a FileDownloader object with the given options."""
@@ -354,6 +402,9 @@ class HaruhiDL(object):
         self._progress_hooks = []
         self._download_retcode = 0
         self._num_downloads = 0
+        # Guards the state shared by concurrently processed playlist entries
+        self._lock = threading.RLock()
+        self._thread_state = threading.local()
         self._screen_file = [sys.stdout, sys.stderr][params.get('logtostderr', False)]
         self._err_file = sys.stderr
         self.params = {
@@ -362,6 +413,7 @@ class HaruhiDL(object):
         }
         self.params.update(params)
         self.cache = Cache(self)
+        self.http_cache = HTTPCache(self)
 
         def check_deprecated(param, option, suggestion):
             if self.params.get(param) is not None:
@@ -461,6 +513,8 @@ class HaruhiDL(object):
     def add_info_extractor(self, ie):
         """Add an InfoExtractor object to the end of the list."""
         self._ies.append(ie)
+        if self._ies_index is not None:
+            self._ies_index.add(ie)
         if not isinstance(ie, type):
             self._ies_instances[ie.ie_key()] = ie
             ie.set_downloader(self)
@@ -471,11 +525,30 @@ class HaruhiDL(object):
         the _ies list, if there's no instance it will create a new one and add
         it to the extractor list.
         """
-        ie = self._ies_instances.get(ie_key)
-        if ie is None:
-            ie = get_info_extractor(ie_key)()
-            self.add_info_extractor(ie)
-        return ie
+        with self._lock:
+            ie = self._ies_instances.get(ie_key)
+            if ie is None:
+                ie = get_info_extractor(ie_key)()
+                self.add_info_extractor(ie)
+            return ie
+
+    _IES_INDEX_MIN_LOOKUPS = 200
+
+    def _candidate_ies(self, url):
+        """
+        Return the extractors whose suitable() may accept url, in the order
+        they have been added
+        """
+        with self._lock:
+            if self._ies_index is None:
+                # Building the index costs as much as a few hundred lookups
+                # going through all the extractors, so runs with a few URLs
+                # do without it
+                self._ies_lookups += 1
+                if self._ies_lookups < self._IES_INDEX_MIN_LOOKUPS:
+                    return list(self._ies)
+                self._ies_index = ExtractorIndex(self._ies)
+            return self._ies_index.candidates(url)
 
     def add_default_info_extractors(self):
         """
@@ -511,7 +584,8 @@ class HaruhiDL(object):
         return self.to_stdout(message, skip_eol, check_quiet=True)
 
     def _write_string(self, s, out=None):
-        write_string(s, out=out, encoding=self.params.get('encoding'))
+        with self._lock:
+            write_string(s, out=out, encoding=self.params.get('encoding'))
 
     def to_stdout(self, message, skip_eol=False, check_quiet=False):
         """Print message to stdout if not in quiet mode."""
@@ -573,6 +647,14 @@ class HaruhiDL(object):
         if self.params.get('cookiefile') is not None:
             self.cookiejar.save(ignore_discard=True, ignore_expires=True)
 
+        if self.params.get('verbose'):
+            stats = self.connection_pool.stats()
+            self._write_string(
+                '[debug] HTTP connections: %d requests, %d connections opened, '
+                '%d reused (%d stale)\n' % (
+                    stats['requests'], stats['connections'], stats['reused'], stats['stale']))
+        self.connection_pool.close()
+
     def trouble(self, message=None, tb=None):
         """Determine action to take when a download problem appears.
 
@@ -648,7 +730,8 @@ class HaruhiDL(object):
             autonumber_size = self.params.get('autonumber_size')
             if autonumber_size is None:
                 autonumber_size = 5
-            template_dict['autonumber'] = self.params.get('autonumber_start', 1) - 1 + self._num_downloads
+            num_downloads = getattr(self._thread_state, 'num_downloads', self._num_downloads)
+            template_dict['autonumber'] = self.params.get('autonumber_start', 1) - 1 + num_downloads
             if template_dict.get('resolution') is None:
                 if template_dict.get('width') and template_dict.get('height'):
                     template_dict['resolution'] = '%dx%d' % (template_dict['width'], template_dict['height'])
@@ -663,7 +746,7 @@ class HaruhiDL(object):
                 is_id=(k == 'id' or k.endswith('_id')))
             template_dict = dict((k, v if isinstance(v, compat_numeric_types) else sanitize(k, v))
                                  for k, v in template_dict.items()
-                                 if v is not None and not isinstance(v, (list, tuple, dict)))
+                                 if v is not None and not isinstance(v, (list, tuple, dict, LazyField)))
             template_dict = collections.defaultdict(lambda: self.params.get('outtmpl_na_placeholder', 'NA'), template_dict)
 
             outtmpl = self.params.get('outtmpl', DEFAULT_OUTTMPL)
@@ -806,7 +889,7 @@ class HaruhiDL(object):
         if ie_key:
             ies = [self.get_info_extractor(ie_key)]
         else:
-            ies = self._ies
+            ies = self._candidate_ies(url)
 
         for ie in ies:
             if not force_use_mastodon and not ie.suitable(url):
@@ -939,14 +1022,16 @@ class HaruhiDL(object):
                     % ie_result.get('title') or ie_result.get('id'))
                 return
 
-            self._playlist_level += 1
-            self._playlist_urls.add(webpage_url)
+            with self._lock:
+                self._playlist_level += 1
+                self._playlist_urls.add(webpage_url)
             try:
                 return self.__process_playlist(ie_result, download)
             finally:
-                self._playlist_level -= 1
-                if not self._playlist_level:
-                    self._playlist_urls.clear()
+                with self._lock:
+                    self._playlist_level -= 1
+                    if not self._playlist_level:
+                        self._playlist_urls.clear()
         elif result_type == 'compat_list':
             self.report_warning(
                 'Extractor %s returned a compat_list result. '
@@ -999,6 +1084,7 @@ class HaruhiDL(object):
             playlistitems = orderedSet(iter_playlistitems(playlistitems_str))
 
         ie_entries = ie_result['entries']
+        break_on_existing = self.params.get('break_on_existing')
 
         def make_playlistitems_entries(list_ie_entries):
             num_entries = len(list_ie_entries)
@@ -1037,11 +1123,23 @@ class HaruhiDL(object):
             if playlistitems:
                 entries = make_playlistitems_entries(list(itertools.islice(
                     ie_entries, 0, max(playlistitems))))
+            elif ((self.params.get('max_downloads') is not None or break_on_existing)
+                    and not self.params.get('playlistreverse', False)
+                    and not self.params.get('playlistrandom', False)):
+                # Only go through as much of the playlist as needed to reach
+                # the maximum number of downloads or the archived entries, at
+                # the cost of not knowing how many entries there are
+                entries = itertools.islice(ie_entries, playliststart, playlistend)
+                n_entries = None
+                self.to_screen(
+                    '[%s] playlist %s: Downloading videos as the playlist is listed' %
+                    (ie_result['extractor'], playlist))
             else:
                 entries = list(itertools.islice(
                     ie_entries, playliststart, playlistend))
-            n_entries = len(entries)
-            report_download(n_entries)
+            if isinstance(entries, list):
+                n_entries = len(entries)
+                report_download(n_entries)
 
         if self.params.get('playlistreverse', False):
             entries = entries[::-1]
@@ -1049,10 +1147,12 @@ class HaruhiDL(object):
         if self.params.get('playlistrandom', False):
             random.shuffle(entries)
 
+        if break_on_existing:
+            entries = self.__break_on_existing(entries, break_on_existing)
+
         x_forwarded_for = ie_result.get('__x_forwarded_for_ip')
 
-        for i, entry in enumerate(entries, 1):
-            self.to_screen('[download] Downloading video %s of %s' % (i, n_entries))
+        def entry_extra_info(i, entry):
             # This __x_forwarded_for_ip thing is a bit ugly but requires
             # minimal changes
             if x_forwarded_for:
@@ -1074,15 +1174,93 @@ class HaruhiDL(object):
             reason = self._match_entry(entry, incomplete=True)
             if reason is not None:
                 self.to_screen('[download] ' + reason)
-                continue
+                return None
+            return extra
+
+        concurrency = self.params.get('concurrent_playlist_entries') or 1
+        # Entries of nested playlists are processed by the worker of the
+        # outer entry
+        if concurrency > 1 and getattr(self._thread_state, 'entry_turn', None) is None:
+            playlist_results = self.__process_entries_concurrently(
+                entries, n_entries, entry_extra_info, download, concurrency)
+        else:
+            for i, entry in enumerate(entries, 1):
+                self._report_playlist_entry(i, n_entries)
+                extra = entry_extra_info(i, entry)
+                if extra is None:
+                    continue
 
-            entry_result = self.__process_iterable_entry(entry, download, extra)
-            # TODO: skip failed (empty) entries?
-            playlist_results.append(entry_result)
+                entry_result = self.__process_iterable_entry(entry, download, extra)
+                # TODO: skip failed (empty) entries?
+                playlist_results.append(entry_result)
         ie_result['entries'] = playlist_results
         self.to_screen('[download] Finished downloading playlist: %s' % playlist)
         return ie_result
 
+    def __break_on_existing(self, entries, count):
+        """Generate the entries until count of them in a row are in the download archive"""
+        archived = 0
+        for entry in entries:
+            if self.in_download_archive(entry):
+                archived += 1
+                if archived >= count:
+                    self.to_screen(
+                        '[download] %d entries in a row have already been recorded in archive, '
+                        'stopping' % count)
+                    return
+            else:
+                archived = 0
+            yield entry
+
+    def __process_entries_concurrently(self, entries, n_entries, entry_extra_info, download, concurrency):
+        turns = _EntryTurns()
+
+        def process_entry(entry_turn, i, entry, extra):
+            state = self._thread_state
+            state.entry_turn = entry_turn
+            try:
+                self._report_playlist_entry(i, n_entries)
+                return self.__process_iterable_entry(entry, download, extra)
+            finally:
+                # The following entries wait for this one to have started
+                # downloading, so pass the turn on if it did not
+                with entry_turn():
+                    pass
+                state.__dict__.clear()
+
+        playlist_results = []
+        # Only take entries from the (possibly lazy) playlist as workers get
+        # free for them, keeping two in flight per worker
+        window = concurrency * 2
+        futures = collections.deque()
+        n_submitted = 0
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            try:
+                for i, entry in enumerate(entries, 1):
+                    extra = entry_extra_info(i, entry)
+                    if extra is None:
+                        continue
+                    entry_turn = functools.partial(turns.turn, n_submitted)
+                    futures.append(executor.submit(process_entry, entry_turn, i, entry, extra))
+                    n_submitted += 1
+                    if len(futures) >= window:
+                        # TODO: skip failed (empty) entries?
+                        playlist_results.append(futures.popleft().result())
+                while futures:
+                    playlist_results.append(futures.popleft().result())
+            finally:
+                # Stop at the first error (or MaxDownloadsReached), like the
+                # sequential processing does
+                for future in futures:
+                    future.cancel()
+        return playlist_results
+
+    def _report_playlist_entry(self, i, n_entries):
+        if n_entries is None:
+            self.to_screen('[download] Downloading video %s' % i)
+        else:
+            self.to_screen('[download] Downloading video %s of %s' % (i, n_entries))
+
     @__handle_extraction_exceptions
     def __process_iterable_entry(self, entry, download, extra_info):
         return self.process_ie_result(
@@ -1501,11 +1679,16 @@ class HaruhiDL(object):
             info_dict['playlist'] = None
             info_dict['playlist_index'] = None
 
+        self._resolve_lazy_fields(info_dict, self._consumed_lazy_fields(download))
+
         thumbnails = info_dict.get('thumbnails')
         if thumbnails is None:
             thumbnail = info_dict.get('thumbnail')
             if thumbnail:
                 info_dict['thumbnails'] = thumbnails = [{'url': thumbnail}]
+        if isinstance(thumbnails, LazyField):
+            # Nothing is going to look at them
+            thumbnails = None
         if thumbnails:
             thumbnails.sort(key=lambda t: (
                 t.get('preference') if t.get('preference') is not None else -1,
@@ -1556,6 +1739,7 @@ class HaruhiDL(object):
         if 'formats' in info_dict:
             formats_subtitles = list(filter(lambda x: x.get('_subtitle'), info_dict['formats']))
             if formats_subtitles:
+                self._resolve_lazy_fields(info_dict, ['subtitles'])
                 info_dict.setdefault('subtitles', {})
                 for sub in formats_subtitles:
                     if sub['_key'] not in info_dict['subtitles']:
@@ -1566,7 +1750,7 @@ class HaruhiDL(object):
 
         for cc_kind in ('subtitles', 'automatic_captions'):
             cc = info_dict.get(cc_kind)
-            if cc:
+            if cc and not isinstance(cc, LazyField):
                 for _, subtitle in cc.items():
                     for subtitle_format in subtitle:
                         if subtitle_format.get('url'):
@@ -1709,11 +1893,20 @@ class HaruhiDL(object):
             'incomplete_formats': incomplete_formats,
         }
 
+        # The URLs of all the formats are looked at when the whole info dict
+        # is printed, written or returned
+        if not download or any(self.params.get(p, False) for p in (
+                'forcejson', 'dump_single_json', 'writeinfojson')):
+            self._resolve_format_urls(formats)
+
         formats_to_download = list(format_selector(ctx))
         if not formats_to_download:
             raise ExtractorError('requested format not available',
                                  expected=True)
 
+        if self.params.get('forceurl', False) or not self.params.get('simulate', False):
+            self._resolve_format_urls(formats_to_download)
+
         if download:
             if len(formats_to_download) > 1:
                 self.to_screen('[info] %s: downloading video in %s formats' % (info_dict['id'], len(formats_to_download)))
@@ -1723,8 +1916,63 @@ class HaruhiDL(object):
                 self.process_info(new_info)
         # We update the info dict with the best quality format (backwards compatibility)
         info_dict.update(formats_to_download[-1])
+        if download:
+            # Nothing is going to look at the lazy fields left, and what they
+            # hold on to (e.g. a whole webpage) would stay around with the
+            # results of a playlist
+            for key, value in list(info_dict.items()):
+                if isinstance(value, LazyField):
+                    del info_dict[key]
         return info_dict
 
+    def _consumed_lazy_fields(self, download):
+        """
+        Return the names of the fields of an info dict that are going to be
+        looked at, among the ones that may be computed lazily (see LazyField),
+        or None if the whole info dict is
+        """
+        params = self.params
+        if (not download
+                or any(params.get(p, False) for p in (
+                    'forcejson', 'dump_single_json', 'writeinfojson'))
+                or params.get('match_filter') is not None
+                or (self._pps and not params.get('simulate', False)
+                    and not params.get('skip_download', False))):
+            return None
+        fields = set(re.findall(
+            r'%\((\w+)\)', params.get('outtmpl', DEFAULT_OUTTMPL)))
+        if params.get('writesubtitles', False) or params.get('listsubtitles', False):
+            fields.add('subtitles')
+        if params.get('writeautomaticsub', False) or params.get('listsubtitles', False):
+            fields.add('automatic_captions')
+        if 'thumbnail' in fields or any(params.get(p, False) for p in (
+                'writethumbnail', 'write_all_thumbnails', 'list_thumbnails', 'forcethumbnail')):
+            fields.add('thumbnails')
+        return fields
+
+    # Each lazy field usually needs requests of its own, so they are computed
+    # concurrently, with the same limit as the requests of an extractor
+    _MAX_CONCURRENT_LAZY_FIELDS = InfoExtractor._MAX_CONCURRENT_REQUESTS
+
+    @classmethod
+    def _resolve_lazy_fields(cls, info_dict, fields=None):
+        """Compute the LazyField values of info_dict, or only the ones of fields"""
+        lazy_fields = [
+            key for key, value in info_dict.items()
+            if isinstance(value, LazyField) and (fields is None or key in fields)]
+        values = run_concurrently(
+            [info_dict[key].get for key in lazy_fields], cls._MAX_CONCURRENT_LAZY_FIELDS)
+        info_dict.update(zip(lazy_fields, values))
+
+    @staticmethod
+    def _resolve_format_urls(formats):
+        """Resolve the URLs of the formats that are only built on demand"""
+        for format in formats:
+            for f in [format] + list(format.get('requested_formats') or []):
+                resolve_url = f.pop('_resolve_url', None)
+                if resolve_url is not None:
+                    f['url'] = sanitize_url(resolve_url())
+
     def process_subtitles(self, video_id, normal_subtitles, automatic_captions):
         """Select the requested subtitles and their format"""
         available_subs = {}
@@ -1802,30 +2050,36 @@ class HaruhiDL(object):
             self.to_stdout(formatSeconds(info_dict['duration']))
         print_mandatory('format')
         if self.params.get('forcejson', False):
-            self.to_stdout(json.dumps(info_dict))
+            self.to_stdout(json.dumps(self._public_info(info_dict)))
 
     def process_info(self, info_dict):
         """Process a single resolved IE result."""
 
         assert info_dict.get('_type', 'video') == 'video'
 
-        max_downloads = self.params.get('max_downloads')
-        if max_downloads is not None:
-            if self._num_downloads >= int(max_downloads):
-                raise MaxDownloadsReached()
+        entry_turn = getattr(self._thread_state, 'entry_turn', None)
+        # Concurrently processed playlist entries count their downloads in
+        # playlist order
+        with entry_turn() if entry_turn is not None else self._lock:
+            max_downloads = self.params.get('max_downloads')
+            if max_downloads is not None:
+                if self._num_downloads >= int(max_downloads):
+                    raise MaxDownloadsReached()
 
-        # TODO: backward compatibility, to be removed
-        info_dict['fulltitle'] = info_dict['title']
+            # TODO: backward compatibility, to be removed
+            info_dict['fulltitle'] = info_dict['title']
 
-        if 'format' not in info_dict:
-            info_dict['format'] = info_dict['ext']
+            if 'format' not in info_dict:
+                info_dict['format'] = info_dict['ext']
 
-        reason = self._match_entry(info_dict, incomplete=False)
-        if reason is not None:
-            self.to_screen('[download] ' + reason)
-            return
+            reason = self._match_entry(info_dict, incomplete=False)
+            if reason is not None:
+                self.to_screen('[download] ' + reason)
+                return
 
-        self._num_downloads += 1
+            self._num_downloads += 1
+            if entry_turn is not None:
+                self._thread_state.num_downloads = self._num_downloads
 
         info_dict['_filename'] = filename = self.prepare_filename(info_dict)
 
@@ -1935,7 +2189,12 @@ class HaruhiDL(object):
         if not self.params.get('skip_download', False):
             try:
                 def dl(name, info):
-                    fd = get_suitable_downloader(info, self.params)(self, self.params)
+                    params = self.params
+                    if entry_turn is not None:
+                        # Progress lines of concurrent downloads would
+                        # overwrite each other
+                        params = dict(params, noprogress=True)
+                    fd = get_suitable_downloader(info, params)(self, params)
                     for ph in self._progress_hooks:
                         fd.add_progress_hook(ph)
                     if self.params.get('verbose'):
@@ -2129,7 +2388,7 @@ class HaruhiDL(object):
                 raise
             else:
                 if self.params.get('dump_single_json', False):
-                    self.to_stdout(json.dumps(res))
+                    self.to_stdout(json.dumps(self._public_info(res) if res else res))
 
         return self._download_retcode
 
@@ -2150,10 +2409,32 @@ class HaruhiDL(object):
                 raise
         return self._download_retcode
 
-    @staticmethod
-    def filter_requested_info(info_dict):
-        return dict(
+    # Internal fields of formats (see InfoExtractor), which end up in the
+    # info dict of the format chosen too
+    _PRIVATE_FORMAT_FIELDS = ('_hls_manifest', '_resolve_url')
+
+    @classmethod
+    def _public_info(cls, info_dict):
+        """Return a copy of info_dict without the internal fields of the formats"""
+        def public_format(f):
+            return dict((k, v) for k, v in f.items() if not k.startswith('_'))
+
+        info = dict(
             (k, v) for k, v in info_dict.items()
+            if k not in cls._PRIVATE_FORMAT_FIELDS)
+        for key in ('formats', 'requested_formats'):
+            if info.get(key):
+                info[key] = [public_format(f) for f in info[key]]
+        if isinstance(info.get('entries'), list):
+            info['entries'] = [
+                cls._public_info(entry) if isinstance(entry, dict) else entry
+                for entry in info['entries']]
+        return info
+
+    @classmethod
+    def filter_requested_info(cls, info_dict):
+        return dict(
+            (k, v) for k, v in cls._public_info(info_dict).items()
             if k not in ['requested_formats', 'requested_subtitles'])
 
     def post_process(self, filename, ie_info):
@@ -2190,7 +2471,7 @@ class HaruhiDL(object):
             if not url:
                 return
             # Try to find matching extractor for the URL and take its ie_key
-            for ie in self._ies:
+            for ie in self._candidate_ies(url):
                 if ie.suitable(url):
                     extractor = ie.ie_key()
                     break
@@ -2198,33 +2479,33 @@ class HaruhiDL(object):
                 return
         return extractor.lower() + ' ' + video_id
 
-    def in_download_archive(self, info_dict):
+    def _get_download_archive(self):
         fn = self.params.get('download_archive')
         if fn is None:
+            return None
+        with self._lock:
+            if self._download_archive is None or self._download_archive.filename != fn:
+                self._download_archive = DownloadArchive(fn)
+            return self._download_archive
+
+    def in_download_archive(self, info_dict):
+        archive = self._get_download_archive()
+        if archive is None:
             return False
 
         vid_id = self._make_archive_id(info_dict)
         if not vid_id:
             return False  # Incomplete video information
 
-        try:
-            with locked_file(fn, 'r', encoding='utf-8') as archive_file:
-                for line in archive_file:
-                    if line.strip() == vid_id:
-                        return True
-        except IOError as ioe:
-            if ioe.errno != errno.ENOENT:
-                raise
-        return False
+        return vid_id in archive
 
     def record_download_archive(self, info_dict):
-        fn = self.params.get('download_archive')
-        if fn is None:
+        archive = self._get_download_archive()
+        if archive is None:
             return
         vid_id = self._make_archive_id(info_dict)
         assert vid_id
-        with locked_file(fn, 'a', encoding='utf-8') as archive_file:
-            archive_file.write(vid_id + '\n')
+        archive.record(vid_id)
 
     @staticmethod
     def format_resolution(format, default='unknown'):
@@ -2447,8 +2728,12 @@ class HaruhiDL(object):
         proxy_handler = PerRequestProxyHandler(proxies)
 
         debuglevel = 1 if self.params.get('debug_printtraffic') else 0
-        https_handler = make_HTTPS_handler(self.params, debuglevel=debuglevel)
-        hdlh = HaruhiDLHandler(self.params, debuglevel=debuglevel)
+        # Keep-alive connections, shared by the HTTP and HTTPS handlers
+        self.connection_pool = HTTPConnectionPool()
+        https_handler = make_HTTPS_handler(
+            self.params, debuglevel=debuglevel, connection_pool=self.connection_pool)
+        hdlh = HaruhiDLHandler(
+            self.params, debuglevel=debuglevel, connection_pool=self.connection_pool)
         redirect_handler = HaruhiDLRedirectHandler()
         data_handler = compat_urllib_request_DataHandler()
 
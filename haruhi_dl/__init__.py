@@ -194,6 +194,21 @@ def _real_main(argv=None):
         opts.retries = parse_retries(opts.retries)
     if opts.fragment_retries is not None:
         opts.fragment_retries = parse_retries(opts.fragment_retries)
+    if opts.concurrent_fragment_downloads <= 0:
+        parser.error('concurrent fragments must be positive')
+    if opts.concurrent_playlist_entries <= 0:
+        parser.error('concurrent playlist entries must be positive')
+    if opts.break_on_existing is not None and opts.break_on_existing <= 0:
+        parser.error('break on existing count must be positive')
+    if opts.http_connections <= 0:
+        parser.error('HTTP connections must be positive')
+    if opts.cache_backend not in (None, 'sqlite', 'dir'):
+        parser.error('invalid cache backend specified')
+    if opts.http_cache_size is not None:
+        numeric_http_cache_size = FileDownloader.parse_bytes(opts.http_cache_size)
+        if not numeric_http_cache_size:
+            parser.error('invalid HTTP cache size specified')
+        opts.http_cache_size = numeric_http_cache_size
     if opts.buffersize is not None:
         numeric_buffersize = FileDownloader.parse_bytes(opts.buffersize)
         if numeric_buffersize is None:
@@ -360,9 +375,11 @@ def _real_main(argv=None):
         'fragment_retries': opts.fragment_retries,
         'skip_unavailable_fragments': opts.skip_unavailable_fragments,
         'keep_fragments': opts.keep_fragments,
+        'concurrent_fragment_downloads': opts.concurrent_fragment_downloads,
         'buffersize': opts.buffersize,
         'noresizebuffer': opts.noresizebuffer,
         'http_chunk_size': opts.http_chunk_size,
+        'http_connections': opts.http_connections,
         'continuedl': opts.continue_dl,
         'noprogress': opts.noprogress,
         'progress_with_newline': opts.progress_with_newline,
@@ -370,6 +387,7 @@ def _real_main(argv=None):
         'playlistend': opts.playlistend,
         'playlistreverse': opts.playlist_reverse,
         'playlistrandom': opts.playlist_random,
+        'concurrent_playlist_entries': opts.concurrent_playlist_entries,
         'noplaylist': opts.noplaylist,
         'logtostderr': opts.outtmpl == '-',
         'consoletitle': opts.consoletitle,
@@ -401,9 +419,13 @@ def _real_main(argv=None):
         'max_views': opts.max_views,
         'daterange': date,
         'cachedir': opts.cachedir,
+        'cache_backend': opts.cache_backend,
+        'http_cache': opts.http_cache,
+        'http_cache_size': opts.http_cache_size,
         'youtube_print_sig_code': opts.youtube_print_sig_code,
         'age_limit': opts.age_limit,
         'download_archive': download_archive_fn,
+        'break_on_existing': opts.break_on_existing,
         'cookiefile': opts.cookiefile,
         'nocheckcertificate': opts.no_check_certificate,
         'prefer_insecure': opts.prefer_insecure,
@@ -2,7 +2,11 @@ from __future__ import unicode_literals
 
 from math import ceil
 
-from .compat import compat_b64decode
+from .compat import (
+    compat_b64decode,
+    compat_struct_pack,
+    compat_struct_unpack,
+)
 from .utils import bytes_to_intlist, intlist_to_bytes
 
 BLOCK_SIZE_BYTES = 16
@@ -88,6 +92,71 @@ def aes_cbc_encrypt(data, key, iv):
     return encrypted_data
 
 
+def aes_cbc_decrypt_bytes(data, key, iv):
+    """
+    Decrypt with aes in CBC mode, working on 32-bit words with lookup tables
+
+    Much faster than aes_cbc_decrypt, so that it can be used on whole media
+    fragments when no native implementation is available.
+
+    @param {bytes} data        cipher
+    @param {bytes} key         16/24/32-Byte cipher key
+    @param {bytes} iv          16-Byte IV
+    @returns {bytes}           decrypted data
+    """
+    data_len = len(data)
+    if data_len % BLOCK_SIZE_BYTES:
+        data += b'\0' * (BLOCK_SIZE_BYTES - data_len % BLOCK_SIZE_BYTES)
+    words = compat_struct_unpack('>%dI' % (len(data) // 4), data)
+    rk = _decryption_key_words(key)
+    td0, td1, td2, td3 = TD0, TD1, TD2, TD3
+    si24, si16, si8, si = SBOX_INV_24, SBOX_INV_16, SBOX_INV_8, SBOX_INV
+    (k0, k1, k2, k3), round_keys, (l0, l1, l2, l3) = rk[0], rk[1:-1], rk[-1]
+
+    decrypted = []
+    append = decrypted.append
+    p0, p1, p2, p3 = compat_struct_unpack('>4I', iv)
+    for i in range(0, len(words), 4):
+        c0, c1, c2, c3 = words[i:i + 4]
+        s0 = c0 ^ k0
+        s1 = c1 ^ k1
+        s2 = c2 ^ k2
+        s3 = c3 ^ k3
+        for r0, r1, r2, r3 in round_keys:
+            t0 = td0[s0 >> 24] ^ td1[s3 >> 16 & 255] ^ td2[s2 >> 8 & 255] ^ td3[s1 & 255] ^ r0
+            t1 = td0[s1 >> 24] ^ td1[s0 >> 16 & 255] ^ td2[s3 >> 8 & 255] ^ td3[s2 & 255] ^ r1
+            t2 = td0[s2 >> 24] ^ td1[s1 >> 16 & 255] ^ td2[s0 >> 8 & 255] ^ td3[s3 & 255] ^ r2
+            s3 = td0[s3 >> 24] ^ td1[s2 >> 16 & 255] ^ td2[s1 >> 8 & 255] ^ td3[s0 & 255] ^ r3
+            s0, s1, s2 = t0, t1, t2
+        append((si24[s0 >> 24] | si16[s3 >> 16 & 255] | si8[s2 >> 8 & 255] | si[s1 & 255]) ^ l0 ^ p0)
+        append((si24[s1 >> 24] | si16[s0 >> 16 & 255] | si8[s3 >> 8 & 255] | si[s2 & 255]) ^ l1 ^ p1)
+        append((si24[s2 >> 24] | si16[s1 >> 16 & 255] | si8[s0 >> 8 & 255] | si[s3 & 255]) ^ l2 ^ p2)
+        append((si24[s3 >> 24] | si16[s2 >> 16 & 255] | si8[s1 >> 8 & 255] | si[s0 & 255]) ^ l3 ^ p3)
+        p0, p1, p2, p3 = c0, c1, c2, c3
+
+    return compat_struct_pack('>%dI' % len(decrypted), *decrypted)[:data_len]
+
+
+def _decryption_key_words(key):
+    """
+    Generate the key schedule of the equivalent inverse cipher, as a tuple of
+    four words per round, in the order they are used by aes_cbc_decrypt_bytes
+    """
+    expanded_key = key_expansion(bytes_to_intlist(key))
+    rounds = len(expanded_key) // BLOCK_SIZE_BYTES - 1
+    words = compat_struct_unpack('>%dI' % (len(expanded_key) // 4), intlist_to_bytes(expanded_key))
+    rk = []
+    for i in range(rounds, -1, -1):
+        round_key = words[i * 4:(i + 1) * 4]
+        if 0 < i < rounds:
+            # InvMixColumns, as the round keys are applied after it
+            round_key = tuple(
+                TD0[SBOX[w >> 24]] ^ TD1[SBOX[(w >> 16) & 255]] ^ TD2[SBOX[(w >> 8) & 255]] ^ TD3[SBOX[w & 255]]
+                for w in round_key)
+        rk.append(round_key)
+    return rk
+
+
 def key_expansion(data):
     """
     Generate key schedule
@@ -347,6 +416,26 @@ def shift_rows_inv(data):
     return data_shifted
 
 
+def _decryption_tables():
+    td0 = []
+    for x in SBOX_INV:
+        td0.append(
+            rijndael_mul(x, 0xE) << 24 | rijndael_mul(x, 0x9) << 16
+            | rijndael_mul(x, 0xD) << 8 | rijndael_mul(x, 0xB))
+    td1 = [(t >> 8) | ((t & 255) << 24) for t in td0]
+    td2 = [(t >> 8) | ((t & 255) << 24) for t in td1]
+    td3 = [(t >> 8) | ((t & 255) << 24) for t in td2]
+    return tuple(td0), tuple(td1), tuple(td2), tuple(td3)
+
+
+# Lookup tables combining InvSubBytes and InvMixColumns for each byte of a
+# column, and InvSubBytes alone for the last round
+TD0, TD1, TD2, TD3 = _decryption_tables()
+SBOX_INV_24 = tuple(x << 24 for x in SBOX_INV)
+SBOX_INV_16 = tuple(x << 16 for x in SBOX_INV)
+SBOX_INV_8 = tuple(x << 8 for x in SBOX_INV)
+
+
 def inc(data):
     data = data[:]  # copy
     for i in range(len(data) - 1, -1, -1):
@@ -358,4 +447,4 @@ def inc(data):
     return data
 
 
-__all__ = ['aes_encrypt', 'key_expansion', 'aes_ctr_decrypt', 'aes_cbc_decrypt', 'aes_decrypt_text']
+__all__ = ['aes_encrypt', 'key_expansion', 'aes_ctr_decrypt', 'aes_cbc_decrypt', 'aes_cbc_decrypt_bytes', 'aes_decrypt_text']
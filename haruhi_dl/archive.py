@@ -0,0 +1,96 @@
+from __future__ import unicode_literals
+
+import errno
+import os
+import threading
+
+from .utils import (
+    encodeFilename,
+    locked_file,
+)
+
+
+class DownloadArchive(object):
+    """In-memory index of a --download-archive file.
+
+    The file is read into a set once, and subsequent lookups only parse the
+    lines appended since the previous read (by this or any other process),
+    so checking N videos against an archive of M entries costs O(N + M)
+    instead of O(N * M). The on-disk format stays one "<extractor> <id>"
+    per line. It can be shared between threads.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, inode=None):
+        self._ids = set()
+        # End of the last complete line read
+        self._offset = 0
+        # Size of the file when it was last read, and what followed the last
+        # complete line then
+        self._size = None
+        self._tail = b''
+        self._last_line = None
+        self._inode = inode
+
+    def _index_last_line(self):
+        if self._tail and self._last_line is None:
+            try:
+                self._last_line = self._tail.decode('utf-8').strip() or None
+            except UnicodeDecodeError:
+                pass
+
+    def _refresh(self):
+        try:
+            st = os.stat(encodeFilename(self.filename))
+        except OSError as ose:
+            if ose.errno != errno.ENOENT:
+                raise
+            self._reset()
+            return
+
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # The archive has been replaced or truncated behind our back
+            self._reset(st.st_ino)
+        if st.st_size == self._size:
+            # Nothing has been appended since the previous read, so a last
+            # line without a newline is complete (e.g. in an edited archive)
+            self._index_last_line()
+            return
+
+        try:
+            with locked_file(self.filename, 'rb') as archive_file:
+                archive_file.seek(self._offset)
+                data = archive_file.read()
+        except IOError as ioe:
+            if ioe.errno != errno.ENOENT:
+                raise
+            return
+
+        first_read = self._size is None
+        # Only consume complete lines, so that an unterminated last line
+        # still being written is read again once it is finished
+        end = data.rfind(b'\n') + 1
+        self._ids.update(
+            line.strip() for line in data[:end].decode('utf-8').splitlines())
+        self._ids.discard('')
+        self._offset += end
+        self._size = self._offset + len(data) - end
+        self._tail = data[end:]
+        self._last_line = None
+        if first_read:
+            self._index_last_line()
+
+    def __contains__(self, vid_id):
+        with self._lock:
+            self._refresh()
+            return vid_id in self._ids or vid_id == self._last_line
+
+    def record(self, vid_id):
+        with self._lock:
+            with locked_file(self.filename, 'a', encoding='utf-8') as archive_file:
+                archive_file.write(vid_id + '\n')
+            self._ids.add(vid_id)
@@ -1,23 +1,208 @@
 from __future__ import unicode_literals
 
+import collections
+import email.utils
 import errno
+import functools
+import hashlib
 import io
 import json
 import os
 import re
 import shutil
+import threading
+import time
 import traceback
 
-from .compat import compat_getenv
+try:
+    import sqlite3
+except ImportError:
+    # Python may be built without it
+    sqlite3 = None
+
+from .compat import (
+    compat_basestring,
+    compat_getenv,
+    compat_http_client,
+    compat_urllib_error,
+    compat_urllib_request,
+    compat_urllib_response,
+)
 from .utils import (
+    encodeFilename,
     expand_path,
+    int_or_none,
+    sanitized_Request,
+    update_Request,
     write_json_file,
 )
 
+# Directory of the cache root holding the HTTP cache, which is not a section
+_HTTP_CACHE_DIR = 'http'
+
+
+class DirectoryCacheBackend(object):
+    """Stores every entry in a JSON file of its own, <section>/<key>.json"""
+
+    def __init__(self, root_dir):
+        self._root_dir = root_dir
+
+    def _get_cache_fn(self, section, key):
+        return os.path.join(self._root_dir, section, '%s.json' % key)
+
+    def load(self, section, key):
+        """Return the JSON data of an entry and the time it was stored, or None"""
+        cache_fn = self._get_cache_fn(section, key)
+        try:
+            with io.open(cache_fn, 'r', encoding='utf-8') as cachef:
+                return cachef.read(), os.path.getmtime(cache_fn)
+        except (OSError, IOError):
+            return None  # No cache available
+
+    def store(self, section, key, data):
+        fn = self._get_cache_fn(section, key)
+        try:
+            os.makedirs(os.path.dirname(fn))
+        except OSError as ose:
+            if ose.errno != errno.EEXIST:
+                raise
+        write_json_file(json.loads(data), fn)
+
+    def delete(self, section, key):
+        try:
+            os.remove(self._get_cache_fn(section, key))
+        except OSError:
+            pass
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend(object):
+    """
+    Stores all the entries in a single SQLite database, cache.sqlite3.
+
+    The least recently used entries are evicted once there are more than
+    MAX_ENTRIES of them. The entries of the directory backend found in the
+    cache directory are moved into the database when it is created.
+    """
+
+    MAX_ENTRIES = 4096
+    FILENAME = 'cache.sqlite3'
+    # Stored as the user_version of the database; 0 means that the entries
+    # of the directory backend have not been moved in yet
+    SCHEMA_VERSION = 1
+
+    def __init__(self, root_dir):
+        self._root_dir = root_dir
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(root_dir)
+        except OSError as ose:
+            if ose.errno != errno.EEXIST:
+                raise
+        # Shared with the threads of concurrent playlist downloads, which
+        # the lock serializes
+        self._db = sqlite3.connect(
+            encodeFilename(os.path.join(root_dir, self.FILENAME)),
+            timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'section TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, '
+                'stored REAL NOT NULL, accessed REAL NOT NULL, '
+                'PRIMARY KEY (section, key))')
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version < self.SCHEMA_VERSION:
+            self._migrate()
+            with self._lock, self._db:
+                self._db.execute('PRAGMA user_version = %d' % self.SCHEMA_VERSION)
+
+    def _migrate(self):
+        for section in os.listdir(self._root_dir):
+            section_dir = os.path.join(self._root_dir, section)
+            if section == _HTTP_CACHE_DIR or not os.path.isdir(section_dir):
+                continue
+            migrated = []
+            for fn in os.listdir(section_dir):
+                key, ext = os.path.splitext(fn)
+                if ext != '.json':
+                    continue
+                cache_fn = os.path.join(section_dir, fn)
+                try:
+                    with io.open(cache_fn, 'r', encoding='utf-8') as cachef:
+                        data = cachef.read()
+                    json.loads(data)
+                    stored = os.path.getmtime(cache_fn)
+                except (OSError, IOError, ValueError):
+                    continue
+                with self._lock, self._db:
+                    # Do not overwrite newer entries
+                    self._db.execute(
+                        'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)',
+                        (section, key, data, stored, stored))
+                migrated.append(cache_fn)
+            for cache_fn in migrated:
+                os.remove(cache_fn)
+            if not os.listdir(section_dir):
+                os.rmdir(section_dir)
+
+    def load(self, section, key):
+        with self._lock, self._db:
+            row = self._db.execute(
+                'SELECT data, stored FROM cache WHERE section = ? AND key = ?',
+                (section, key)).fetchone()
+            if row is not None:
+                self._db.execute(
+                    'UPDATE cache SET accessed = ? WHERE section = ? AND key = ?',
+                    (time.time(), section, key))
+        return row
+
+    def store(self, section, key, data):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                (section, key, data, now, now))
+            self._db.execute(
+                'DELETE FROM cache WHERE rowid IN ('
+                'SELECT rowid FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.MAX_ENTRIES, ))
+
+    def delete(self, section, key):
+        with self._lock, self._db:
+            self._db.execute(
+                'DELETE FROM cache WHERE section = ? AND key = ?', (section, key))
+
+    def close(self):
+        self._db.close()
+
 
 class Cache(object):
+    """
+    Persistent storage of JSON data, by section and key.
+
+    The entries are stored by a backend, selected by the cache_backend
+    parameter: 'sqlite' (the default, if Python has sqlite3) or 'dir'. The
+    most recently used entries are also kept in memory.
+    """
+
+    # Time after which the entries of a section expire, in seconds; the
+    # entries of other sections do not expire
+    _SECTION_TTLS = {
+        'brightcove': 30 * 24 * 3600,
+        'not_selfhosted': 24 * 3600,
+        'soundcloud': 7 * 24 * 3600,
+    }
+    # Entries kept in memory
+    _MEMORY_SIZE = 128
+
     def __init__(self, hdl):
         self._hdl = hdl
+        self._lock = threading.RLock()
+        self._memory = collections.OrderedDict()
+        self._backend = None
+        self._backend_id = None
 
     def _get_root_dir(self):
         res = self._hdl.params.get('cachedir')
@@ -26,57 +211,99 @@ class Cache(object):
             res = os.path.join(cache_root, 'haruhi-dl')
         return expand_path(res)
 
-    def _get_cache_fn(self, section, key, dtype):
+    def _get_backend(self):
+        backend_name = self._hdl.params.get('cache_backend')
+        if backend_name is None:
+            backend_name = 'sqlite' if sqlite3 is not None else 'dir'
+        backend_id = (backend_name, self._get_root_dir())
+        if self._backend_id != backend_id:
+            self._close_backend()
+            if backend_name == 'sqlite':
+                if sqlite3 is None:
+                    raise Exception('The sqlite cache backend needs the sqlite3 module')
+                self._backend = SQLiteCacheBackend(backend_id[1])
+            elif backend_name == 'dir':
+                self._backend = DirectoryCacheBackend(backend_id[1])
+            else:
+                raise Exception('Unknown cache backend %r' % backend_name)
+            self._backend_id = backend_id
+        return self._backend
+
+    def _close_backend(self):
+        self._memory.clear()
+        if self._backend is not None:
+            self._backend.close()
+        self._backend = self._backend_id = None
+
+    @staticmethod
+    def _check_key(section, key, dtype):
+        assert dtype in ('json',)
         assert re.match(r'^[a-zA-Z0-9_.-]+$', section), \
             'invalid section %r' % section
         assert re.match(r'^[a-zA-Z0-9_.-]+$', key), 'invalid key %r' % key
-        return os.path.join(
-            self._get_root_dir(), section, '%s.%s' % (key, dtype))
 
     @property
     def enabled(self):
         return self._hdl.params.get('cachedir') is not False
 
     def store(self, section, key, data, dtype='json'):
-        assert dtype in ('json',)
+        self._check_key(section, key, dtype)
 
         if not self.enabled:
             return
 
-        fn = self._get_cache_fn(section, key, dtype)
-        try:
+        data = json.dumps(data)
+        with self._lock:
             try:
-                os.makedirs(os.path.dirname(fn))
-            except OSError as ose:
-                if ose.errno != errno.EEXIST:
-                    raise
-            write_json_file(data, fn)
-        except Exception:
-            tb = traceback.format_exc()
-            self._hdl.report_warning(
-                'Writing cache to %r failed: %s' % (fn, tb))
+                self._get_backend().store(section, key, data)
+            except Exception:
+                tb = traceback.format_exc()
+                self._hdl.report_warning(
+                    'Writing cache entry %s/%s failed: %s' % (section, key, tb))
+                return
+            self._remember((section, key), (data, time.time()))
+
+    def _remember(self, mem_key, entry):
+        self._memory[mem_key] = entry
+        self._memory.move_to_end(mem_key)
+        while len(self._memory) > self._MEMORY_SIZE:
+            self._memory.popitem(last=False)
 
     def load(self, section, key, dtype='json', default=None):
-        assert dtype in ('json',)
+        self._check_key(section, key, dtype)
 
         if not self.enabled:
             return default
 
-        cache_fn = self._get_cache_fn(section, key, dtype)
-        try:
+        mem_key = (section, key)
+        with self._lock:
             try:
-                with io.open(cache_fn, 'r', encoding='utf-8') as cachef:
-                    return json.load(cachef)
-            except ValueError:
-                try:
-                    file_size = os.path.getsize(cache_fn)
-                except (OSError, IOError) as oe:
-                    file_size = str(oe)
+                backend = self._get_backend()
+                entry = self._memory.get(mem_key)
+                if entry is None:
+                    entry = backend.load(section, key)
+                    if entry is None:
+                        return default
+
+                data, stored = entry
+                ttl = self._SECTION_TTLS.get(section)
+                if ttl is not None and stored + ttl < time.time():
+                    self._memory.pop(mem_key, None)
+                    backend.delete(section, key)
+                    return default
+            except Exception:
+                tb = traceback.format_exc()
                 self._hdl.report_warning(
-                    'Cache retrieval from %s failed (%s)' % (cache_fn, file_size))
-        except IOError:
-            pass  # No cache available
+                    'Cache retrieval of %s/%s failed: %s' % (section, key, tb))
+                return default
+            self._remember(mem_key, entry)
 
+        try:
+            # Decode every time, so that callers may modify what they get
+            return json.loads(data)
+        except ValueError:
+            self._hdl.report_warning(
+                'Cache retrieval of %s/%s failed (%d bytes)' % (section, key, len(data)))
         return default
 
     def remove(self):
@@ -88,9 +315,261 @@ class Cache(object):
         if not any((term in cachedir) for term in ('cache', 'tmp')):
             raise Exception('Not removing directory %s - this does not look like a cache dir' % cachedir)
 
+        with self._lock:
+            self._close_backend()
+
         self._hdl.to_screen(
             'Removing cache dir %s .' % cachedir, skip_eol=True)
         if os.path.exists(cachedir):
             self._hdl.to_screen('.', skip_eol=True)
             shutil.rmtree(cachedir)
         self._hdl.to_screen('.')
+
+
+def _parse_cache_control(value):
+    directives = {}
+    for directive in (value or '').split(','):
+        name, _, arg = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+
+def _parse_http_date(value):
+    parsed = email.utils.parsedate_tz(value) if value else None
+    return email.utils.mktime_tz(parsed) if parsed else None
+
+
+class _CachingResponse(object):
+    """
+    Wraps a response, handing its body over to a callback once it has been
+    read to the end with read(), unless it is larger than max_size
+    """
+
+    def __init__(self, response, max_size, callback):
+        self._response = response
+        self._max_size = max_size
+        self._callback = callback
+        self._chunks = []
+        self._size = 0
+
+    def read(self, amt=None):
+        whole = amt is None or amt < 0
+        data = self._response.read() if whole else self._response.read(amt)
+        if self._chunks is not None:
+            self._size += len(data)
+            if self._size > self._max_size:
+                self._chunks = None
+                return data
+            self._chunks.append(data)
+            if whole or not data:
+                body = b''.join(self._chunks)
+                self._chunks = None
+                self._callback(body)
+        return data
+
+    def __getattr__(self, name):
+        if name in ('read1', 'readinto', 'readline', 'readlines'):
+            # Reading otherwise than with read() leaves holes in the body
+            self._chunks = None
+        return getattr(self._response, name)
+
+
+class HTTPCache(object):
+    """
+    On-disk cache of the responses to HTTP GET requests, in the http
+    directory of the cache.
+
+    It is used if the http_cache parameter is set. Responses are reused
+    while fresh according to their Cache-Control or Expires headers, then
+    revalidated with If-None-Match or If-Modified-Since if they have an
+    ETag or a Last-Modified header. Requests with a Cache-Control header of
+    no-cache or no-store bypass the cache. The least recently used
+    responses are evicted once they take more than http_cache_size bytes.
+    """
+
+    DEFAULT_SIZE = 100 * 1024 * 1024
+
+    def __init__(self, hdl):
+        self._hdl = hdl
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self._hdl.params.get('http_cache')) and self._hdl.cache.enabled
+
+    def _get_root_dir(self):
+        return os.path.join(self._hdl.cache._get_root_dir(), _HTTP_CACHE_DIR)
+
+    def _get_max_size(self):
+        return self._hdl.params.get('http_cache_size') or self.DEFAULT_SIZE
+
+    def _report_debug(self, message):
+        if self._hdl.params.get('verbose'):
+            self._hdl.to_screen('[debug] HTTP cache: %s' % message)
+
+    def _request_key(self, req):
+        # Responses may depend on any header sent, cookies included
+        cookie_req = compat_urllib_request.Request(req.get_full_url())
+        self._hdl.cookiejar.add_cookie_header(cookie_req)
+        key = json.dumps([
+            req.get_full_url(),
+            sorted((name.lower(), value) for name, value in req.header_items()),
+            cookie_req.get_header('Cookie')])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _fresh_until(headers, now):
+        """Return when a response stops being fresh, or None if it must not be stored"""
+        cache_control = _parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in cache_control or (headers.get('Vary') or '').strip() == '*':
+            return None
+        if 'no-cache' in cache_control:
+            lifetime = 0
+        elif 'max-age' in cache_control:
+            lifetime = int_or_none(cache_control['max-age']) or 0
+        else:
+            expires = _parse_http_date(headers.get('Expires'))
+            date = _parse_http_date(headers.get('Date'))
+            lifetime = expires - (date or now) if expires else 0
+        return now + max(lifetime - (int_or_none(headers.get('Age')) or 0), 0)
+
+    def _get_fns(self, key):
+        root_dir = self._get_root_dir()
+        return os.path.join(root_dir, key + '.json'), os.path.join(root_dir, key + '.body')
+
+    def _load(self, key):
+        meta_fn, body_fn = self._get_fns(key)
+        try:
+            with io.open(meta_fn, 'r', encoding='utf-8') as metaf:
+                meta = json.load(metaf)
+            with open(body_fn, 'rb') as bodyf:
+                body = bodyf.read()
+            # Mark as recently used
+            os.utime(meta_fn, None)
+        except (OSError, IOError, ValueError):
+            return None
+        return meta, body
+
+    def _store(self, key, meta, body=None):
+        meta_fn, body_fn = self._get_fns(key)
+        with self._lock:
+            try:
+                try:
+                    os.makedirs(os.path.dirname(meta_fn))
+                except OSError as ose:
+                    if ose.errno != errno.EEXIST:
+                        raise
+                if body is not None:
+                    with open(body_fn + '.tmp', 'wb') as bodyf:
+                        bodyf.write(body)
+                    os.replace(body_fn + '.tmp', body_fn)
+                write_json_file(meta, meta_fn)
+                self._evict()
+            except Exception:
+                tb = traceback.format_exc()
+                self._hdl.report_warning(
+                    'Writing HTTP cache entry for %s failed: %s' % (meta['url'], tb))
+
+    def _evict(self):
+        root_dir = self._get_root_dir()
+        entries = []
+        total_size = 0
+        for fn in os.listdir(root_dir):
+            key, ext = os.path.splitext(fn)
+            meta_fn, body_fn = self._get_fns(key)
+            if ext == '.body' and not os.path.exists(meta_fn):
+                # Left over by an entry whose metadata is gone
+                try:
+                    os.remove(body_fn)
+                except OSError:
+                    pass
+                continue
+            if ext != '.json':
+                continue
+            try:
+                size = os.path.getsize(meta_fn) + os.path.getsize(body_fn)
+                entries.append((os.path.getmtime(meta_fn), size, meta_fn, body_fn))
+            except OSError:
+                continue
+            total_size += size
+        entries.sort()
+        max_size = self._get_max_size()
+        for _, size, meta_fn, body_fn in entries:
+            if total_size <= max_size:
+                break
+            for fn in (meta_fn, body_fn):
+                try:
+                    os.remove(fn)
+                except OSError:
+                    pass
+            total_size -= size
+
+    @staticmethod
+    def _response(meta, body):
+        headers = compat_http_client.HTTPMessage()
+        for name, value in meta['headers']:
+            headers[name] = value
+        response = compat_urllib_response.addinfourl(io.BytesIO(body), headers, meta['url'], 200)
+        response.msg = 'OK'
+        return response
+
+    def urlopen(self, req):
+        """Like HaruhiDL.urlopen, but answering from the cache when possible"""
+        if isinstance(req, compat_basestring):
+            req = sanitized_Request(req)
+        if not self.enabled or req.get_method() != 'GET' or req.data is not None:
+            return self._hdl.urlopen(req)
+        request_cache_control = _parse_cache_control(req.get_header('Cache-control'))
+        if 'no-cache' in request_cache_control or 'no-store' in request_cache_control:
+            return self._hdl.urlopen(req)
+
+        key = self._request_key(req)
+        entry = self._load(key)
+        now = time.time()
+        if entry:
+            meta, body = entry
+            if meta['fresh_until'] > now:
+                self._report_debug('using the stored response to %s' % req.get_full_url())
+                return self._response(meta, body)
+            validators = {}
+            for name, value in meta['headers']:
+                if name.lower() == 'etag':
+                    validators['If-None-Match'] = value
+                elif name.lower() == 'last-modified':
+                    validators['If-Modified-Since'] = value
+            if not validators:
+                entry = None
+            else:
+                req = update_Request(req, headers=validators)
+
+        try:
+            response = self._hdl.urlopen(req)
+        except compat_urllib_error.HTTPError as err:
+            if err.code != 304 or not entry:
+                raise
+            self._report_debug('the stored response to %s is still valid' % req.get_full_url())
+            # Headers of a 304 response update the stored ones
+            updated = set(name.lower() for name in err.headers.keys())
+            meta['headers'] = [
+                [name, value] for name, value in meta['headers'] if name.lower() not in updated
+            ] + [[name, value] for name, value in err.headers.items()]
+            fresh_until = self._fresh_until(err.headers, now)
+            meta['fresh_until'] = fresh_until or now
+            self._store(key, meta)
+            return self._response(meta, body)
+
+        if response.getcode() != 200:
+            return response
+        fresh_until = self._fresh_until(response.headers, now)
+        if fresh_until is None or (
+                fresh_until <= now and 'ETag' not in response.headers
+                and 'Last-Modified' not in response.headers):
+            return response
+        meta = {
+            'url': response.geturl(),
+            'headers': [[name, value] for name, value in response.headers.items()],
+            'fresh_until': fresh_until,
+        }
+        return _CachingResponse(
+            response, self._get_max_size() // 4, functools.partial(self._store, key, meta))
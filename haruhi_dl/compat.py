@@ -145,6 +145,13 @@ def compat_ctypes_WINFUNCTYPE(*args, **kwargs):
     return ctypes.WINFUNCTYPE(*args, **kwargs)
 
 
+try:
+    # sre_parse is deprecated since Python 3.11
+    import re._parser as compat_sre_parse
+except ImportError:
+    import sre_parse as compat_sre_parse
+
+
 __all__ = [
     'compat_HTMLParseError',
     'compat_HTMLParser',
@@ -183,6 +190,7 @@ __all__ = [
     'compat_shlex_quote',
     'compat_shlex_split',
     'compat_socket_create_connection',
+    'compat_sre_parse',
     'compat_str',
     'compat_struct_pack',
     'compat_struct_unpack',
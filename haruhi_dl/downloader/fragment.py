@@ -1,16 +1,28 @@
 from __future__ import division, unicode_literals
 
+import collections
+import concurrent.futures
 import os
+import socket
+import threading
 import time
 import json
 
 from .common import FileDownloader
 from .http import HttpFD
+from ..compat import (
+    compat_http_client,
+    compat_urllib_error,
+)
 from ..utils import (
+    ContentTooShortError,
+    DownloadError,
     error_to_compat_str,
     encodeFilename,
+    int_or_none,
     sanitize_open,
     sanitized_Request,
+    timeconvert,
 )
 
 
@@ -30,14 +42,18 @@ class FragmentFD(FileDownloader):
     skip_unavailable_fragments:
                         Skip unavailable fragments (DASH and hlsnative only)
     keep_fragments:     Keep downloaded fragments on disk after downloading is
-                        finished
+                        finished (otherwise fragments are never written to
+                        disk on their own)
+    concurrent_fragment_downloads:
+                        Number of fragments to download at once (DASH and
+                        hlsnative only, default is 1)
 
     For each incomplete fragment download haruhi-dl keeps on disk a special
     bookkeeping file with download state and metadata (in future such files will
     be used for any incomplete download handled by haruhi-dl). This file is
     used to properly handle resuming, check download file consistency and detect
-    potential errors. The file has a .ytdl extension and represents a standard
-    JSON file of the following format:
+    potential errors. The file has a .ytdl extension. Its first line is a JSON
+    object of the following format:
 
     extractor:
         Dictionary of extractor related data. TBD.
@@ -49,6 +65,19 @@ class FragmentFD(FileDownloader):
                 index:  0-based index of current fragment among all fragments
             fragment_count:
                 Total count of fragments
+            journal:
+                Version of the journal following this line, currently 1.
+                Files written by older versions have neither this key nor
+                the journal.
+
+    It is followed by an append-only journal with one JSON object per line,
+    written after each fragment is appended to the incomplete file:
+
+    index:  0-based index of the next fragment to download
+    end:    Size of the incomplete file once the fragment has been written
+
+    On resume, the last journal entry that fits in the incomplete file tells
+    the fragment to continue from and where to truncate the file.
 
     This feature is experimental and file format may change in future.
     """
@@ -77,51 +106,313 @@ class FragmentFD(FileDownloader):
         assert 'hdl_corrupt' not in ctx
         stream, _ = sanitize_open(self.hdl_filename(ctx['filename']), 'r')
         try:
-            ctx['fragment_index'] = json.loads(stream.read())['downloader']['current_fragment']['index']
+            lines = stream.read().splitlines()
+            downloader = json.loads(lines[0])['downloader']
+            ctx['fragment_index'] = downloader['current_fragment']['index']
+            if not downloader.get('journal'):
+                # Written by an older version
+                ctx['hdl_journal'] = None
+                return
+            journal = []
+            for line in lines[1:]:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last record may have been cut by an interruption
+                    break
+                journal.append((record['index'], record['end']))
+            ctx['hdl_journal'] = journal
         except Exception:
             ctx['hdl_corrupt'] = True
         finally:
             stream.close()
 
     def _write_hdl_file(self, ctx):
+        if ctx.get('hdl_stream'):
+            ctx['hdl_stream'].close()
         frag_index_stream, _ = sanitize_open(self.hdl_filename(ctx['filename']), 'w')
         downloader = {
             'current_fragment': {
                 'index': ctx['fragment_index'],
             },
+            'journal': 1,
         }
         if ctx.get('fragment_count') is not None:
             downloader['fragment_count'] = ctx['fragment_count']
-        frag_index_stream.write(json.dumps({'downloader': downloader}))
-        frag_index_stream.close()
+        frag_index_stream.write(json.dumps({'downloader': downloader}) + '\n')
+        frag_index_stream.flush()
+        ctx['hdl_stream'] = frag_index_stream
+
+    def _journal_fragment(self, ctx, end):
+        ctx['hdl_stream'].write(json.dumps({
+            'index': ctx['fragment_index'],
+            'end': end,
+        }) + '\n')
+        ctx['hdl_stream'].flush()
+
+    def _check_hdl_journal(self, ctx, resume_len):
+        """
+        Find the resume point from the .ytdl journal.
+
+        Returns the length the incomplete file has to be truncated to, data
+        after it belongs to a fragment that has not been completely written.
+        """
+        journal = ctx.pop('hdl_journal', None)
+        if journal is None:
+            # The file comes from an older version, so only the fragment
+            # index is known
+            if ctx['fragment_index'] > 0 and resume_len == 0:
+                return None
+            return resume_len
+        if not journal:
+            # No fragment has been completely written
+            ctx['fragment_index'] = 0
+            return 0
+        for frag_index, end in reversed(journal):
+            if end <= resume_len:
+                ctx['fragment_index'] = frag_index
+                return end
+        return None
 
     def _download_fragment(self, ctx, frag_url, info_dict, headers=None):
         fragment_filename = '%s-Frag%d' % (ctx['tmpfilename'], ctx['fragment_index'])
+        headers = headers or info_dict.get('http_headers')
+        if not self.params.get('keep_fragments', False):
+            frag_content = self._fetch_fragment(ctx, fragment_filename, frag_url, headers)
+            if frag_content is None:
+                return False, None
+            return True, frag_content
+
         fragment_info_dict = {
             'url': frag_url,
-            'http_headers': headers or info_dict.get('http_headers'),
+            'http_headers': headers,
         }
         success = ctx['dl'].download(fragment_filename, fragment_info_dict)
         if not success:
             return False, None
         if fragment_info_dict.get('filetime'):
             ctx['fragment_filetime'] = fragment_info_dict.get('filetime')
-        down, frag_sanitized = sanitize_open(fragment_filename, 'rb')
-        ctx['fragment_filename_sanitized'] = frag_sanitized
+        down, _ = sanitize_open(fragment_filename, 'rb')
         frag_content = down.read()
         down.close()
         return True, frag_content
 
+    def _fetch_fragment(self, ctx, fragment_filename, frag_url, headers):
+        """
+        Download a fragment straight into memory, without a temporary file.
+
+        Connection errors are retried according to the retries option, like
+        in HttpFD. Returns the fragment content or None on failure.
+        """
+        # Do not include the Accept-Encoding header
+        request_headers = {'Youtubedl-no-compression': 'True'}
+        if headers:
+            request_headers.update(headers)
+        retries = self.params.get('retries', 0)
+        count = 0
+        while count <= retries:
+            try:
+                return self._read_fragment(
+                    ctx, fragment_filename,
+                    sanitized_Request(frag_url, None, request_headers))
+            except compat_urllib_error.HTTPError as err:
+                if err.code < 500 or err.code >= 600:
+                    raise
+                source_error = err
+            except compat_urllib_error.URLError as err:
+                if not isinstance(getattr(err, 'reason', None), socket.timeout):
+                    raise
+                source_error = err
+            except (socket.error, compat_http_client.IncompleteRead, ContentTooShortError) as err:
+                source_error = err
+            count += 1
+            if count <= retries:
+                self.report_retry(source_error, count, retries)
+        self.report_error('giving up after %s retries' % retries)
+        return None
+
+    def _read_fragment(self, ctx, fragment_filename, request):
+        start = time.time()
+        urlh = self.hdl.urlopen(request)
+        data_len = int_or_none(urlh.headers.get('Content-Length'))
+        # Only read the beginning of the fragment during the test
+        read_len = self._TEST_FILE_SIZE if self.params.get('test', False) else None
+        if data_len is not None and (read_len is None or data_len < read_len):
+            read_len = data_len
+
+        chunks = []
+        byte_counter = 0
+        block_size = self.params.get('buffersize', 1024)
+        now = None
+        before = start
+        try:
+            while read_len is None or byte_counter < read_len:
+                data_block = urlh.read(
+                    block_size if read_len is None else min(block_size, read_len - byte_counter))
+                if not data_block:
+                    break
+                chunks.append(data_block)
+                byte_counter += len(data_block)
+
+                self.slow_down(start, now, byte_counter)
+                now = time.time()
+                if not self.params.get('noresizebuffer', False):
+                    block_size = self.best_block_size(now - before, len(data_block))
+                before = now
+
+                ctx['dl']._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': byte_counter,
+                    'total_bytes': data_len,
+                    'filename': fragment_filename,
+                    'speed': self.calc_speed(start, now, byte_counter),
+                    'elapsed': now - start,
+                })
+        finally:
+            urlh.close()
+
+        if data_len is not None and byte_counter < read_len:
+            raise ContentTooShortError(byte_counter, data_len)
+
+        last_modified = urlh.headers.get('Last-Modified')
+        if last_modified and self.params.get('updatetime', True):
+            filetime = timeconvert(last_modified)
+            if filetime:
+                ctx['fragment_filetime'] = filetime
+
+        ctx['dl']._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': byte_counter,
+            'total_bytes': byte_counter,
+            'filename': fragment_filename,
+            'elapsed': time.time() - start,
+        })
+        return b''.join(chunks)
+
     def _append_fragment(self, ctx, frag_content):
+        ctx['dest_stream'].write(frag_content)
+        ctx['dest_stream'].flush()
+        if self.__do_hdl_file(ctx):
+            self._journal_fragment(ctx, ctx['dest_stream'].tell())
+
+    def _download_and_append_fragments(self, ctx, fragments, info_dict, decrypt_fragment=None):
+        """
+        Download the given fragments and append them to the destination in order.
+
+        fragments is a list of dicts with the following keys:
+        frag_index: 1-based index of the fragment among all fragments
+        url:        URL of the fragment
+        headers:    (optional) HTTP headers to use instead of the default ones
+        fatal:      (optional) whether the download should be aborted when this
+                    fragment is unavailable, defaults to the opposite of
+                    skip_unavailable_fragments
+
+        decrypt_fragment, if given, is called with the fragment dict and its
+        content and must return the data to be written.
+
+        Fragments already downloaded according to the .ytdl file are skipped.
+        Returns False if the download has been aborted.
+        """
+        fragment_retries = self.params.get('fragment_retries', 0)
+        skip_unavailable_fragments = self.params.get('skip_unavailable_fragments', True)
+        concurrency = self.params.get('concurrent_fragment_downloads') or 1
+
+        fragments = [f for f in fragments if f['frag_index'] > ctx['fragment_index']]
+
+        def download_fragment(fragment, frag_ctx):
+            """Returns the fragment content, None if it has been skipped or False on failure"""
+            frag_index = fragment['frag_index']
+            fatal = fragment.get('fatal', not skip_unavailable_fragments)
+            count = 0
+            while count <= fragment_retries:
+                try:
+                    success, frag_content = self._download_fragment(
+                        frag_ctx, fragment['url'], info_dict, fragment.get('headers'))
+                    if not success:
+                        return False
+                    return frag_content
+                except compat_urllib_error.HTTPError as err:
+                    # Unavailable (possibly temporary) fragments may be served.
+                    # First we try to retry then either skip or abort.
+                    # See https://github.com/ytdl-org/youtube-dl/issues/10165,
+                    # https://github.com/ytdl-org/youtube-dl/issues/10448).
+                    count += 1
+                    if count <= fragment_retries:
+                        self.report_retry_fragment(err, frag_index, count, fragment_retries)
+                except DownloadError:
+                    # Don't retry fragment if error occurred during HTTP downloading
+                    # itself since it has own retry settings
+                    if fatal:
+                        raise
+                    break
+            if fatal:
+                self.report_error('giving up after %s fragment retries' % fragment_retries)
+                return False
+            self.report_skip_fragment(frag_index)
+            return None
+
+        def append_fragment(fragment, frag_ctx, frag_content):
+            if frag_content is None:
+                return
+            if decrypt_fragment:
+                frag_content = decrypt_fragment(fragment, frag_content)
+            if 'fragment_filetime' in frag_ctx:
+                ctx['fragment_filetime'] = frag_ctx['fragment_filetime']
+            ctx['fragment_index'] = fragment['frag_index']
+            self._append_fragment(ctx, frag_content)
+
+        def fragment_ctx(fragment):
+            # Fragment files are named after the 0-based fragment index
+            return dict(ctx, fragment_index=fragment['frag_index'] - 1)
+
+        def download_and_append():
+            if concurrency == 1 or len(fragments) < 2:
+                for fragment in fragments:
+                    frag_ctx = fragment_ctx(fragment)
+                    frag_content = download_fragment(fragment, frag_ctx)
+                    if frag_content is False:
+                        return False
+                    append_fragment(fragment, frag_ctx, frag_content)
+                return True
+
+            ctx['concurrent'] = True
+            # Keep at most two fragments per worker in flight, so that a slow
+            # fragment does not stall the pool while bounding memory usage
+            window = concurrency * 2
+            pending = collections.deque()
+            fragments_iter = iter(fragments)
+            with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+                def submit_next():
+                    for fragment in fragments_iter:
+                        frag_ctx = fragment_ctx(fragment)
+                        pending.append((fragment, frag_ctx, pool.submit(download_fragment, fragment, frag_ctx)))
+                        break
+
+                try:
+                    for _ in range(window):
+                        submit_next()
+                    while pending:
+                        fragment, frag_ctx, future = pending.popleft()
+                        frag_content = future.result()
+                        if frag_content is False:
+                            return False
+                        append_fragment(fragment, frag_ctx, frag_content)
+                        submit_next()
+                finally:
+                    for _, _, future in pending:
+                        future.cancel()
+            return True
+
+        completed = False
         try:
-            ctx['dest_stream'].write(frag_content)
-            ctx['dest_stream'].flush()
+            completed = download_and_append()
         finally:
-            if self.__do_hdl_file(ctx):
-                self._write_hdl_file(ctx)
-            if not self.params.get('keep_fragments', False):
-                os.remove(encodeFilename(ctx['fragment_filename_sanitized']))
-            del ctx['fragment_filename_sanitized']
+            if not completed and ctx.get('hdl_stream'):
+                # The download is aborted, the journal is left as it is for
+                # resuming it later
+                ctx['hdl_stream'].close()
+                ctx['hdl_stream'] = None
+        return completed
 
     def _prepare_frag_download(self, ctx):
         if 'live' not in ctx:
@@ -167,20 +458,31 @@ class FragmentFD(FileDownloader):
             if os.path.isfile(encodeFilename(self.hdl_filename(ctx['filename']))):
                 self._read_hdl_file(ctx)
                 is_corrupt = ctx.get('hdl_corrupt') is True
-                is_inconsistent = ctx['fragment_index'] > 0 and resume_len == 0
-                if is_corrupt or is_inconsistent:
+                valid_len = None if is_corrupt else self._check_hdl_journal(ctx, resume_len)
+                if valid_len is None:
                     message = (
                         '.ytdl file is corrupt' if is_corrupt else
                         'Inconsistent state of incomplete fragment download')
                     self.report_warning(
                         '%s. Restarting from the beginning...' % message)
                     ctx['fragment_index'] = resume_len = 0
+                    open_mode = 'wb'
                     if 'hdl_corrupt' in ctx:
                         del ctx['hdl_corrupt']
-                    self._write_hdl_file(ctx)
+                elif valid_len < resume_len:
+                    # Drop the partially written fragment
+                    with open(encodeFilename(tmpfilename), 'r+b') as f:
+                        f.truncate(valid_len)
+                    resume_len = valid_len
             else:
-                self._write_hdl_file(ctx)
-                assert ctx['fragment_index'] == 0
+                # Without a .ytdl file there is no telling what the
+                # incomplete file contains
+                open_mode = 'wb'
+                resume_len = 0
+            # Start a fresh journal from the resume point
+            self._write_hdl_file(ctx)
+            if resume_len:
+                self._journal_fragment(ctx, resume_len)
 
         dest_stream, tmpfilename = sanitize_open(tmpfilename, open_mode)
 
@@ -209,41 +511,51 @@ class FragmentFD(FileDownloader):
         start = time.time()
         ctx.update({
             'started': start,
-            # Amount of fragment's bytes downloaded by the time of the previous
-            # frag progress hook invocation
-            'prev_frag_downloaded_bytes': 0,
+            # Amount of each fragment's bytes downloaded by the time of the
+            # previous frag progress hook invocation, keyed by fragment file
+            'prev_frag_downloaded_bytes': {},
         })
+        # Fragments may be downloaded by several threads at once
+        progress_lock = threading.Lock()
 
         def frag_progress_hook(s):
             if s['status'] not in ('downloading', 'finished'):
                 return
 
-            time_now = time.time()
-            state['elapsed'] = time_now - start
-            frag_total_bytes = s.get('total_bytes') or 0
-            if not ctx['live']:
-                estimated_size = (
-                    (ctx['complete_frags_downloaded_bytes'] + frag_total_bytes)
-                    / (state['fragment_index'] + 1) * total_frags)
-                state['total_bytes_estimate'] = estimated_size
-
-            if s['status'] == 'finished':
-                state['fragment_index'] += 1
-                ctx['fragment_index'] = state['fragment_index']
-                state['downloaded_bytes'] += frag_total_bytes - ctx['prev_frag_downloaded_bytes']
-                ctx['complete_frags_downloaded_bytes'] = state['downloaded_bytes']
-                ctx['prev_frag_downloaded_bytes'] = 0
-            else:
-                frag_downloaded_bytes = s['downloaded_bytes']
-                state['downloaded_bytes'] += frag_downloaded_bytes - ctx['prev_frag_downloaded_bytes']
+            with progress_lock:
+                time_now = time.time()
+                state['elapsed'] = time_now - start
+                frag_total_bytes = s.get('total_bytes') or 0
+                prev_frag_downloaded_bytes = ctx['prev_frag_downloaded_bytes']
                 if not ctx['live']:
-                    state['eta'] = self.calc_eta(
-                        start, time_now, estimated_size - resume_len,
-                        state['downloaded_bytes'] - resume_len)
-                state['speed'] = s.get('speed') or ctx.get('speed')
-                ctx['speed'] = state['speed']
-                ctx['prev_frag_downloaded_bytes'] = frag_downloaded_bytes
-            self._hook_progress(state)
+                    estimated_size = (
+                        (ctx['complete_frags_downloaded_bytes'] + frag_total_bytes)
+                        / (state['fragment_index'] + 1) * total_frags)
+                    state['total_bytes_estimate'] = estimated_size
+
+                if s['status'] == 'finished':
+                    state['fragment_index'] += 1
+                    if not ctx.get('concurrent'):
+                        ctx['fragment_index'] = state['fragment_index']
+                    state['downloaded_bytes'] += frag_total_bytes - prev_frag_downloaded_bytes.pop(s['filename'], 0)
+                    ctx['complete_frags_downloaded_bytes'] += frag_total_bytes
+                else:
+                    frag_downloaded_bytes = s['downloaded_bytes']
+                    state['downloaded_bytes'] += frag_downloaded_bytes - prev_frag_downloaded_bytes.get(s['filename'], 0)
+                    if not ctx['live']:
+                        state['eta'] = self.calc_eta(
+                            start, time_now, estimated_size - resume_len,
+                            state['downloaded_bytes'] - resume_len)
+                    if ctx.get('concurrent'):
+                        # Per-fragment speeds are meaningless when several
+                        # fragments are downloaded at once
+                        state['speed'] = self.calc_speed(
+                            start, time_now, state['downloaded_bytes'] - resume_len)
+                    else:
+                        state['speed'] = s.get('speed') or ctx.get('speed')
+                    ctx['speed'] = state['speed']
+                    prev_frag_downloaded_bytes[s['filename']] = frag_downloaded_bytes
+                self._hook_progress(state)
 
         ctx['dl'].add_progress_hook(frag_progress_hook)
 
@@ -251,6 +563,8 @@ class FragmentFD(FileDownloader):
 
     def _finish_frag_download(self, ctx):
         ctx['dest_stream'].close()
+        if ctx.get('hdl_stream'):
+            ctx['hdl_stream'].close()
         if self.__do_hdl_file(ctx):
             hdl_filename = encodeFilename(self.hdl_filename(ctx['filename']))
             if os.path.isfile(hdl_filename):
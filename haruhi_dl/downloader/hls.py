@@ -2,21 +2,26 @@ from __future__ import unicode_literals
 
 import re
 import binascii
+import socket
+import time
 try:
     from Crypto.Cipher import AES
-    can_decrypt_frag = True
 except ImportError:
-    can_decrypt_frag = False
+    AES = None
 
 from .fragment import FragmentFD
 from .external import FFmpegFD
 
+from ..aes import aes_cbc_decrypt_bytes
 from ..compat import (
+    compat_http_client,
     compat_urllib_error,
     compat_urlparse,
     compat_struct_pack,
 )
 from ..utils import (
+    error_to_compat_str,
+    float_or_none,
     parse_m3u8_attributes,
     update_url_query,
 )
@@ -42,7 +47,7 @@ class HlsFD(FragmentFD):
             # no segments will definitely be appended to the end of the playlist.
             # r'#EXT-X-PLAYLIST-TYPE:EVENT',  # media segments may be appended to the end of
             #                                 # event media playlists [4]
-            r'#EXT-X-MAP:',  # media initialization [5]
+            # r'#EXT-X-MAP:',  # media initialization [5]
 
             # 1. https://tools.ietf.org/html/draft-pantos-http-live-streaming-17#section-4.3.2.4
             # 2. https://tools.ietf.org/html/draft-pantos-http-live-streaming-17#section-4.3.2.2
@@ -52,31 +57,29 @@ class HlsFD(FragmentFD):
         )
         check_results = [not re.search(feature, manifest) for feature in UNSUPPORTED_FEATURES]
         is_aes128_enc = '#EXT-X-KEY:METHOD=AES-128' in manifest
-        check_results.append(can_decrypt_frag or not is_aes128_enc)
         check_results.append(not (is_aes128_enc and r'#EXT-X-BYTERANGE' in manifest))
-        check_results.append(not info_dict.get('is_live'))
         return all(check_results)
 
-    def real_download(self, filename, info_dict):
-        man_url = info_dict['url']
-        self.to_screen('[%s] Downloading m3u8 manifest' % self.FD_NAME)
+    @staticmethod
+    def _manifest_from_extraction(info_dict):
+        """
+        Return the media playlist fetched by the extractor for the URL being
+        downloaded, or None
+        """
+        manifest = info_dict.get('_hls_manifest')
+        if manifest and manifest.get('url') == info_dict['url']:
+            return manifest.get('data')
+        return None
 
-        urlh = self.hdl.urlopen(self._prepare_url(info_dict, man_url))
-        man_url = urlh.geturl()
-        s = urlh.read().decode('utf-8', 'ignore')
-
-        if not self.can_download(s, info_dict):
-            if info_dict.get('extra_param_to_segment_url') or info_dict.get('_decryption_key_url'):
-                self.report_error('pycrypto not found. Please install it.')
-                return False
-            self.report_warning(
-                'hlsnative has detected features it does not support, '
-                'extraction will be delegated to ffmpeg')
-            fd = FFmpegFD(self.hdl, self.params)
-            for ph in self._progress_hooks:
-                fd.add_progress_hook(ph)
-            return fd.real_download(filename, info_dict)
+    def _parse_fragments(self, s, man_url, info_dict):
+        """
+        Parse a media playlist in a single pass.
 
+        Returns a tuple of the list of fragments to download and the number
+        of ad fragments skipped. Media initialization sections (EXT-X-MAP)
+        are fragments too, with init_section set, put before the first media
+        fragment they apply to.
+        """
         def is_ad_fragment_start(s):
             return (s.startswith('#ANVATO-SEGMENT-INFO') and 'type=ad' in s
                     or s.startswith('#UPLYNK-SEGMENT') and s.endswith(',ad'))
@@ -85,107 +88,51 @@ class HlsFD(FragmentFD):
             return (s.startswith('#ANVATO-SEGMENT-INFO') and 'type=master' in s
                     or s.startswith('#UPLYNK-SEGMENT') and s.endswith(',segment'))
 
-        media_frags = 0
-        ad_frags = 0
-        ad_frag_next = False
-        for line in s.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith('#'):
-                if is_ad_fragment_start(line):
-                    ad_frag_next = True
-                elif is_ad_fragment_end(line):
-                    ad_frag_next = False
-                continue
-            if ad_frag_next:
-                ad_frags += 1
-                continue
-            media_frags += 1
-
-        ctx = {
-            'filename': filename,
-            'total_frags': media_frags,
-            'ad_frags': ad_frags,
-        }
-
-        self._prepare_and_start_frag_download(ctx)
-
-        fragment_retries = self.params.get('fragment_retries', 0)
-        skip_unavailable_fragments = self.params.get('skip_unavailable_fragments', True)
-        test = self.params.get('test', False)
-
         extra_query = None
         extra_param_to_segment_url = info_dict.get('extra_param_to_segment_url')
         if extra_param_to_segment_url:
             extra_query = compat_urlparse.parse_qs(extra_param_to_segment_url)
-        i = 0
+        http_headers = info_dict.get('http_headers', {})
         media_sequence = 0
         decrypt_info = {'METHOD': 'NONE'}
         byte_range = {}
+        # The media initialization section in effect, and the last one added
+        init_section = written_init_section = None
         frag_index = 0
+        ad_frags = 0
         ad_frag_next = False
+        fragments = []
         for line in s.splitlines():
             line = line.strip()
             if line:
                 if not line.startswith('#'):
                     if ad_frag_next:
+                        ad_frags += 1
                         continue
+                    if init_section is not written_init_section:
+                        frag_index += 1
+                        fragments.append(dict(
+                            init_section, frag_index=frag_index, media_sequence=media_sequence))
+                        written_init_section = init_section
                     frag_index += 1
-                    if frag_index <= ctx['fragment_index']:
-                        continue
                     frag_url = (
                         line
                         if re.match(r'^https?://', line)
                         else compat_urlparse.urljoin(man_url, line))
                     if extra_query:
                         frag_url = update_url_query(frag_url, extra_query)
-                    count = 0
-                    headers = info_dict.get('http_headers', {})
+                    headers = dict(http_headers)
                     if byte_range:
                         headers['Range'] = 'bytes=%d-%d' % (byte_range['start'], byte_range['end'] - 1)
-                    while count <= fragment_retries:
-                        try:
-                            success, frag_content = self._download_fragment(
-                                ctx, frag_url, info_dict, headers)
-                            if not success:
-                                return False
-                            break
-                        except compat_urllib_error.HTTPError as err:
-                            # Unavailable (possibly temporary) fragments may be served.
-                            # First we try to retry then either skip or abort.
-                            # See https://github.com/ytdl-org/youtube-dl/issues/10165,
-                            # https://github.com/ytdl-org/youtube-dl/issues/10448).
-                            count += 1
-                            if count <= fragment_retries:
-                                self.report_retry_fragment(err, frag_index, count, fragment_retries)
-                    if count > fragment_retries:
-                        if skip_unavailable_fragments:
-                            i += 1
-                            media_sequence += 1
-                            self.report_skip_fragment(frag_index)
-                            continue
-                        self.report_error(
-                            'giving up after %s fragment retries' % fragment_retries)
-                        return False
-                    if decrypt_info['METHOD'] == 'AES-128':
-                        iv = decrypt_info.get('IV') or compat_struct_pack('>8xq', media_sequence)
-                        decrypt_info['KEY'] = decrypt_info.get('KEY') or self.hdl.urlopen(
-                            self._prepare_url(info_dict, info_dict.get('_decryption_key_url') or decrypt_info['URI'])).read()
-                        # Don't decrypt the content in tests since the data is explicitly truncated and it's not to a valid block
-                        # size (see https://github.com/ytdl-org/youtube-dl/pull/27660). Tests only care that the correct data downloaded,
-                        # not what it decrypts to.
-                        if not test:
-                            frag_content = AES.new(
-                                decrypt_info['KEY'], AES.MODE_CBC, iv).decrypt(frag_content)
-                    self._append_fragment(ctx, frag_content)
-                    # We only download the first fragment during the test
-                    if test:
-                        break
-                    i += 1
+                    fragments.append({
+                        'frag_index': frag_index,
+                        'url': frag_url,
+                        'headers': headers,
+                        'decrypt_info': decrypt_info,
+                        'media_sequence': media_sequence,
+                    })
                     media_sequence += 1
                 elif line.startswith('#EXT-X-KEY'):
-                    decrypt_url = decrypt_info.get('URI')
                     decrypt_info = parse_m3u8_attributes(line[11:])
                     if decrypt_info['METHOD'] == 'AES-128':
                         if 'IV' in decrypt_info:
@@ -195,8 +142,25 @@ class HlsFD(FragmentFD):
                                 man_url, decrypt_info['URI'])
                         if extra_query:
                             decrypt_info['URI'] = update_url_query(decrypt_info['URI'], extra_query)
-                        if decrypt_url != decrypt_info['URI']:
-                            decrypt_info['KEY'] = None
+                elif line.startswith('#EXT-X-MAP'):
+                    map_info = parse_m3u8_attributes(line[11:])
+                    map_url = map_info['URI']
+                    if not re.match(r'^https?://', map_url):
+                        map_url = compat_urlparse.urljoin(man_url, map_url)
+                    if extra_query:
+                        map_url = update_url_query(map_url, extra_query)
+                    headers = dict(http_headers)
+                    if map_info.get('BYTERANGE'):
+                        map_byte_range = map_info['BYTERANGE'].split('@')
+                        map_start = int(map_byte_range[1]) if len(map_byte_range) == 2 else 0
+                        headers['Range'] = 'bytes=%d-%d' % (map_start, map_start + int(map_byte_range[0]) - 1)
+                    # The section is encrypted with the key in effect, if any
+                    init_section = {
+                        'url': map_url,
+                        'headers': headers,
+                        'decrypt_info': decrypt_info,
+                        'init_section': True,
+                    }
                 elif line.startswith('#EXT-X-MEDIA-SEQUENCE'):
                     media_sequence = int(line[22:])
                 elif line.startswith('#EXT-X-BYTERANGE'):
@@ -210,6 +174,167 @@ class HlsFD(FragmentFD):
                     ad_frag_next = True
                 elif is_ad_fragment_end(line):
                     ad_frag_next = False
+        return fragments, ad_frags
+
+    @staticmethod
+    def _test_fragments(fragments):
+        """Return the fragments to download during the test: the first media one"""
+        for i, fragment in enumerate(fragments):
+            if not fragment.get('init_section'):
+                return fragments[:i + 1]
+        return fragments
+
+    def _download_manifest(self, info_dict, man_url):
+        urlh = self.hdl.urlopen(self._prepare_url(info_dict, man_url))
+        return urlh.read().decode('utf-8', 'ignore'), urlh.geturl()
+
+    def _fragment_decrypter(self, info_dict):
+        test = self.params.get('test', False)
+        # Keys by URL, kept across playlist reloads of live streams
+        keys = {}
+
+        def decrypt_fragment(fragment, frag_content):
+            decrypt_info = fragment['decrypt_info']
+            if decrypt_info['METHOD'] != 'AES-128':
+                return frag_content
+            iv = decrypt_info.get('IV') or compat_struct_pack('>8xq', fragment['media_sequence'])
+            key_url = info_dict.get('_decryption_key_url') or decrypt_info['URI']
+            if key_url not in keys:
+                keys[key_url] = self.hdl.urlopen(self._prepare_url(info_dict, key_url)).read()
+            # Don't decrypt the content in tests since the data is explicitly truncated and it's not to a valid block
+            # size (see https://github.com/ytdl-org/youtube-dl/pull/27660). Tests only care that the correct data downloaded,
+            # not what it decrypts to.
+            if test:
+                return frag_content
+            if AES is None:
+                return aes_cbc_decrypt_bytes(frag_content, keys[key_url], iv)
+            return AES.new(keys[key_url], AES.MODE_CBC, iv).decrypt(frag_content)
+
+        return decrypt_fragment
+
+    def real_download(self, filename, info_dict):
+        man_url = info_dict['url']
+        s = self._manifest_from_extraction(info_dict)
+        if s is None:
+            self.to_screen('[%s] Downloading m3u8 manifest' % self.FD_NAME)
+            s, man_url = self._download_manifest(info_dict, man_url)
+
+        if not self.can_download(s, info_dict):
+            if info_dict.get('extra_param_to_segment_url') or info_dict.get('_decryption_key_url'):
+                self.report_error('hlsnative cannot download this stream and ffmpeg does not support it either')
+                return False
+            self.report_warning(
+                'hlsnative has detected features it does not support, '
+                'extraction will be delegated to ffmpeg')
+            fd = FFmpegFD(self.hdl, self.params)
+            for ph in self._progress_hooks:
+                fd.add_progress_hook(ph)
+            return fd.real_download(filename, info_dict)
+
+        if info_dict.get('is_live'):
+            return self._download_live(filename, info_dict, s, man_url)
+
+        fragments, ad_frags = self._parse_fragments(s, man_url, info_dict)
+
+        ctx = {
+            'filename': filename,
+            'total_frags': len(fragments),
+            'ad_frags': ad_frags,
+        }
+
+        self._prepare_and_start_frag_download(ctx)
+
+        # We only download the first fragment during the test
+        if self.params.get('test', False):
+            fragments = self._test_fragments(fragments)
+
+        if not self._download_and_append_fragments(
+                ctx, fragments, info_dict, self._fragment_decrypter(info_dict)):
+            return False
+
+        self._finish_frag_download(ctx)
+
+        return True
+
+    def _download_live(self, filename, info_dict, s, man_url):
+        """
+        Record a live stream, reloading the media playlist and appending the
+        fragments added to it, until it ends or the user interrupts it
+        """
+        ctx = {
+            'filename': filename,
+            'total_frags': None,
+            'live': True,
+        }
+
+        self._prepare_and_start_frag_download(ctx)
+
+        test = self.params.get('test', False)
+        fragment_retries = self.params.get('fragment_retries', 0)
+        decrypt_fragment = self._fragment_decrypter(info_dict)
+        # Media sequence number of the last fragment appended
+        last_sequence = None
+        last_init_key = None
+        frag_index = 0
+        reload_failures = 0
+        loaded = time.time()
+        try:
+            while True:
+                fragments, _ = self._parse_fragments(s, man_url, info_dict)
+                if last_sequence is not None:
+                    # Initialization sections have the sequence number of
+                    # the media fragment they come before
+                    fragments = [f for f in fragments if f['media_sequence'] > last_sequence]
+                    if fragments and fragments[0]['media_sequence'] > last_sequence + 1:
+                        self.report_warning('Missed %d fragments' % (
+                            fragments[0]['media_sequence'] - last_sequence - 1))
+                if test:
+                    fragments = self._test_fragments(fragments)
+                new_fragments = []
+                for fragment in fragments:
+                    if fragment.get('init_section'):
+                        # Only write it again when it changes
+                        init_key = (fragment['url'], fragment['headers'].get('Range'))
+                        if init_key == last_init_key:
+                            continue
+                        last_init_key = init_key
+                    frag_index += 1
+                    fragment['frag_index'] = frag_index
+                    new_fragments.append(fragment)
+                fragments = new_fragments
+                if not self._download_and_append_fragments(ctx, fragments, info_dict, decrypt_fragment):
+                    return False
+                if fragments:
+                    last_sequence = fragments[-1]['media_sequence']
+                if test or '#EXT-X-ENDLIST' in s:
+                    break
+
+                # Wait for the target duration since the previous reload, or
+                # for half of it if the playlist has not changed, as per
+                # https://tools.ietf.org/html/rfc8216#section-6.3.4
+                mobj = re.search(r'#EXT-X-TARGETDURATION:(\d+(?:\.\d+)?)', s)
+                target_duration = float_or_none(mobj and mobj.group(1)) or 10
+                if not fragments:
+                    target_duration /= 2
+                time.sleep(max(0, loaded + target_duration - time.time()))
+                loaded = time.time()
+                try:
+                    s, man_url = self._download_manifest(info_dict, info_dict['url'])
+                    reload_failures = 0
+                except (compat_urllib_error.URLError, compat_http_client.HTTPException, socket.error) as err:
+                    reload_failures += 1
+                    if reload_failures > fragment_retries:
+                        self.report_warning(
+                            'Unable to reload the m3u8 manifest: %s. Stopping the recording'
+                            % error_to_compat_str(err))
+                        break
+                    self.report_warning(
+                        'Unable to reload the m3u8 manifest: %s. Retrying (attempt %d of %s)...'
+                        % (error_to_compat_str(err), reload_failures, self.format_retries(fragment_retries)))
+        except KeyboardInterrupt:
+            # Stopping the recording of a live stream is its expected end,
+            # so what has been downloaded is kept and postprocessed
+            self.to_screen('[%s] Interrupted by user' % self.FD_NAME)
 
         self._finish_frag_download(ctx)
 
@@ -1,14 +1,18 @@
 from __future__ import unicode_literals
 
+import concurrent.futures
 import errno
+import json
 import os
 import socket
+import threading
 import time
 import random
 import re
 
 from .common import FileDownloader
 from ..compat import (
+    compat_http_client,
     compat_str,
     compat_urllib_error,
 )
@@ -24,7 +28,14 @@ from ..utils import (
 )
 
 
+class _RangeNotSupported(Exception):
+    pass
+
+
 class HttpFD(FileDownloader):
+    # Smallest piece of a file downloaded over a connection of its own
+    _MIN_PIECE_SIZE = 1024 * 1024
+
     def real_download(self, filename, info_dict):
         url = info_dict['url']
 
@@ -62,6 +73,18 @@ class HttpFD(FileDownloader):
                 ctx.resume_len = os.path.getsize(
                     encodeFilename(ctx.tmpfilename))
 
+        if not is_test and ctx.tmpfilename != '-':
+            # A download interrupted in segmented mode is resumed in it
+            segments = self._read_segments_journal(filename)
+            if segments is not None or (self.params.get('http_connections') or 1) > 1:
+                res = self._segmented_download(
+                    filename, ctx.tmpfilename, info_dict, url, headers, chunk_size, segments)
+                if res is not None:
+                    return res
+                if segments is not None:
+                    # The server no longer accepts ranges, start over
+                    ctx.resume_len = 0
+
         ctx.is_resume = ctx.resume_len > 0
 
         count = 0
@@ -362,3 +385,237 @@ class HttpFD(FileDownloader):
 
         self.report_error('giving up after %s retries' % retries)
         return False
+
+    def _read_segments_journal(self, filename):
+        """
+        Return the file size, the piece size and the set of pieces already
+        downloaded, as recorded in the .ytdl journal of a segmented download,
+        or None.
+        """
+        hdl_fn = self.hdl_filename(filename)
+        if not os.path.isfile(encodeFilename(hdl_fn)):
+            return None
+        try:
+            stream, _ = sanitize_open(hdl_fn, 'r')
+            try:
+                lines = stream.read().splitlines()
+            finally:
+                stream.close()
+            segments = json.loads(lines[0])['downloader']['http_segments']
+            done = set()
+            for line in lines[1:]:
+                try:
+                    done.add(json.loads(line)['piece'])
+                except ValueError:
+                    # The last record may have been cut by an interruption
+                    break
+            return segments['total'], segments['piece_size'], done
+        except Exception:
+            return None
+
+    def _segmented_download(self, filename, tmpfilename, info_dict, url, headers, chunk_size, segments):
+        """
+        Download pieces of the file over several connections at the same
+        time, into a temporary file of the final size.
+
+        Every piece downloaded is recorded in the .ytdl journal, so an
+        interrupted download resumes with the missing pieces. Returns None
+        if the server does not honour Range requests, for the file to be
+        downloaded as a single stream instead.
+        """
+        connections = self.params.get('http_connections') or 1
+        retries = self.params.get('retries', 0)
+        hdl_fn = self.hdl_filename(filename)
+
+        def open_range(start, end):
+            request = sanitized_Request(url, None, headers)
+            request.add_header('Range', 'bytes=%d-%d' % (start, end))
+            data = self.hdl.urlopen(request)
+            content_range = re.search(
+                r'bytes (\d+)-\d+/(\d+)', data.headers.get('Content-Range') or '')
+            if not content_range or int(content_range.group(1)) != start:
+                data.close()
+                raise _RangeNotSupported()
+            return data, int(content_range.group(2))
+
+        def with_retries(func, *args):
+            count = 0
+            while count <= retries:
+                try:
+                    return func(*args)
+                except compat_urllib_error.HTTPError as err:
+                    if err.code < 500 or err.code >= 600:
+                        raise
+                    source_error = err
+                except compat_urllib_error.URLError as err:
+                    if not isinstance(getattr(err, 'reason', None), socket.timeout):
+                        raise
+                    source_error = err
+                except (socket.error, compat_http_client.IncompleteRead, ContentTooShortError) as err:
+                    source_error = err
+                count += 1
+                if count <= retries:
+                    self.report_retry(source_error, count, retries)
+            self.report_error('giving up after %s retries' % retries)
+            return None
+
+        def discard_segments():
+            if segments is not None:
+                for fn in (tmpfilename, hdl_fn):
+                    if os.path.isfile(encodeFilename(fn)):
+                        os.remove(encodeFilename(fn))
+
+        try:
+            probe = with_retries(open_range, 0, 0)
+        except _RangeNotSupported:
+            discard_segments()
+            return None
+        except compat_urllib_error.HTTPError as err:
+            if err.code != 416:
+                raise
+            # Empty file
+            discard_segments()
+            return None
+        if probe is None:
+            return False
+        data, total = probe
+        last_modified = data.headers.get('Last-Modified')
+        data.read()
+        data.close()
+
+        min_data_len = self.params.get('min_filesize')
+        max_data_len = self.params.get('max_filesize')
+        if min_data_len is not None and total < min_data_len:
+            self.to_screen('\r[download] File is smaller than min-filesize (%s bytes < %s bytes). Aborting.' % (total, min_data_len))
+            return False
+        if max_data_len is not None and total > max_data_len:
+            self.to_screen('\r[download] File is larger than max-filesize (%s bytes > %s bytes). Aborting.' % (total, max_data_len))
+            return False
+
+        if (segments is not None and segments[0] == total
+                and os.path.isfile(encodeFilename(tmpfilename))
+                and os.path.getsize(encodeFilename(tmpfilename)) == total):
+            _, piece_size, done = segments
+            self.to_screen('[download] Resuming segmented download, %d bytes left' % (
+                total - sum(min(piece_size, total - idx * piece_size) for idx in done)))
+        else:
+            piece_size = chunk_size or max(
+                self._MIN_PIECE_SIZE, -(-total // (connections * 4)))
+            done = set()
+            try:
+                stream, tmpfilename = sanitize_open(tmpfilename, 'wb')
+                stream.truncate(total)
+                stream.close()
+            except (OSError, IOError) as err:
+                self.report_error('unable to open for writing: %s' % str(err))
+                return False
+        self.report_destination(filename)
+
+        if self.params.get('xattr_set_filesize', False):
+            try:
+                write_xattr(tmpfilename, 'user.hdl.filesize', str(total).encode('utf-8'))
+            except (XAttrUnavailableError, XAttrMetadataError) as err:
+                self.report_error('unable to set filesize xattr: %s' % str(err))
+
+        n_pieces = -(-total // piece_size)
+        journal, _ = sanitize_open(hdl_fn, 'w')
+        journal.write(json.dumps({'downloader': {'http_segments': {
+            'total': total,
+            'piece_size': piece_size,
+        }}}) + '\n')
+        for idx in sorted(done):
+            journal.write(json.dumps({'piece': idx}) + '\n')
+        journal.flush()
+
+        lock = threading.Lock()
+        resume_len = sum(min(piece_size, total - idx * piece_size) for idx in done)
+        progress = {'downloaded_bytes': resume_len}
+        start_time = time.time()
+
+        def report_bytes(count):
+            with lock:
+                progress['downloaded_bytes'] += count
+                downloaded_bytes = progress['downloaded_bytes']
+                now = time.time()
+                if count > 0:
+                    self._hook_progress({
+                        'status': 'downloading',
+                        'downloaded_bytes': downloaded_bytes,
+                        'total_bytes': total,
+                        'tmpfilename': tmpfilename,
+                        'filename': filename,
+                        'eta': self.calc_eta(start_time, now, total - resume_len, downloaded_bytes - resume_len),
+                        'speed': self.calc_speed(start_time, now, downloaded_bytes - resume_len),
+                        'elapsed': now - start_time,
+                    })
+            # Apply rate limit to the sum of all connections
+            self.slow_down(start_time, now, downloaded_bytes - resume_len)
+
+        def fetch_piece(idx):
+            start = idx * piece_size
+            size = min(piece_size, total - start)
+            data, _ = open_range(start, start + size - 1)
+            byte_counter = 0
+            block_size = self.params.get('buffersize', 1024)
+            try:
+                with open(encodeFilename(tmpfilename), 'r+b') as stream:
+                    stream.seek(start)
+                    before = time.time()
+                    while byte_counter < size:
+                        data_block = data.read(min(block_size, size - byte_counter))
+                        if not data_block:
+                            break
+                        stream.write(data_block)
+                        byte_counter += len(data_block)
+                        report_bytes(len(data_block))
+                        now = time.time()
+                        if not self.params.get('noresizebuffer', False):
+                            block_size = self.best_block_size(now - before, len(data_block))
+                        before = now
+            except BaseException:
+                # The piece is downloaded again from its start
+                report_bytes(-byte_counter)
+                raise
+            finally:
+                data.close()
+            if byte_counter < size:
+                report_bytes(-byte_counter)
+                raise ContentTooShortError(byte_counter, size)
+            with lock:
+                journal.write(json.dumps({'piece': idx}) + '\n')
+                journal.flush()
+            return True
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(connections) as executor:
+                futures = [
+                    executor.submit(with_retries, fetch_piece, idx)
+                    for idx in range(n_pieces) if idx not in done]
+                try:
+                    for future in futures:
+                        try:
+                            if not future.result():
+                                return False
+                        except _RangeNotSupported:
+                            self.report_error('server stopped honouring Range requests')
+                            return False
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            journal.close()
+
+        os.remove(encodeFilename(hdl_fn))
+        self.try_rename(tmpfilename, filename)
+
+        if self.params.get('updatetime', True):
+            info_dict['filetime'] = self.try_utime(filename, last_modified)
+
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - start_time,
+        })
+        return True
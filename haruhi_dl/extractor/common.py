@@ -65,6 +65,7 @@ from ..utils import (
     parse_m3u8_attributes,
     parse_resolution,
     RegexNotFoundError,
+    run_concurrently,
     sanitized_Request,
     sanitize_filename,
     str_or_none,
@@ -204,6 +205,16 @@ class InfoExtractor(object):
                                  (HTTP or RTMP) download. Boolean.
                     * downloader_options  A dictionary of downloader options as
                                  described in FileDownloader
+                    * _hls_manifest  The HLS media playlist already fetched
+                                 from url, as a dictionary with "url" and
+                                 "data" (the playlist contents), so that the
+                                 native HLS downloader does not fetch it again
+                    * _resolve_url  A function returning the final URL of the
+                                 format, for URLs that are expensive to build
+                                 (e.g. with a signature to decrypt). url is
+                                 then a preliminary URL, only used to guess
+                                 the format's properties. It is only called
+                                 for the formats that are actually used.
 
                     Internally, extractors can include subtitles in the format
                     list, in this format:
@@ -345,6 +356,14 @@ class InfoExtractor(object):
 
     Unless mentioned otherwise, None is equivalent to absence of information.
 
+    The values of subtitles, automatic_captions, chapters and thumbnails may
+    also be given as a LazyField (see utils), for values that are expensive
+    to get (e.g. that need extra requests). They are then only computed if
+    something is going to look at them, like writing or listing subtitles,
+    printing or writing the info dict as JSON, the output template, a match
+    filter or a postprocessor. Otherwise they are left out of the info dict
+    once the video is downloaded.
+
 
     _type "playlist" indicates multiple videos.
     There must be a key "entries", which is a list, an iterable, or a PagedList
@@ -398,6 +417,9 @@ class InfoExtractor(object):
     will be used by geo restriction bypass mechanism similarly
     to _GEO_COUNTRIES.
 
+    _MAX_CONCURRENT_REQUESTS attribute limits how many of the calls passed
+    to _run_concurrently() run at the same time.
+
     Finally, the _WORKING attribute should be set to False for broken IEs
     in order to warn the users and skip the tests.
     """
@@ -411,6 +433,7 @@ class InfoExtractor(object):
     _WORKING = True
     _SELFHOSTED = False
     _REQUIRES_PLAYWRIGHT = False
+    _MAX_CONCURRENT_REQUESTS = 4
 
     def __init__(self, downloader=None):
         """Constructor. Receives an optional downloader."""
@@ -646,7 +669,7 @@ class InfoExtractor(object):
         if hasattr(ssl, 'CertificateError'):
             exceptions.append(ssl.CertificateError)
         try:
-            return self._downloader.urlopen(url_or_request)
+            return self._downloader.http_cache.urlopen(url_or_request)
         except tuple(exceptions) as err:
             if isinstance(err, compat_urllib_error.HTTPError):
                 if self.__can_accept_status_code(err, expected_status):
@@ -914,6 +937,17 @@ class InfoExtractor(object):
             expected_status=expected_status)
         return res if res is False else res[0]
 
+    def _run_concurrently(self, *funcs):
+        """
+        Call funcs, functions taking no arguments (usually wrapping
+        independent _download_* calls), in parallel and return the list of
+        their results, in the same order.
+
+        All the calls are waited for. If any of them raised an exception, the
+        one of the first such call is raised afterwards.
+        """
+        return run_concurrently(funcs, self._MAX_CONCURRENT_REQUESTS)
+
     def _parse_json(self, json_string, video_id, transform_source=None, fatal=True):
         if transform_source:
             json_string = transform_source(json_string)
@@ -1750,6 +1784,11 @@ class InfoExtractor(object):
                 'ext': ext,
                 'protocol': entry_protocol,
                 'preference': preference,
+                # Spares the native downloader fetching it again
+                '_hls_manifest': {
+                    'url': m3u8_url,
+                    'data': m3u8_doc,
+                },
             }]
 
         groups = {}
@@ -3198,11 +3237,10 @@ class SelfhostedInfoExtractor(InfoExtractor):
             return True
 
         # no strings? check regexes!
-        if '_SH_CONTENT_REGEXES_RES' not in cls.__dict__:
-            cls._SH_VALID_CONTENT_REGEXES_RES = (re.compile(rgx)
-                                                 for rgx in cls._SH_VALID_CONTENT_REGEXES or ())
-        if not any(rgx.match(webpage) is not None for rgx in cls._SH_VALID_CONTENT_REGEXES_RES):
-            return False
+        if '_SH_VALID_CONTENT_REGEXES_RES' not in cls.__dict__:
+            cls._SH_VALID_CONTENT_REGEXES_RES = tuple(re.compile(rgx)
+                                                      for rgx in cls._SH_VALID_CONTENT_REGEXES or ())
+        return any(rgx.search(webpage) is not None for rgx in cls._SH_VALID_CONTENT_REGEXES_RES)
 
     def _real_extract(self, url):
         """Unreal extraction process. Do NOT redefine in subclasses."""
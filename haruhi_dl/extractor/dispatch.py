@@ -0,0 +1,247 @@
+from __future__ import unicode_literals
+
+import collections
+import re
+
+from .common import InfoExtractor, SearchInfoExtractor, SelfhostedInfoExtractor
+from ..compat import (
+    compat_sre_parse,
+    compat_str,
+)
+
+# Length of the URL substrings used as index keys
+_GRAM_LENGTH = 4
+
+
+def required_literals(regex):
+    """
+    Return a list of tuples of strings, such that every string matched by
+    regex contains (case-insensitively) at least one of the strings of each
+    tuple. Strings are lowercased.
+    """
+    def walk(parsed, run, clauses):
+        for op, av in parsed:
+            if op == compat_sre_parse.LITERAL and av < 128:
+                run.append(chr(av).lower())
+                continue
+            if op == compat_sre_parse.IN and len(av) == 1 and av[0][0] == compat_sre_parse.LITERAL and av[0][1] < 128:
+                run.append(chr(av[0][1]).lower())
+                continue
+            if op == compat_sre_parse.AT:
+                # Anchors do not consume any characters
+                continue
+            if op == compat_sre_parse.SUBPATTERN:
+                run = walk(av[-1], run, clauses)
+                continue
+            end_run(run, clauses)
+            run = []
+            if op in (compat_sre_parse.MAX_REPEAT, compat_sre_parse.MIN_REPEAT) and av[0] >= 1:
+                # The repeated pattern has to be matched at least once
+                end_run(walk(av[2], [], clauses), clauses)
+            elif op == compat_sre_parse.BRANCH:
+                # One of the alternatives has to be matched, so one literal
+                # of each alternative is enough to make up a clause
+                alternatives = []
+                for alternative in av[1]:
+                    alt_clauses = []
+                    end_run(walk(alternative, [], alt_clauses), alt_clauses)
+                    alt_literals = [c[0] for c in alt_clauses if len(c) == 1]
+                    if not alt_literals:
+                        break
+                    alternatives.append(max(alt_literals, key=len))
+                else:
+                    clauses.append(tuple(alternatives))
+        return run
+
+    def end_run(run, clauses):
+        if run:
+            clauses.append((''.join(run), ))
+
+    clauses = []
+    end_run(walk(compat_sre_parse.parse(regex), [], clauses), clauses)
+    return clauses
+
+
+def url_literals(ie):
+    """
+    Return required_literals() of the URLs suitable for the extractor (class
+    or instance), or None if its suitable() cannot be analysed.
+    """
+    cls = ie if isinstance(ie, type) else type(ie)
+    # Lazy extractors have this computed in advance by make_lazy_extractors
+    if '_URL_LITERALS' not in cls.__dict__:
+        suitable = getattr(cls.suitable, '__func__', None)
+        try:
+            if suitable is InfoExtractor.suitable.__func__:
+                regex = cls._VALID_URL
+            elif suitable is SearchInfoExtractor.suitable.__func__:
+                regex = cls._make_valid_url()
+            else:
+                regex = None
+            cls._URL_LITERALS = required_literals(regex) if regex else None
+        except Exception:
+            cls._URL_LITERALS = None
+    return cls._URL_LITERALS
+
+
+class ExtractorIndex(object):
+    """
+    Index narrowing down the extractors that may be suitable for a URL.
+
+    Each extractor is filed under one of the substrings its URLs always
+    contain (the least common one among all extractors), so looking a URL up
+    only needs a dictionary access per position in the URL. Extractors that
+    cannot be indexed are always returned. The returned candidates keep the
+    order of the list the index has been built from.
+    """
+
+    def __init__(self, ies):
+        self._ies = []
+        self._always = []
+        self._by_gram = {}
+        self._gram_count = collections.Counter()
+
+        ies_clauses = []
+        for ie in ies:
+            clauses = self._ie_clauses(ie)
+            ies_clauses.append((ie, clauses))
+            for clause in clauses:
+                for grams in clause:
+                    self._gram_count.update(grams)
+        for ie, clauses in ies_clauses:
+            self._file(ie, clauses)
+
+    @staticmethod
+    def _ie_clauses(ie):
+        def literal_grams(literal):
+            return set(
+                literal[i:i + _GRAM_LENGTH]
+                for i in range(len(literal) - _GRAM_LENGTH + 1))
+
+        clauses = [
+            [literal_grams(literal) for literal in clause]
+            for clause in url_literals(ie) or ()]
+        # Every alternative of a clause needs to be indexable
+        return [clause for clause in clauses if all(clause)]
+
+    def _file(self, ie, clauses):
+        idx = len(self._ies)
+        self._ies.append(ie)
+        if not clauses:
+            self._always.append(idx)
+            return
+
+        gram_count = self._gram_count
+
+        def best_gram(grams):
+            return min(grams, key=lambda g: (gram_count[g], g))
+
+        # File the extractor under the keys matching the fewest URLs
+        keys = min(
+            (set(best_gram(grams) for grams in clause) for clause in clauses),
+            key=lambda keys: (sum(gram_count[k] for k in keys), sorted(keys)))
+        for key in keys:
+            self._by_gram.setdefault(key, []).append(idx)
+
+    def add(self, ie):
+        """Append an extractor, keeping the keys of the other ones"""
+        self._file(ie, self._ie_clauses(ie))
+
+    def candidates(self, url):
+        url = url.lower()
+        found = set(self._always)
+        for i in range(len(url) - _GRAM_LENGTH + 1):
+            idxs = self._by_gram.get(url[i:i + _GRAM_LENGTH])
+            if idxs:
+                found.update(idxs)
+        return [self._ies[idx] for idx in sorted(found)]
+
+
+def _default_suitable_selfhosted(ie):
+    for klass in ie.__mro__:
+        if 'suitable_selfhosted' in klass.__dict__:
+            # Lazy extractors get a copy of the default implementation
+            return klass is SelfhostedInfoExtractor or klass.__name__ == 'LazyLoadSelfhostedExtractor'
+    return False
+
+
+class SelfhostedMatcher(object):
+    """
+    Finds the first selfhosted extractor suitable for a URL and webpage, as
+    calling suitable_selfhosted() of each one in turn would.
+
+    Many extractors share their content strings and regexes (e.g. all the
+    PeerTube ones), so each distinct one is looked for at most once per
+    webpage. Extractors that redefine suitable_selfhosted() are asked
+    directly.
+    """
+
+    def __init__(self, ies):
+        self._ies = []
+        # Content strings, and compiled content regexes
+        self._patterns = []
+
+        pattern_idxs = {}
+        for ie in ies:
+            if not _default_suitable_selfhosted(ie):
+                self._ies.append((ie, None, None))
+                continue
+            idxs = []
+            for pattern in (
+                    list(ie._SH_VALID_CONTENT_STRINGS or ())
+                    + [re.compile(regex) for regex in ie._SH_VALID_CONTENT_REGEXES or ()]):
+                if pattern not in pattern_idxs:
+                    pattern_idxs[pattern] = len(self._patterns)
+                    self._patterns.append(pattern)
+                idxs.append(pattern_idxs[pattern])
+            url_re = re.compile(ie._SH_VALID_URL) if ie._SH_VALID_URL else None
+            self._ies.append((ie, url_re, tuple(idxs)))
+
+    def find(self, url, webpage):
+        """Return the first suitable extractor, or None"""
+        found = {}
+
+        def contains(idx):
+            if idx not in found:
+                pattern = self._patterns[idx]
+                # Plain substring search is much faster than any regex
+                if isinstance(pattern, compat_str):
+                    found[idx] = pattern in webpage
+                else:
+                    found[idx] = pattern.search(webpage) is not None
+            return found[idx]
+
+        for ie, url_re, idxs in self._ies:
+            if idxs is None or webpage is None:
+                if ie.suitable_selfhosted(url, webpage):
+                    return ie
+            elif url_re is not None and not url_re.match(url):
+                continue
+            elif any(contains(idx) for idx in idxs):
+                return ie
+        return None
+
+    def find_on_instance(self, url, ie_key):
+        """
+        Return the first extractor suitable for a URL on a host known to run
+        the software of the extractor ie_key, without its webpage, or None
+        """
+        known_idxs = None
+        for ie, url_re, idxs in self._ies:
+            if ie.ie_key() == ie_key:
+                known_idxs = idxs
+                break
+        else:
+            return None
+        for ie, url_re, idxs in self._ies:
+            # Extractors of the same software look for the same contents
+            if ie.ie_key() == ie_key or (known_idxs and idxs == known_idxs):
+                if ie.suitable_selfhosted(url, None):
+                    return ie
+        return None
+
+    def matches_url(self, url):
+        """Whether any extractor checking the webpage contents may handle the URL"""
+        return any(
+            idxs and (url_re is None or url_re.match(url))
+            for ie, url_re, idxs in self._ies)
@@ -40,6 +40,7 @@ from ..utils import (
     xpath_with_ns,
 )
 from .commonprotocols import RtmpIE
+from .dispatch import SelfhostedMatcher
 from .brightcove import (
     BrightcoveLegacyIE,
     BrightcoveNewIE,
@@ -147,6 +148,8 @@ class GenericIE(InfoExtractor):
     IE_DESC = 'Generic downloader that works on some sites'
     _VALID_URL = r'.*'
     IE_NAME = 'generic'
+    # Built from _SH_CLASSES on first use
+    _SH_MATCHER = None
     _TESTS = [
         # Direct link to a video
         {
@@ -2419,6 +2422,141 @@ class GenericIE(InfoExtractor):
             'title': title,
         }
 
+    # Extractors whose embeds are looked for, in this order
+    _EMBED_IES = (
+        NexxIE,
+        NexxEmbedIE,
+        ThePlatformIE,
+        YoutubeIE,
+        DailymotionIE,
+        DailyMailIE,
+        FacebookIE,
+        SportBoxIE,
+        XHamsterEmbedIE,
+        TNAFlixNetworkEmbedIE,
+        PornHubIE,
+        DrTuberIE,
+        RedTubeIE,
+        Tube8IE,
+        MofosexEmbedIE,
+        SpankwireIE,
+        YouPornIE,
+        SoundcloudEmbedIE,
+        TuneInBaseIE,
+        JWPlatformIE,
+        DBTVIE,
+        VideaIE,
+        TwentyMinutenIE,
+        VideoPressIE,
+        RutubeIE,
+        WashingtonPostIE,
+        JojIE,
+        MegaphoneIE,
+        VzaarIE,
+        Channel9IE,
+        VShareIE,
+        SpringboardPlatformIE,
+        YapFilesIE,
+        ViceIE,
+        XFileShareIE,
+        CloudflareStreamIE,
+        PeerTubeSHIE,
+        IndavideoEmbedIE,
+        APAIE,
+        FoxNewsIE,
+        ViqeoIE,
+        ExpressenIE,
+        ZypeIE,
+        OnNetworkLoaderIE,
+        VimeoIE,
+        SoundcloudEmbedIE,
+        KalturaIE,
+        RtlNlIE,
+        TeachableIE,    # must be before Wistia
+        WistiaIE,
+        SVTIE,
+        XLinkIE,
+        LibsynIE,
+        VHXEmbedIE,
+        ArcPublishingIE,
+        MedialaanIE,
+        SimplecastIE,
+        SpreakerIE,
+        CastosHostedIE,
+    )
+    # Embed extractors whose _extract_urls() only looks for embeds within an
+    # HTML tag matched by _EMBED_TAG_RE, so that it can be given the tags
+    # collected by _scan_embed_tags() rather than the whole webpage
+    _TAG_EMBED_IES = frozenset((
+        NexxEmbedIE,
+        ThePlatformIE,
+        DailyMailIE,
+        SportBoxIE,
+        XHamsterEmbedIE,
+        TNAFlixNetworkEmbedIE,
+        PornHubIE,
+        DrTuberIE,
+        RedTubeIE,
+        Tube8IE,
+        MofosexEmbedIE,
+        SpankwireIE,
+        YouPornIE,
+        SoundcloudEmbedIE,
+        TuneInBaseIE,
+        JWPlatformIE,
+        DBTVIE,
+        VideaIE,
+        TwentyMinutenIE,
+        VideoPressIE,
+        RutubeIE,
+        WashingtonPostIE,
+        JojIE,
+        MegaphoneIE,
+        VzaarIE,
+        Channel9IE,
+        VShareIE,
+        SpringboardPlatformIE,
+        YapFilesIE,
+        ViceIE,
+        XFileShareIE,
+        CloudflareStreamIE,
+        PeerTubeSHIE,
+        IndavideoEmbedIE,
+        APAIE,
+        FoxNewsIE,
+        ViqeoIE,
+        ExpressenIE,
+        ZypeIE,
+        OnNetworkLoaderIE,
+        VimeoIE,
+        RtlNlIE,
+        LibsynIE,
+        VHXEmbedIE,
+        SimplecastIE,
+        SpreakerIE,
+        CastosHostedIE,
+    ))
+    # Like the extractors' own <iframe[^>]+ patterns, a tag ends at the first
+    # ">", even within quotes, so that nothing they match is left out
+    _EMBED_TAG_RE = re.compile(
+        r'<(?:iframe|amp-iframe|embed|object|param|script|video|source|meta|input)\b[^>]*>')
+
+    @classmethod
+    def _scan_embed_tags(cls, webpage):
+        """Return the opening tags of the elements that may embed a player, one per line"""
+        return '\n'.join(m.group(0) for m in cls._EMBED_TAG_RE.finditer(webpage))
+
+    @staticmethod
+    def _selfhosted_matcher():
+        if GenericIE._SH_MATCHER is None:
+            from ..extractor import _SH_CLASSES
+            GenericIE._SH_MATCHER = SelfhostedMatcher(_SH_CLASSES)
+        return GenericIE._SH_MATCHER
+
+    @staticmethod
+    def _selfhosted_host_key(url):
+        return re.sub(r'[^a-zA-Z0-9_.-]', '_', compat_urlparse.urlparse(url).netloc.lower())
+
     def _real_extract(self, url):
         if url.startswith('//'):
             return self.url_result(self.http_scheme() + url)
@@ -2463,6 +2601,15 @@ class GenericIE(InfoExtractor):
         else:
             video_id = self._generic_id(url)
 
+        if not self._downloader.params.get('force_generic_extractor', False):
+            # Is it on a known instance of a selfhosted web service?
+            shie_key = self._downloader.cache.load('selfhosted', self._selfhosted_host_key(url))
+            shie = shie_key and self._selfhosted_matcher().find_on_instance(url, shie_key)
+            if shie:
+                shie = self._downloader.get_info_extractor(shie.ie_key())
+                self.to_screen('%s: This host is known to be %s' % (video_id, shie.IE_NAME))
+                return shie._selfhosted_extract(url)
+
         self.to_screen('%s: Requesting header' % video_id)
 
         head_req = HEADRequest(url)
@@ -2611,12 +2758,18 @@ class GenericIE(InfoExtractor):
 
         if not self._downloader.params.get('force_generic_extractor', False):
             # Is it a selfhosted web service?
-            from ..extractor import _SH_CLASSES
-            for shie in _SH_CLASSES:
-                if shie.suitable_selfhosted(url, webpage):
+            host_key = self._selfhosted_host_key(url)
+            if not self._downloader.cache.load('not_selfhosted', host_key):
+                matcher = self._selfhosted_matcher()
+                shie = matcher.find(url, webpage)
+                if shie is not None:
+                    # Later URLs on this host skip downloading the webpage
+                    self._downloader.cache.store('selfhosted', host_key, shie.ie_key())
                     shie = self._downloader.get_info_extractor(shie.ie_key())
                     self.to_screen('%s: This webpage seems to be %s' % (video_id, shie.IE_NAME))
                     return shie._selfhosted_extract(url, webpage=webpage)
+                if matcher.matches_url(url):
+                    self._downloader.cache.store('not_selfhosted', host_key, True)
 
         # Is it a Camtasia project?
         camtasia_res = self._extract_camtasia(url, video_id, webpage)
@@ -2694,71 +2847,16 @@ class GenericIE(InfoExtractor):
                 ie='BrightcoveNew')
 
         # Look for embeds
-        for embie in (
-            NexxIE,
-            NexxEmbedIE,
-            ThePlatformIE,
-            YoutubeIE,
-            DailymotionIE,
-            DailyMailIE,
-            FacebookIE,
-            SportBoxIE,
-            XHamsterEmbedIE,
-            TNAFlixNetworkEmbedIE,
-            PornHubIE,
-            DrTuberIE,
-            RedTubeIE,
-            Tube8IE,
-            MofosexEmbedIE,
-            SpankwireIE,
-            YouPornIE,
-            SoundcloudEmbedIE,
-            TuneInBaseIE,
-            JWPlatformIE,
-            DBTVIE,
-            VideaIE,
-            TwentyMinutenIE,
-            VideoPressIE,
-            RutubeIE,
-            WashingtonPostIE,
-            JojIE,
-            MegaphoneIE,
-            VzaarIE,
-            Channel9IE,
-            VShareIE,
-            SpringboardPlatformIE,
-            YapFilesIE,
-            ViceIE,
-            XFileShareIE,
-            CloudflareStreamIE,
-            PeerTubeSHIE,
-            IndavideoEmbedIE,
-            APAIE,
-            FoxNewsIE,
-            ViqeoIE,
-            ExpressenIE,
-            ZypeIE,
-            OnNetworkLoaderIE,
-            VimeoIE,
-            SoundcloudEmbedIE,
-            KalturaIE,
-            RtlNlIE,
-            TeachableIE,    # must be before Wistia
-            WistiaIE,
-            SVTIE,
-            XLinkIE,
-            LibsynIE,
-            VHXEmbedIE,
-            ArcPublishingIE,
-            MedialaanIE,
-            SimplecastIE,
-            SpreakerIE,
-            CastosHostedIE,
-        ):
+        embed_tags = None
+        for embie in self._EMBED_IES:
             try:
                 ie_key = embie.ie_key()
-                embie_urls = embie._extract_urls(webpage,
-                                                 url=url)
+                if embie in self._TAG_EMBED_IES:
+                    if embed_tags is None:
+                        embed_tags = self._scan_embed_tags(webpage)
+                    embie_urls = embie._extract_urls(embed_tags, url=url)
+                else:
+                    embie_urls = embie._extract_urls(webpage, url=url)
                 if embie_urls:
                     entries = []
                     for embie_url in embie_urls:
@@ -17,9 +17,23 @@ from ..utils import (
     url_or_none,
     urljoin,
     ExtractorError,
+    InAdvancePagedList,
 )
 
 
+class _PeerTubeVideoList(InAdvancePagedList):
+    """
+    Videos of a list, whose pages have a None in place of the elements that
+    are no longer available, so that every page but the last one is full.
+    They are left out once sliced.
+    """
+
+    def getslice(self, start=0, end=None):
+        return [
+            entry for entry in super(_PeerTubeVideoList, self).getslice(start, end)
+            if entry is not None]
+
+
 class PeerTubeBaseExtractor(SelfhostedInfoExtractor):
     _UUID_RE = r'[\da-zA-Z]{22}|[\da-fA-F]{8}-[\da-fA-F]{4}-[\da-fA-F]{4}-[\da-fA-F]{4}-[\da-fA-F]{12}'
     _API_BASE = 'https://%s/api/v1/%s/%s/%s'
@@ -32,6 +46,10 @@ class PeerTubeBaseExtractor(SelfhostedInfoExtractor):
     )
     _NETRC_MACHINE = 'peertube'
     _LOGIN_INFO = None
+    # The largest count the API accepts for lists of videos
+    _PAGE_SIZE = 100
+    # How many pages of a list of videos are downloaded at once
+    _CONCURRENT_PAGES = 4
 
     def _login(self):
         if self._LOGIN_INFO:
@@ -81,6 +99,32 @@ class PeerTubeBaseExtractor(SelfhostedInfoExtractor):
             } if self._LOGIN_INFO and self._LOGIN_INFO['instance'] == host else {},
             note=note, errnote=errnote, fatal=fatal)
 
+    def _paged_videos(self, host, resource, resource_id, query, note, parse_video):
+        """
+        Return the videos of a resource as a paged list. The first page tells
+        how many videos there are, so the other ones are downloaded a few at
+        once, as they are needed.
+        """
+        def download_page(pagenum):
+            return self._call_api(
+                host, resource, resource_id,
+                'videos?start=%d&count=%d%s' % (pagenum * self._PAGE_SIZE, self._PAGE_SIZE, query),
+                note='%s (page #%d)' % (note, pagenum))
+
+        first_page = download_page(0)
+
+        def fetch_page(pagenum):
+            videos = first_page if pagenum == 0 else download_page(pagenum)
+            for video in videos['data']:
+                # Skipped after slicing, so that the offsets of the pages
+                # match the ones of the API
+                yield parse_video(video) or None
+
+        total = int_or_none(first_page.get('total')) or 0
+        return _PeerTubeVideoList(
+            fetch_page, max((total + self._PAGE_SIZE - 1) // self._PAGE_SIZE, 1), self._PAGE_SIZE,
+            prefetch=self._CONCURRENT_PAGES)
+
     def _parse_video(self, video, url):
         host, display_id = self._match_id_and_host(url)
         info_dict = {}
@@ -348,16 +392,10 @@ class PeerTubePlaylistSHIE(PeerTubeBaseExtractor):
         self._login()
 
         playlist_data = self._call_api(host, 'video-playlists', display_id, '', 'Downloading playlist metadata')
-        entries = []
-        i = 0
-        videos = {'total': 0}
-        while len(entries) < videos['total'] or i == 0:
-            videos = self._call_api(host, 'video-playlists', display_id,
-                                    'videos?start=%d&count=25' % (i * 25),
-                                    note=('Downloading playlist video list (page #%d)' % i))
-            i += 1
-            for video in videos['data']:
-                entries.append(self._parse_video(video['video'], url))
+        # Elements of videos no longer available have no video
+        entries = self._paged_videos(
+            host, 'video-playlists', display_id, '', 'Downloading playlist video list',
+            lambda element: element.get('video') and self._parse_video(element['video'], url))
 
         return {
             '_type': 'playlist',
@@ -399,16 +437,9 @@ class PeerTubeChannelSHIE(PeerTubeBaseExtractor):
         self._login()
 
         channel_data = self._call_api(host, 'video-channels', display_id, '', 'Downloading channel metadata')
-        entries = []
-        i = 0
-        videos = {'total': 0}
-        while len(entries) < videos['total'] or i == 0:
-            videos = self._call_api(host, 'video-channels', display_id,
-                                    'videos?start=%d&count=25&sort=publishedAt' % (i * 25),
-                                    note=('Downloading channel video list (page #%d)' % i))
-            i += 1
-            for video in videos['data']:
-                entries.append(self._parse_video(video, url))
+        entries = self._paged_videos(
+            host, 'video-channels', display_id, '&sort=publishedAt', 'Downloading channel video list',
+            lambda video: self._parse_video(video, url))
 
         return {
             '_type': 'playlist',
@@ -451,16 +482,9 @@ class PeerTubeAccountSHIE(PeerTubeBaseExtractor):
         self._login()
 
         account_data = self._call_api(host, 'accounts', display_id, '', 'Downloading account metadata')
-        entries = []
-        i = 0
-        videos = {'total': 0}
-        while len(entries) < videos['total'] or i == 0:
-            videos = self._call_api(host, 'accounts', display_id,
-                                    'videos?start=%d&count=25&sort=publishedAt' % (i * 25),
-                                    note=('Downloading account video list (page #%d)' % i))
-            i += 1
-            for video in videos['data']:
-                entries.append(self._parse_video(video, url))
+        entries = self._paged_videos(
+            host, 'accounts', display_id, '&sort=publishedAt', 'Downloading account video list',
+            lambda video: self._parse_video(video, url))
 
         return {
             '_type': 'playlist',
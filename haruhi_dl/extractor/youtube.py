@@ -2,9 +2,11 @@
 from __future__ import unicode_literals
 
 from datetime import datetime
+import functools
 import json
 import hashlib
 from inspect import getsource
+import operator
 import random
 import re
 import time
@@ -29,6 +31,7 @@ from ..utils import (
     float_or_none,
     get_element_by_id,
     int_or_none,
+    LazyField,
     mimetype2ext,
     parse_codecs,
     parse_duration,
@@ -909,9 +912,13 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
     def _extract_signature_function(self, video_id, player_url):
         player_id = self._extract_player_info(player_url)
 
+        if player_id in self._player_cache:
+            return self._player_cache[player_id]
+
         # Read from filesystem cache
         cache_spec = self._downloader.cache.load('youtube-sigfuncs', player_id)
         if cache_spec is not None:
+            self._player_cache[player_id] = cache_spec
             return cache_spec
 
         if not player_url.startswith('http'):
@@ -928,6 +935,7 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         res = self._parse_sig_js(code)
 
         self._downloader.cache.store('youtube-sigfuncs', player_id, res)
+        self._player_cache[player_id] = res
         return res
 
     def _parse_sig_js(self, js_player):
@@ -966,7 +974,9 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         return decryptor_stack
 
     def _do_decrypt_signature(self, sig, stack):
-        a = list(sig)
+        return ''.join(self._apply_sig_stack(list(sig), stack))
+
+    def _apply_sig_stack(self, a, stack):
         for fun in stack:
             if fun[0] == 'splice':
                 a = a[fun[1]:]
@@ -976,7 +986,22 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                 a = self.mess(a, fun[1])
             else:
                 raise ExtractorError('Unknown stack action: %s' % (fun[0]))
-        return ''.join(a)
+        return a
+
+    def _signature_permutation(self, player_id, stack, sig_length):
+        """
+        Return a function picking the characters of a signature of the given
+        length that make up the decrypted one, in order
+        """
+        key = (player_id, sig_length)
+        permutation = self._player_cache.get(key)
+        if permutation is None:
+            # The stack only moves characters around, so running it once on
+            # their indices tells where each one ends up
+            idxs = self._apply_sig_stack(list(range(sig_length)), stack)
+            permutation = self._player_cache[key] = (
+                operator.itemgetter(*idxs) if idxs else lambda sig: ())
+        return permutation
 
     def _print_sig_code(self, func, example_sig):
         def gen_sig_code(idxs):
@@ -1032,7 +1057,9 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         if self._downloader.params.get('verbose'):
             self.to_screen("Built-in signature decryption failed, trying dynamic")
         sig_decrypt_stack = self._extract_signature_function(video_id, player_url)
-        return self._do_decrypt_signature(sig, sig_decrypt_stack)
+        permutation = self._signature_permutation(
+            self._extract_player_info(player_url), sig_decrypt_stack, len(sig))
+        return ''.join(permutation(sig))
 
     def _generate_prerelease_file(self):
         # It's Monday, so I'm in a bad mood, but at least my sailor uniform is super cute!
@@ -1626,7 +1653,42 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         streaming_formats = try_get(player_response, lambda x: x['streamingData']['formats'], list) or []
         streaming_formats.extend(try_get(player_response, lambda x: x['streamingData']['adaptiveFormats'], list) or [])
 
-        player_url = None
+        ASSETS_RE = r'"jsUrl":"(/s/player/.*?/player_ias.vflset/.*?/base.js)'
+        player_url = self._search_regex(
+            ASSETS_RE, video_webpage, 'JS player URL', default=None)
+        embed_player_url = []
+
+        def get_player_url():
+            if player_url or age_gate:
+                return player_url
+            if not embed_player_url:
+                # We need the embed website after all
+                embed_url = proto + '://www.youtube.com/embed/%s' % video_id
+                embed_webpage = self._download_webpage(
+                    embed_url, video_id, 'Downloading embed webpage')
+                embed_player_url.append(self._search_regex(
+                    ASSETS_RE, embed_webpage, 'JS player URL'))
+            return embed_player_url[0]
+
+        def signed_url_resolver(url, encrypted_sig, sp, format_id):
+            # Decrypting the signature needs the JS player, so it is only
+            # done for the formats that actually get used
+            def resolve_url():
+                format_player_url = get_player_url()
+                if self._downloader.params.get('verbose'):
+                    if format_player_url is None:
+                        player_desc = 'unknown'
+                    else:
+                        player_version = self._extract_player_info(format_player_url)
+                        player_desc = 'html5 player %s' % player_version
+                    parts_sizes = self._signature_cache_id(encrypted_sig)
+                    self.to_screen('{%s} signature length %s, %s' %
+                                   (format_id, parts_sizes, player_desc))
+
+                signature = self._full_signature_handling(encrypted_sig, format_player_url, video_id)
+                return url + '&%s=%s' % (sp, signature)
+            return resolve_url
+
         if not is_live and (streaming_formats or len(video_info.get('url_encoded_fmt_stream_map', [''])[0]) >= 1 or len(video_info.get('adaptive_fmts', [''])[0]) >= 1):
             formats = []
             formats_spec = {}
@@ -1686,39 +1748,12 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                     continue
                 format_id = compat_str(format_id)
 
+                encrypted_sig = None
                 if cipher:
-                    if 's' in url_data or self._downloader.params.get('youtube_include_dash_manifest', True):
-                        ASSETS_RE = r'"jsUrl":"(/s/player/.*?/player_ias.vflset/.*?/base.js)'
-
-                        player_url = self._search_regex(
-                            ASSETS_RE, video_webpage, '', default=player_url)
-
-                        if not player_url and not age_gate:
-                            # We need the embed website after all
-                            embed_url = proto + '://www.youtube.com/embed/%s' % video_id
-                            embed_webpage = self._download_webpage(
-                                embed_url, video_id, 'Downloading embed webpage')
-                            player_url = self._search_regex(
-                                ASSETS_RE, embed_webpage, 'JS player URL')
-
                     if 'sig' in url_data:
                         url += '&signature=' + url_data['sig'][0]
                     elif 's' in url_data:
                         encrypted_sig = url_data['s'][0]
-
-                        if self._downloader.params.get('verbose'):
-                            if player_url is None:
-                                player_desc = 'unknown'
-                            else:
-                                player_version = self._extract_player_info(player_url)
-                                player_desc = 'html5 player %s' % player_version
-                            parts_sizes = self._signature_cache_id(encrypted_sig)
-                            self.to_screen('{%s} signature length %s, %s' %
-                                           (format_id, parts_sizes, player_desc))
-
-                        signature = self._full_signature_handling(encrypted_sig, player_url, video_id)
-                        sp = try_get(url_data, lambda x: x['sp'][0], compat_str) or 'signature'
-                        url += '&%s=%s' % (sp, signature)
                 if 'ratebypass' not in url:
                     url += '&ratebypass=yes'
 
@@ -1727,6 +1762,9 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                     'url': url,
                     'player_url': player_url,
                 }
+                if encrypted_sig:
+                    sp = try_get(url_data, lambda x: x['sp'][0], compat_str) or 'signature'
+                    dct['_resolve_url'] = signed_url_resolver(url, encrypted_sig, sp, format_id)
                 if format_id in self._formats:
                     dct.update(self._formats[format_id])
                 if format_id in formats_spec:
@@ -2027,10 +2065,6 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
             float_or_none(video_details.get('averageRating'))
             or try_get(video_info, lambda x: float_or_none(x['avg_rating'][0])))
 
-        # subtitles
-        video_subtitles = self.extract_subtitles(video_id, video_webpage)
-        automatic_captions = self.extract_automatic_captions(video_id, video_webpage)
-
         video_duration = try_get(
             video_info, lambda x: int_or_none(x['length_seconds'][0]))
         if not video_duration:
@@ -2058,56 +2092,73 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                     errnote='Unable to download video annotations', fatal=False,
                     data=urlencode_postdata({xsrf_field_name: xsrf_token}))
 
-        chapters = self._extract_chapters(video_webpage, description_original, video_id, video_duration)
+        chapters = LazyField(
+            self._extract_chapters, video_webpage, description_original, video_id, video_duration)
 
         # Look for the DASH manifest
+        dash_mpd_urls = []
         if self._downloader.params.get('youtube_include_dash_manifest', True):
-            dash_mpd_fatal = True
             for mpd_url in dash_mpds:
-                dash_formats = {}
                 try:
                     def decrypt_sig(mobj):
                         s = mobj.group(1)
-                        dec_s = self._full_signature_handling(s, player_url, video_id)
+                        dec_s = self._full_signature_handling(s, get_player_url(), video_id)
                         return '/signature/%s' % dec_s
 
-                    mpd_url = re.sub(r'/s/([a-fA-F0-9\.]+)', decrypt_sig, mpd_url)
-
-                    for df in self._extract_mpd_formats(
-                            mpd_url, video_id, fatal=dash_mpd_fatal,
-                            formats_dict=self._formats):
-                        if not df.get('filesize'):
-                            df['filesize'] = _extract_filesize(df['url'])
-                        # Despite that the audio file is fragmented by every ~10 seconds,
-                        # YouTube doesn't care if you just request the byte range of a whole file,
-                        # so we just make it the HTTPS file instead of fragmented DASH
-                        bytesize = self._search_regex(r'^range/\d+-(\d+)', df['fragments'][-1]['path'], 'filesize', default=None)
-                        if bytesize:
-                            df['url'] = '%srange/0-%s' % (df['fragment_base_url'], bytesize)
-                            df['protocol'] = 'https'
-                            df['fragments'] = None
-                            df['format_note'] = None
-                            df['container'] = None
-                        # Do not overwrite DASH format found in some previous DASH manifest
-                        if df['format_id'] not in dash_formats:
-                            dash_formats[df['format_id']] = df
-                        # Additional DASH manifests may end up in HTTP Error 403 therefore
-                        # allow them to fail without bug report message if we already have
-                        # some DASH manifest succeeded. This is temporary workaround to reduce
-                        # burst of bug reports until we figure out the reason and whether it
-                        # can be fixed at all.
-                        dash_mpd_fatal = False
-                except (ExtractorError, KeyError) as e:
+                    dash_mpd_urls.append(re.sub(r'/s/([a-fA-F0-9\.]+)', decrypt_sig, mpd_url))
+                except ExtractorError as e:
                     self.report_warning(
                         'Skipping DASH manifest: %r' % e, video_id)
-                if dash_formats:
-                    # Remove the formats we found through non-DASH, they
-                    # contain less info and it can be wrong, because we use
-                    # fixed values (for example the resolution). See
-                    # https://github.com/ytdl-org/youtube-dl/issues/5774 for an
-                    # example.
-                    formats = [f for f in formats if f['format_id'] not in dash_formats.keys()]
-                    formats.extend(dash_formats.values())
+
+        def extract_dash_formats(mpd_url):
+            # Additional DASH manifests may end up in HTTP Error 403 therefore
+            # allow them to fail without bug report message
+            try:
+                return self._extract_mpd_formats(
+                    mpd_url, video_id, fatal=False, formats_dict=self._formats)
+            except ExtractorError as e:
+                self.report_warning(
+                    'Skipping DASH manifest: %r' % e, video_id)
+                return []
+
+        # Subtitles, automatic captions and DASH manifests do not depend on
+        # each other
+        results = self._run_concurrently(
+            lambda: self.extract_subtitles(video_id, video_webpage),
+            lambda: self.extract_automatic_captions(video_id, video_webpage),
+            *[functools.partial(extract_dash_formats, mpd_url) for mpd_url in dash_mpd_urls])
+        video_subtitles, automatic_captions = results[:2]
+
+        for mpd_formats in results[2:]:
+            dash_formats = {}
+            try:
+                for df in mpd_formats:
+                    if not df.get('filesize'):
+                        df['filesize'] = _extract_filesize(df['url'])
+                    # Despite that the audio file is fragmented by every ~10 seconds,
+                    # YouTube doesn't care if you just request the byte range of a whole file,
+                    # so we just make it the HTTPS file instead of fragmented DASH
+                    bytesize = self._search_regex(r'^range/\d+-(\d+)', df['fragments'][-1]['path'], 'filesize', default=None)
+                    if bytesize:
+                        df['url'] = '%srange/0-%s' % (df['fragment_base_url'], bytesize)
+                        df['protocol'] = 'https'
+                        df['fragments'] = None
+                        df['format_note'] = None
+                        df['container'] = None
+                    # Do not overwrite DASH format found in some previous DASH manifest
+                    if df['format_id'] not in dash_formats:
+                        dash_formats[df['format_id']] = df
+            except (ExtractorError, KeyError) as e:
+                self.report_warning(
+                    'Skipping DASH manifest: %r' % e, video_id)
+            if dash_formats:
+                # Remove the formats we found through non-DASH, they
+                # contain less info and it can be wrong, because we use
+                # fixed values (for example the resolution). See
+                # https://github.com/ytdl-org/youtube-dl/issues/5774 for an
+                # example.
+                formats = [f for f in formats if f['format_id'] not in dash_formats.keys()]
+                formats.extend(dash_formats.values())
 
         # Check for malformed aspect ratio
         stretched_m = re.search(
@@ -2270,28 +2321,12 @@ class YoutubeBaseListInfoExtractor(YoutubeBaseInfoExtractor):
             else:
                 self.report_warning(alert_msg, video_id=list_id)
         videos = self._parse_init_video_list(data)
-        entries = videos['entries']
-        continuation_token = videos['continuation']
-        if continuation_token and (not is_search or results):
-            session_id = self._search_regex(r'ytcfg\.set\({.*?"DELEGATED_SESSION_ID":"(\d+)"',
-                                            webpage, 'session id', default=None)
-            page_no = 2
-            while continuation_token is not None and (len(entries) < results if results else True):
-                cont_res = self._download_continuation(continuation_token, list_id, page_no, session_id=session_id)
-                cont_parser = self._parse_continuation_video_list
-                if not cont_parser:
-                    cont_parser = self._parse_init_video_list
-                cont = cont_parser(cont_res)
-                continuation_token = cont['continuation']
-                if len(cont['entries']) == 0:
-                    break
-                entries.extend(cont['entries'])
-                page_no += 1
 
         info_dict = {
             '_type': 'playlist',
             'id': list_id,
-            'entries': [],
+            'entries': self._entries(
+                videos, list_id, webpage, results=results, paginate=not is_search or results),
         }
         if 'info_dict' in videos:
             info_dict.update(videos['info_dict'])
@@ -2301,19 +2336,44 @@ class YoutubeBaseListInfoExtractor(YoutubeBaseInfoExtractor):
             else:
                 info_dict['title'] = self._og_search_title(webpage)
 
-        for _entry in entries:
-            if _entry:
+        return info_dict
+
+    def _entries(self, videos, list_id, webpage, results=None, paginate=True):
+        """
+        Generate the entries of the list, downloading the continuation pages
+        only as they are needed
+        """
+        session_id = None
+        page_no = 1
+        n_entries = 0
+        while True:
+            for _entry in videos['entries']:
+                if not _entry:
+                    continue
                 entry = {
                     '_type': 'url',
                     'url': self._ENTRY_URL_TPL % (_entry['id']),
                     'ie_key': self._ENTRY_IE_KEY,
                 }
                 entry.update(_entry)
-                info_dict['entries'].append(entry)
-                if results and len(info_dict['entries']) >= results:
-                    break
-
-        return info_dict
+                yield entry
+                n_entries += 1
+                if results and n_entries >= results:
+                    return
+            continuation_token = videos['continuation']
+            if not paginate or continuation_token is None:
+                return
+            if page_no == 1:
+                session_id = self._search_regex(r'ytcfg\.set\({.*?"DELEGATED_SESSION_ID":"(\d+)"',
+                                                webpage, 'session id', default=None)
+            page_no += 1
+            cont_res = self._download_continuation(continuation_token, list_id, page_no, session_id=session_id)
+            cont_parser = self._parse_continuation_video_list
+            if not cont_parser:
+                cont_parser = self._parse_init_video_list
+            videos = cont_parser(cont_res)
+            if len(videos['entries']) == 0:
+                return
 
 
 class YoutubeYti1ListInfoExtractor(YoutubeBaseListInfoExtractor):
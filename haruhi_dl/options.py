@@ -356,6 +356,10 @@ def parseOpts(overrideArguments=None):
         '--download-archive', metavar='FILE',
         dest='download_archive',
         help='Download only videos not listed in the archive file. Record the IDs of all downloaded videos in it.')
+    selection.add_option(
+        '--break-on-existing',
+        metavar='NUMBER', dest='break_on_existing', type=int, default=None,
+        help='Stop going through a playlist once NUMBER entries in a row are found in the download archive')
     selection.add_option(
         '--include-ads',
         dest='include_ads', action='store_true',
@@ -493,6 +497,10 @@ def parseOpts(overrideArguments=None):
         '--keep-fragments',
         action='store_true', dest='keep_fragments', default=False,
         help='Keep downloaded fragments on disk after downloading is finished; fragments are erased by default')
+    downloader.add_option(
+        '-N', '--concurrent-fragments',
+        dest='concurrent_fragment_downloads', metavar='N', default=1, type=int,
+        help='Number of fragments to download concurrently (default is %default) (DASH and hlsnative)')
     downloader.add_option(
         '--buffer-size',
         dest='buffersize', metavar='SIZE', default='1024',
@@ -506,6 +514,11 @@ def parseOpts(overrideArguments=None):
         dest='http_chunk_size', metavar='SIZE', default=None,
         help='Size of a chunk for chunk-based HTTP downloading (e.g. 10485760 or 10M) (default is disabled). '
              'May be useful for bypassing bandwidth throttling imposed by a webserver (experimental)')
+    downloader.add_option(
+        '--http-connections',
+        dest='http_connections', metavar='N', default=1, type=int,
+        help='Number of connections to download a single HTTP file over, in pieces of --http-chunk-size '
+             'if given (default is %default)')
     downloader.add_option(
         '--test',
         action='store_true', dest='test', default=False,
@@ -518,6 +531,10 @@ def parseOpts(overrideArguments=None):
         '--playlist-random',
         action='store_true',
         help='Download playlist videos in random order')
+    downloader.add_option(
+        '--concurrent-playlist-entries',
+        dest='concurrent_playlist_entries', metavar='N', default=1, type=int,
+        help='Number of playlist videos to extract and download concurrently (default is %default)')
     downloader.add_option(
         '--xattr-set-filesize',
         dest='xattr_set_filesize', action='store_true',
@@ -525,7 +542,7 @@ def parseOpts(overrideArguments=None):
     downloader.add_option(
         '--hls-prefer-native',
         dest='hls_prefer_native', action='store_true', default=None,
-        help='Use the native HLS downloader instead of ffmpeg')
+        help='Use the native HLS downloader instead of ffmpeg, also for live streams')
     downloader.add_option(
         '--hls-prefer-ffmpeg',
         dest='hls_prefer_native', action='store_false', default=None,
@@ -803,6 +820,18 @@ def parseOpts(overrideArguments=None):
     filesystem.add_option(
         '--no-cache-dir', action='store_const', const=False, dest='cachedir',
         help='Disable filesystem caching')
+    filesystem.add_option(
+        '--cache-backend', dest='cache_backend', default=None, metavar='BACKEND',
+        help='How to store the cache: "sqlite" for a single database file (default if Python has sqlite3) '
+             'or "dir" for a file per entry. Entries of the "dir" layout are moved into the database')
+    filesystem.add_option(
+        '--http-cache',
+        action='store_true', dest='http_cache', default=False,
+        help='Keep the webpages and API responses downloaded by extractors in the cache directory, '
+             'and revalidate them rather than downloading them again when the server allows it')
+    filesystem.add_option(
+        '--http-cache-size', dest='http_cache_size', default=None, metavar='SIZE',
+        help='Maximum size of the HTTP cache (e.g. 50M, default is 100M)')
     filesystem.add_option(
         '--rm-cache-dir',
         action='store_true', dest='rm_cachedir',
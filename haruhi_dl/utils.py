@@ -8,6 +8,7 @@ import binascii
 import calendar
 import codecs
 import collections
+import concurrent.futures
 import contextlib
 import ctypes
 import datetime
@@ -31,6 +32,7 @@ import ssl
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import traceback
 import xml.etree.ElementTree
@@ -2548,6 +2550,141 @@ def handle_youtubedl_headers(headers):
     return filtered_headers
 
 
+class HTTPConnectionPool(object):
+    """Keep-alive connections shared by the HTTP and HTTPS handlers.
+
+    A connection is handed back to the pool once the body of its response
+    has been read completely, and is reused by the next request going to
+    the same place: the key includes the scheme, the host and port (of the
+    HTTP proxy if there is one), the tunnelled host and the SOCKS proxy, so
+    per-request proxies get connections of their own. --source-address
+    applies to the connections of the handler, like it does without the
+    pool.
+    """
+
+    # Idle connections kept per key
+    MAX_IDLE = 8
+    # Requests that can be sent again if a reused connection turns out to be
+    # closed, as the server may have processed them anyway (RFC 7231, 4.2.2)
+    IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._stats = {
+            'requests': 0,
+            'connections': 0,
+            'reused': 0,
+            'stale': 0,
+        }
+
+    def stats(self):
+        """
+        Return a dictionary with the number of requests sent, connections
+        opened, requests sent over a reused connection and reused connections
+        that had been closed by the server in the meantime.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _get(self, key):
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop()
+
+    def _put(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.MAX_IDLE:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def do_open(self, handler, http_class, req, socks_proxy=None, **http_conn_args):
+        """Like AbstractHTTPHandler.do_open(), without Connection: close"""
+        host = req.host
+        if not host:
+            raise compat_urllib_error.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+        headers = dict((name.title(), val) for name, val in headers.items())
+        tunnel_headers = {}
+        if req._tunnel_host and 'Proxy-Authorization' in headers:
+            tunnel_headers['Proxy-Authorization'] = headers.pop('Proxy-Authorization')
+        key = (
+            req.type, host, req._tunnel_host,
+            tunnel_headers.get('Proxy-Authorization'), socks_proxy)
+
+        method = req.get_method()
+        self._count('requests')
+        while True:
+            h = self._get(key)
+            reused = h is not None
+            if reused:
+                h.timeout = req.timeout
+                if h.sock is not None:
+                    h.sock.settimeout(req.timeout)
+                self._count('reused')
+            else:
+                h = http_class(host, timeout=req.timeout, **http_conn_args)
+                h.set_debuglevel(handler._debuglevel)
+                if req._tunnel_host:
+                    h.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+                self._count('connections')
+            try:
+                try:
+                    h.request(
+                        method, req.selector, req.data, headers,
+                        encode_chunked=req.has_header('Transfer-encoding'))
+                except socket.error as err:
+                    raise compat_urllib_error.URLError(err)
+                r = h.getresponse()
+            except Exception as err:
+                h.close()
+                # The server may have closed an idle connection in the
+                # meantime. Retry on a new one, unless sending the request
+                # again could repeat its effects
+                if (reused and method in self.IDEMPOTENT_METHODS
+                        and isinstance(getattr(err, 'reason', err), (
+                            ConnectionError, ssl.SSLError, compat_http_client.BadStatusLine))):
+                    self._count('stale')
+                    continue
+                raise
+            break
+
+        if r.will_close:
+            h.close()
+        else:
+            close_conn = r._close_conn
+
+            def _close_conn():
+                # Called when the whole body has been read, or by close()
+                body_read = not r.closed
+                close_conn()
+                if body_read:
+                    self._put(key, h)
+                else:
+                    h.close()
+            r._close_conn = _close_conn
+
+        r.url = req.get_full_url()
+        r.msg = r.reason
+        return r
+
+
 class HaruhiDLHandler(compat_urllib_request.HTTPHandler):
     """Handler for HTTP requests and responses.
 
@@ -2567,6 +2704,7 @@ class HaruhiDLHandler(compat_urllib_request.HTTPHandler):
     """
 
     def __init__(self, params, *args, **kwargs):
+        self._connection_pool = kwargs.pop('connection_pool', None)
         compat_urllib_request.HTTPHandler.__init__(self, *args, **kwargs)
         self._params = params
 
@@ -2578,9 +2716,12 @@ class HaruhiDLHandler(compat_urllib_request.HTTPHandler):
             conn_class = make_socks_conn_class(conn_class, socks_proxy)
             del req.headers['Ytdl-socks-proxy']
 
-        return self.do_open(functools.partial(
-            _create_http_connection, self, conn_class, False),
-            req)
+        http_class = functools.partial(
+            _create_http_connection, self, conn_class, False)
+        if self._connection_pool is not None:
+            return self._connection_pool.do_open(
+                self, http_class, req, socks_proxy=socks_proxy)
+        return self.do_open(http_class, req)
 
     @staticmethod
     def deflate(data):
@@ -2716,6 +2857,7 @@ def make_socks_conn_class(base_class, socks_proxy):
 
 class HaruhiDLHTTPSHandler(compat_urllib_request.HTTPSHandler):
     def __init__(self, params, https_conn_class=None, *args, **kwargs):
+        self._connection_pool = kwargs.pop('connection_pool', None)
         compat_urllib_request.HTTPSHandler.__init__(self, *args, **kwargs)
         self._https_conn_class = https_conn_class or compat_http_client.HTTPSConnection
         self._params = params
@@ -2734,9 +2876,12 @@ class HaruhiDLHTTPSHandler(compat_urllib_request.HTTPSHandler):
             conn_class = make_socks_conn_class(conn_class, socks_proxy)
             del req.headers['Ytdl-socks-proxy']
 
-        return self.do_open(functools.partial(
-            _create_http_connection, self, conn_class, True),
-            req, **kwargs)
+        http_class = functools.partial(
+            _create_http_connection, self, conn_class, True)
+        if self._connection_pool is not None:
+            return self._connection_pool.do_open(
+                self, http_class, req, socks_proxy=socks_proxy, **kwargs)
+        return self.do_open(http_class, req, **kwargs)
 
 
 class HaruhiDLCookieJar(compat_cookiejar.MozillaCookieJar):
@@ -3327,12 +3472,12 @@ else:
 
 class locked_file(object):
     def __init__(self, filename, mode, encoding=None):
-        assert mode in ['r', 'a', 'w']
+        assert mode in ['r', 'rb', 'a', 'w']
         self.f = io.open(filename, mode, encoding=encoding)
         self.mode = mode
 
     def __enter__(self):
-        exclusive = self.mode != 'r'
+        exclusive = self.mode not in ('r', 'rb')
         try:
             _lock_file(self.f, exclusive)
         except IOError:
@@ -3355,6 +3500,12 @@ class locked_file(object):
     def read(self, *args):
         return self.f.read(*args)
 
+    def seek(self, *args):
+        return self.f.seek(*args)
+
+    def tell(self):
+        return self.f.tell()
+
 
 def get_filesystem_encoding():
     encoding = sys.getfilesystemencoding()
@@ -3808,35 +3959,138 @@ def detect_exe_version(output, version_re=None, unrecognized='present'):
         return unrecognized
 
 
-class PagedList(object):
-    def __len__(self):
-        # This is only useful for tests
-        return len(self.getslice())
+def run_concurrently(funcs, max_workers):
+    """
+    Call funcs, functions taking no arguments, in up to max_workers threads
+    and return the list of their results, in the same order.
 
+    All the calls are waited for. If any of them raised an exception, the
+    one of the first such call is raised afterwards.
+    """
+    if len(funcs) <= 1 or max_workers <= 1:
+        return [func() for func in funcs]
+    with concurrent.futures.ThreadPoolExecutor(min(len(funcs), max_workers)) as executor:
+        futures = [executor.submit(func) for func in funcs]
+    return [future.result() for future in futures]
 
-class OnDemandPagedList(PagedList):
-    def __init__(self, pagefunc, pagesize, use_cache=True):
+
+class LazyField(object):
+    """
+    Value of an info dict field computed only once something needs it, by
+    calling func(*args, **kwargs) the first time get() is called
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._computed = False
+        self._value = None
+
+    def __deepcopy__(self, memo):
+        # Copies of an info dict share the value, computed at most once
+        return self
+
+    def get(self):
+        with self._lock:
+            if not self._computed:
+                self._value = self._func(*self._args, **self._kwargs)
+                self._computed = True
+                # What the value was computed from is not needed any more
+                self._func = self._args = self._kwargs = None
+        return self._value
+
+
+class PagedList(object):
+    """
+    Base class of lists of results fetched page by page with pagefunc.
+
+    Fetched pages are kept in a cache shared by the getslice() calls, of up
+    to cache_size pages (least recently used ones are dropped first, None
+    for no limit) if use_cache is set. With prefetch set to a positive
+    number, up to that many of the next pages are fetched in background
+    threads while a page is being used. Pages are still returned in order,
+    and an error fetching a page is only raised once that page is needed.
+    The prefetching threads are stopped once getslice() returns.
+    """
+
+    def __init__(self, pagefunc, pagesize, use_cache=True, cache_size=None, prefetch=0):
         self._pagefunc = pagefunc
         self._pagesize = pagesize
         self._use_cache = use_cache
-        if use_cache:
-            self._cache = {}
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._prefetch = prefetch
+        self._prefetched = {}
+        self._executor = None
+
+    def __len__(self):
+        # This is only useful for tests
+        return len(self.getslice())
 
     def getslice(self, start=0, end=None):
+        try:
+            return self._getslice(start, end)
+        finally:
+            self._stop_prefetching()
+
+    def _getslice(self, start, end):
+        raise NotImplementedError('This method must be implemented by subclasses')
+
+    def _fetch_page(self, pagenum):
+        return list(self._pagefunc(pagenum))
+
+    def _stop_prefetching(self):
+        if self._executor is None:
+            return
+        # Pages that are not being fetched yet will not be needed
+        for future in self._prefetched.values():
+            future.cancel()
+        self._executor.shutdown()
+        self._executor = None
+        self._prefetched = {}
+
+    def _get_page(self, pagenum, last_pagenum=None):
+        """
+        Return the results of a page, prefetching the following ones up to
+        last_pagenum (if known)
+        """
+        if self._prefetch > 0:
+            prefetch_end = pagenum + self._prefetch
+            if last_pagenum is not None:
+                prefetch_end = min(prefetch_end, last_pagenum)
+            for next_pagenum in range(pagenum + 1, prefetch_end + 1):
+                if next_pagenum in self._cache or next_pagenum in self._prefetched:
+                    continue
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(self._prefetch)
+                self._prefetched[next_pagenum] = self._executor.submit(self._fetch_page, next_pagenum)
+
+        page_results = self._cache.get(pagenum)
+        if page_results is not None:
+            self._cache.move_to_end(pagenum)
+            return page_results
+        future = self._prefetched.pop(pagenum, None)
+        page_results = future.result() if future else self._fetch_page(pagenum)
+        if self._use_cache:
+            self._cache[pagenum] = page_results
+            if self._cache_size is not None and len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return page_results
+
+
+class OnDemandPagedList(PagedList):
+    def _getslice(self, start, end):
         res = []
+        last_pagenum = None if end is None else max(end - 1, 0) // self._pagesize
         for pagenum in itertools.count(start // self._pagesize):
             firstid = pagenum * self._pagesize
             nextfirstid = pagenum * self._pagesize + self._pagesize
             if start >= nextfirstid:
                 continue
 
-            page_results = None
-            if self._use_cache:
-                page_results = self._cache.get(pagenum)
-            if page_results is None:
-                page_results = list(self._pagefunc(pagenum))
-            if self._use_cache:
-                self._cache[pagenum] = page_results
+            page_results = self._get_page(pagenum, last_pagenum)
 
             startv = (
                 start % self._pagesize
@@ -3867,12 +4121,11 @@ class OnDemandPagedList(PagedList):
 
 
 class InAdvancePagedList(PagedList):
-    def __init__(self, pagefunc, pagecount, pagesize):
-        self._pagefunc = pagefunc
+    def __init__(self, pagefunc, pagecount, pagesize, use_cache=False, **kwargs):
+        super(InAdvancePagedList, self).__init__(pagefunc, pagesize, use_cache=use_cache, **kwargs)
         self._pagecount = pagecount
-        self._pagesize = pagesize
 
-    def getslice(self, start=0, end=None):
+    def _getslice(self, start, end):
         res = []
         start_page = start // self._pagesize
         end_page = (
@@ -3880,7 +4133,7 @@ class InAdvancePagedList(PagedList):
         skip_elems = start - start_page * self._pagesize
         only_more = None if end is None else end - start
         for pagenum in range(start_page, end_page):
-            page = list(self._pagefunc(pagenum))
+            page = self._get_page(pagenum, min(end_page, self._pagecount) - 1)
             if skip_elems:
                 page = page[skip_elems:]
                 skip_elems = None
@@ -10,8 +10,11 @@ import unittest
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import copy
+import json
+import threading
+import time
 
-from test.helper import FakeHDL, assertRegexpMatches
+from test.helper import FakeHDL, assertRegexpMatches, try_rm
 from haruhi_dl import HaruhiDL
 from haruhi_dl.compat import compat_str, compat_urllib_error
 
@@ -20,7 +23,7 @@ from haruhi_dl.compat import compat_str, compat_urllib_error
 from haruhi_dl.extractor.youtube import YoutubeIE
 from haruhi_dl.extractor.common import InfoExtractor
 from haruhi_dl.postprocessor.common import PostProcessor
-from haruhi_dl.utils import ExtractorError, match_filter_func
+from haruhi_dl.utils import ExtractorError, LazyField, MaxDownloadsReached, match_filter_func
 
 TEST_URL = 'http://localhost/sample.mp4'
 
@@ -457,6 +460,56 @@ class TestFormatSelection(unittest.TestCase):
         hdl.process_ie_result(info_dict.copy())
         self.assertEqual(hdl.downloaded_info_dicts[0]['format_id'], 'video+audio')
 
+    def test_lazy_format_urls(self):
+        resolved = []
+
+        def resolver(format_id):
+            def resolve_url():
+                resolved.append(format_id)
+                return TEST_URL + '?sig=' + format_id
+            return resolve_url
+
+        def make_formats():
+            return [
+                {'format_id': 'worst', 'height': 144, 'acodec': 'none',
+                 'url': TEST_URL, '_resolve_url': resolver('worst')},
+                {'format_id': 'video', 'height': 720, 'acodec': 'none',
+                 'url': TEST_URL, '_resolve_url': resolver('video')},
+                {'format_id': 'audio', 'vcodec': 'none',
+                 'url': TEST_URL, '_resolve_url': resolver('audio')},
+            ]
+
+        # Only the selected formats are resolved
+        hdl = HDL({'format': 'bestvideo+bestaudio', 'writeinfojson': False})
+        hdl.process_ie_result(_make_result(make_formats()))
+        self.assertEqual(sorted(resolved), ['audio', 'video'])
+        downloaded = hdl.downloaded_info_dicts[0]
+        self.assertEqual(
+            [f['url'] for f in downloaded['requested_formats']],
+            [TEST_URL + '?sig=video', TEST_URL + '?sig=audio'])
+        self.assertNotIn('_resolve_url', downloaded['requested_formats'][0])
+
+        # Nothing needs the URLs
+        resolved[:] = []
+        hdl = HDL({'format': 'bestvideo', 'simulate': True, 'writeinfojson': False, 'forceid': True})
+        hdl.process_ie_result(_make_result(make_formats()))
+        self.assertEqual(resolved, [])
+        self.assertEqual(hdl.downloaded_info_dicts[0]['url'], TEST_URL)
+
+        hdl = HDL({'format': 'bestvideo', 'simulate': True, 'writeinfojson': False, 'forceurl': True})
+        hdl.process_ie_result(_make_result(make_formats()))
+        self.assertEqual(resolved, ['video'])
+        self.assertEqual(hdl.downloaded_info_dicts[0]['url'], TEST_URL + '?sig=video')
+
+        # The whole info dict is printed
+        resolved[:] = []
+        hdl = HDL({'format': 'bestvideo', 'simulate': True, 'writeinfojson': False, 'forcejson': True})
+        info_dict = hdl.process_ie_result(_make_result(make_formats()))
+        self.assertEqual(sorted(resolved), ['audio', 'video', 'worst'])
+        for f in info_dict['formats']:
+            self.assertEqual(f['url'], TEST_URL + '?sig=' + f['format_id'])
+            self.assertNotIn('_resolve_url', f)
+
     def test_invalid_format_specs(self):
         def assert_syntax_error(format_spec):
             hdl = HDL({'format': format_spec})
@@ -614,6 +667,75 @@ class TestHaruhiDL(unittest.TestCase):
         self.assertTrue(subs['es']['_auto'])
         self.assertTrue(subs['pt']['_auto'])
 
+    def test_lazy_fields(self):
+        computed = []
+
+        def compute(field, value):
+            computed.append(field)
+            return value
+
+        def get_info(params, download=True):
+            params.setdefault('simulate', True)
+            params.setdefault('writeinfojson', False)
+            hdl = HDL(params)
+            info_dict = {
+                'id': 'test',
+                'title': 'Test',
+                'url': TEST_URL,
+                'extractor': 'TEST',
+                'subtitles': LazyField(compute, 'subtitles', {
+                    'en': [{'url': 'http://localhost/video.en.vtt'}]}),
+                'automatic_captions': LazyField(compute, 'automatic_captions', {}),
+                'chapters': LazyField(compute, 'chapters', [{'start_time': 0, 'end_time': 10}]),
+                'thumbnails': LazyField(compute, 'thumbnails', [{'url': 'http://localhost/t.jpg'}]),
+            }
+            computed[:] = []
+            return hdl.process_video_result(info_dict, download=download)
+
+        get_info({'forcetitle': True, 'forceid': True})
+        self.assertEqual(computed, [])
+
+        result = get_info({'writesubtitles': True})
+        self.assertEqual(computed, ['subtitles'])
+        self.assertEqual(result['requested_subtitles']['en']['ext'], 'vtt')
+        # Neither computed nor kept around once downloaded
+        self.assertNotIn('chapters', result)
+        self.assertNotIn('automatic_captions', result)
+
+        get_info({'listsubtitles': True})
+        self.assertEqual(sorted(computed), ['automatic_captions', 'subtitles'])
+
+        result = get_info({'outtmpl': '%(title)s-%(thumbnail)s.%(ext)s'})
+        self.assertEqual(computed, ['thumbnails'])
+        self.assertEqual(result['thumbnail'], 'http://localhost/t.jpg')
+
+        for params in ({'forcejson': True}, {'match_filter': lambda info_dict: None}, {}):
+            result = get_info(params, download=bool(params))
+            self.assertEqual(
+                sorted(computed), ['automatic_captions', 'chapters', 'subtitles', 'thumbnails'])
+            self.assertEqual(result['chapters'], [{'start_time': 0, 'end_time': 10}])
+
+    def test_lazy_fields_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def compute(value):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return value
+
+        info_dict = dict(
+            ('field%d' % i, LazyField(compute, i)) for i in range(10))
+        info_dict['id'] = 'test'
+        HaruhiDL._resolve_lazy_fields(info_dict)
+        self.assertEqual(info_dict['field9'], 9)
+        self.assertEqual(info_dict['id'], 'test')
+        self.assertLessEqual(running[1], HaruhiDL._MAX_CONCURRENT_LAZY_FIELDS)
+
     def test_add_extra_info(self):
         test_dict = {
             'extractor': 'Foo',
@@ -626,6 +748,35 @@ class TestHaruhiDL(unittest.TestCase):
         self.assertEqual(test_dict['extractor'], 'Foo')
         self.assertEqual(test_dict['playlist'], 'funny videos')
 
+    def test_filter_requested_info(self):
+        manifest = {'url': TEST_URL, 'data': '#EXTM3U'}
+        fmt = {'format_id': 'hls', 'url': TEST_URL, '_hls_manifest': manifest}
+        info_dict = {
+            'id': '1', '_type': 'video', '_filename': 'f.mp4',
+            'formats': [fmt], 'requested_formats': [fmt],
+            'requested_subtitles': {}, '_hls_manifest': manifest,
+        }
+        self.assertEqual(HaruhiDL.filter_requested_info(info_dict), {
+            'id': '1', '_type': 'video', '_filename': 'f.mp4',
+            'formats': [{'format_id': 'hls', 'url': TEST_URL}],
+        })
+        self.assertEqual(
+            HaruhiDL._public_info({'_type': 'playlist', 'entries': [info_dict]})['entries'][0]['requested_formats'],
+            [{'format_id': 'hls', 'url': TEST_URL}])
+        # The info dict is left untouched
+        self.assertEqual(fmt['_hls_manifest'], manifest)
+
+        # Formats whose URL was never resolved, e.g. not selected or with
+        # process=False, can still be dumped as JSON
+        fmt = {'format_id': 'sig', '_resolve_url': lambda: TEST_URL}
+        info_dict = {'id': '1', 'formats': [fmt], '_resolve_url': fmt['_resolve_url']}
+        self.assertEqual(
+            json.loads(json.dumps(HaruhiDL.filter_requested_info(info_dict))),
+            {'id': '1', 'formats': [{'format_id': 'sig'}]})
+        self.assertEqual(
+            json.loads(json.dumps(HaruhiDL._public_info({'_type': 'playlist', 'entries': [info_dict]}))),
+            {'_type': 'playlist', 'entries': [{'id': '1', 'formats': [{'format_id': 'sig'}]}]})
+
     def test_prepare_filename(self):
         info = {
             'id': '1234',
@@ -883,6 +1034,115 @@ class TestHaruhiDL(unittest.TestCase):
         self.assertEqual(result[1]['playlist_index'], 2)
         # @}
 
+    def test_lazy_playlist_max_downloads(self):
+        listed = []
+
+        def entries():
+            for i in range(1, 101):
+                listed.append(i)
+                yield {
+                    'id': compat_str(i),
+                    'title': compat_str(i),
+                    'url': TEST_URL,
+                }
+
+        hdl = FakeHDL({'max_downloads': 2, 'simulate': True})
+        with self.assertRaises(MaxDownloadsReached):
+            hdl.process_ie_result({
+                '_type': 'playlist',
+                'id': 'test',
+                'entries': entries(),
+                'extractor': 'test:playlist',
+                'extractor_key': 'test:playlist',
+                'webpage_url': 'http://example.com',
+            })
+        # The third entry is the one finding the limit reached
+        self.assertEqual(listed, [1, 2, 3])
+
+    def test_break_on_existing(self):
+        archive_fn = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'testdata', 'break_on_existing.txt')
+        with open(archive_fn, 'w') as f:
+            f.write('test 3\ntest 4\ntest 6\ntest 7\n')
+        self.addCleanup(try_rm, archive_fn)
+        listed = []
+
+        def entries():
+            for i in range(1, 101):
+                listed.append(i)
+                yield {
+                    'id': compat_str(i),
+                    'ie_key': 'Test',
+                    'title': compat_str(i),
+                    'url': TEST_URL,
+                }
+
+        def get_ids(break_on_existing):
+            del listed[:]
+            hdl = HDL({'download_archive': archive_fn, 'break_on_existing': break_on_existing})
+            hdl.process_ie_result({
+                '_type': 'playlist',
+                'id': 'test',
+                'entries': entries(),
+                'extractor': 'test:playlist',
+                'extractor_key': 'test:playlist',
+                'webpage_url': 'http://example.com',
+            })
+            return [int(v['id']) for v in hdl.downloaded_info_dicts]
+
+        self.assertEqual(get_ids(2), [1, 2])
+        self.assertEqual(listed, [1, 2, 3, 4])
+        self.assertEqual(get_ids(3), [1, 2, 5] + list(range(8, 101)))
+        self.assertEqual(get_ids(None), [1, 2, 5] + list(range(8, 101)))
+
+    def test_concurrent_playlist_entries(self):
+        class VideoIE(InfoExtractor):
+            _VALID_URL = r'video:(?P<id>\d+)'
+
+            def _real_extract(self, url):
+                video_id = self._match_id(url)
+                # The later entries are extracted first
+                time.sleep((5 - int(video_id)) * 0.02)
+                return {
+                    'id': video_id,
+                    'title': video_id,
+                    'url': TEST_URL,
+                }
+
+        class PlaylistIE(InfoExtractor):
+            _VALID_URL = r'playlist:'
+
+            def _real_extract(self, url):
+                return self.playlist_result([
+                    self.url_result('video:%d' % i, VideoIE.ie_key())
+                    for i in range(1, 6)])
+
+        class _HDL(FakeHDL):
+            def __init__(self, *args, **kwargs):
+                super(_HDL, self).__init__(*args, **kwargs)
+                self.filenames = []
+
+            def to_stdout(self, message, skip_eol=False, check_quiet=False):
+                self.filenames.append(message)
+
+        def get_filenames(params):
+            hdl = _HDL(dict(
+                params, simulate=True, forcefilename=True,
+                concurrent_playlist_entries=3, outtmpl='%(autonumber)s-%(id)s'))
+            hdl.add_info_extractor(VideoIE(hdl))
+            hdl.add_info_extractor(PlaylistIE(hdl))
+            try:
+                hdl.extract_info('playlist:')
+            except MaxDownloadsReached:
+                pass
+            return sorted(hdl.filenames)
+
+        # autonumber follows the playlist order, not the extraction order
+        self.assertEqual(
+            get_filenames({}), ['%05d-%d' % (i, i) for i in range(1, 6)])
+        self.assertEqual(
+            get_filenames({'max_downloads': 2}), ['00001-1', '00002-2'])
+
     def test_urlopen_no_file_protocol(self):
         # see https://github.com/ytdl-org/youtube-dl/issues/8227
         hdl = HDL()
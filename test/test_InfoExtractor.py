@@ -156,6 +156,57 @@ class TestInfoExtractor(unittest.TestCase):
         self.assertRaises(ExtractorError, self.ie._download_json, uri, None)
         self.assertEqual(self.ie._download_json(uri, None, fatal=False), None)
 
+    def test_run_concurrently(self):
+        uris = [encode_data_uri(('{"foo": %d}' % i).encode(), 'application/json') for i in range(6)]
+        # All the calls have to be running at the same time to get past it
+        barrier = threading.Barrier(self.ie._MAX_CONCURRENT_REQUESTS, timeout=10)
+
+        def download(uri, i):
+            if i < self.ie._MAX_CONCURRENT_REQUESTS:
+                barrier.wait()
+            return self.ie._download_json(uri, None)['foo']
+
+        self.assertEqual(
+            self.ie._run_concurrently(*[
+                lambda uri=uri, i=i: download(uri, i) for i, uri in enumerate(uris)]),
+            list(range(6)))
+        self.assertEqual(self.ie._run_concurrently(), [])
+
+        bad_uri = encode_data_uri(b'{"foo": invalid}', 'application/json')
+        calls = []
+
+        def call(uri):
+            calls.append(uri)
+            return self.ie._download_json(uri, None)
+
+        self.assertRaises(
+            ExtractorError, self.ie._run_concurrently,
+            lambda: call(uris[0]), lambda: call(bad_uri), lambda: call(uris[1]))
+        # The other calls are not abandoned
+        self.assertEqual(sorted(calls), sorted([uris[0], bad_uri, uris[1]]))
+
+    def test_extract_subtitles(self):
+        class SubtitlesIE(TestIE):
+            def _get_subtitles(self, video_id):
+                return {'en': [{'url': 'http://localhost/%s.en.vtt' % video_id}]}
+
+            def _get_automatic_captions(self, video_id):
+                return {'de': [{'url': 'http://localhost/%s.de.vtt' % video_id}]}
+
+        # Nothing is extracted unless it was asked for
+        ie = SubtitlesIE(FakeHDL())
+        self.assertEqual(ie.extract_subtitles('test'), {})
+        self.assertEqual(ie.extract_automatic_captions('test'), {})
+
+        ie = SubtitlesIE(FakeHDL({'writesubtitles': True}))
+        self.assertEqual(ie.extract_subtitles('test'), {
+            'en': [{'url': 'http://localhost/test.en.vtt'}]})
+        self.assertEqual(ie.extract_automatic_captions('test'), {})
+
+        ie = SubtitlesIE(FakeHDL({'listsubtitles': True}))
+        self.assertEqual(ie.extract_automatic_captions('test'), {
+            'de': [{'url': 'http://localhost/test.de.vtt'}]})
+
     def test_parse_html5_media_entries(self):
         # from https://www.r18.com/
         # with kpbs in label
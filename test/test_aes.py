@@ -8,7 +8,7 @@ import sys
 import unittest
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from haruhi_dl.aes import aes_decrypt, aes_encrypt, aes_cbc_decrypt, aes_cbc_encrypt, aes_decrypt_text
+from haruhi_dl.aes import aes_decrypt, aes_encrypt, aes_cbc_decrypt, aes_cbc_decrypt_bytes, aes_cbc_encrypt, aes_decrypt_text
 from haruhi_dl.utils import bytes_to_intlist, intlist_to_bytes
 import base64
 
@@ -34,6 +34,22 @@ class TestAES(unittest.TestCase):
         decrypted = intlist_to_bytes(aes_cbc_decrypt(data, self.key, self.iv))
         self.assertEqual(decrypted.rstrip(b'\x08'), self.secret_msg)
 
+    def test_cbc_decrypt_bytes(self):
+        data = b"\x97\x92+\xe5\x0b\xc3\x18\x91ky9m&\xb3\xb5@\xe6'\xc2\x96.\xc8u\x88\xab9-[\x9e|\xf1\xcd"
+        decrypted = aes_cbc_decrypt_bytes(data, intlist_to_bytes(self.key), intlist_to_bytes(self.iv))
+        self.assertEqual(decrypted.rstrip(b'\x08'), self.secret_msg)
+
+        msg = bytes(bytearray(range(256))) * 3
+        for key_size in (16, 24, 32):
+            key = list(range(key_size))
+            encrypted = intlist_to_bytes(aes_cbc_encrypt(bytes_to_intlist(msg), key, self.iv))
+            self.assertEqual(
+                aes_cbc_decrypt_bytes(encrypted, intlist_to_bytes(key), intlist_to_bytes(self.iv))[:len(msg)], msg)
+            # Incomplete blocks are handled like aes_cbc_decrypt does
+            self.assertEqual(
+                aes_cbc_decrypt_bytes(encrypted[:-5], intlist_to_bytes(key), intlist_to_bytes(self.iv)),
+                intlist_to_bytes(aes_cbc_decrypt(bytes_to_intlist(encrypted[:-5]), key, self.iv)))
+
     def test_cbc_encrypt(self):
         data = bytes_to_intlist(self.secret_msg)
         encrypted = intlist_to_bytes(aes_cbc_encrypt(data, self.key, self.iv))
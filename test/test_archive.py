@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import io
+
+# Allow direct execution
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+from test.helper import try_rm
+from haruhi_dl.archive import DownloadArchive
+
+
+class TestDownloadArchive(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.fn = os.path.join(TEST_DIR, 'testdata', 'archive_test.txt')
+        try_rm(self.fn)
+
+    def tearDown(self):
+        try_rm(self.fn)
+
+    def _append(self, data):
+        with io.open(self.fn, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+    def test_missing_file(self):
+        archive = DownloadArchive(self.fn)
+        self.assertFalse('youtube abc' in archive)
+        archive.record('youtube abc')
+        self.assertTrue('youtube abc' in archive)
+        with io.open(self.fn, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'youtube abc\n')
+
+    def test_existing_file(self):
+        self._append('youtube abc\n  vimeo 123  \n\nyoutube ąę\n')
+        archive = DownloadArchive(self.fn)
+        self.assertTrue('youtube abc' in archive)
+        self.assertTrue('vimeo 123' in archive)
+        self.assertTrue('youtube ąę' in archive)
+        self.assertFalse('' in archive)
+        self.assertFalse('youtube xyz' in archive)
+
+    def test_external_appends(self):
+        archive = DownloadArchive(self.fn)
+        self._append('youtube abc\n')
+        self.assertTrue('youtube abc' in archive)
+        # Another process appends to the same archive
+        self._append('youtube def\nyoutube gh')
+        # The last line may not be finished yet
+        self.assertFalse('youtube gh' in archive)
+        self.assertTrue('youtube def' in archive)
+        self._append('i\n')
+        self.assertTrue('youtube ghi' in archive)
+        self.assertFalse('youtube gh' in archive)
+        # Even in the middle of a character
+        with open(self.fn, 'ab') as f:
+            f.write('youtube ą'.encode('utf-8')[:-1])
+        self.assertFalse('youtube ą' in archive)
+        with open(self.fn, 'ab') as f:
+            f.write('ą\n'.encode('utf-8')[1:])
+        self.assertTrue('youtube ą' in archive)
+        archive.record('youtube jkl')
+        self.assertTrue('youtube jkl' in archive)
+        self.assertTrue('youtube abc' in archive)
+
+    def test_no_final_newline(self):
+        self._append('youtube abc\nyoutube def')
+        archive = DownloadArchive(self.fn)
+        self.assertTrue('youtube def' in archive)
+        self._append('\nvimeo 123')
+        self.assertFalse('vimeo 123' in archive)
+        # Nothing more has been appended since, so the line is complete
+        self.assertTrue('vimeo 123' in archive)
+        self.assertTrue('youtube def' in archive)
+        self.assertFalse('vimeo 12' in archive)
+
+    def test_truncated_file(self):
+        self._append('youtube abc\nyoutube def\n')
+        archive = DownloadArchive(self.fn)
+        self.assertTrue('youtube abc' in archive)
+        try_rm(self.fn)
+        self.assertFalse('youtube abc' in archive)
+        self._append('youtube x\n')
+        self.assertFalse('youtube def' in archive)
+        self.assertTrue('youtube x' in archive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,9 @@
 
 from __future__ import unicode_literals
 
+import json
 import shutil
+import time
 
 # Allow direct execution
 import os
@@ -38,8 +40,13 @@ class TestCache(unittest.TestCase):
             shutil.rmtree(self.test_dir)
 
     def test_cache(self):
+        for backend in ('sqlite', 'dir'):
+            self._test_cache(backend)
+
+    def _test_cache(self, backend):
         hdl = FakeHDL({
             'cachedir': self.test_dir,
+            'cache_backend': backend,
         })
         c = Cache(hdl)
         obj = {'x': 1, 'y': ['ä', '\\a', True]}
@@ -54,6 +61,78 @@ class TestCache(unittest.TestCase):
         self.assertFalse(os.path.exists(self.test_dir))
         self.assertEqual(c.load('test_cache', 'k.'), None)
 
+    def test_memory(self):
+        hdl = FakeHDL({
+            'cachedir': self.test_dir,
+        })
+        c = Cache(hdl)
+        c.store('test_cache', 'k', {'x': [1]})
+        obj = c.load('test_cache', 'k')
+        obj['x'].append(2)
+        # Callers get their own copy
+        self.assertEqual(c.load('test_cache', 'k'), {'x': [1]})
+        # Another instance reads the same store
+        self.assertEqual(Cache(hdl).load('test_cache', 'k'), {'x': [1]})
+
+    def test_ttl(self):
+        hdl = FakeHDL({
+            'cachedir': self.test_dir,
+        })
+        c = Cache(hdl)
+        c._SECTION_TTLS = {'test_ttl': 60}
+        c.store('test_ttl', 'k', 1)
+        c.store('test_cache', 'k', 1)
+        self.assertEqual(c.load('test_ttl', 'k'), 1)
+        real_time = time.time
+        time.time = lambda: real_time() + 120
+        try:
+            self.assertEqual(c.load('test_ttl', 'k'), None)
+            self.assertEqual(c.load('test_cache', 'k'), 1)
+        finally:
+            time.time = real_time
+
+    def test_sqlite_eviction(self):
+        hdl = FakeHDL({
+            'cachedir': self.test_dir,
+            'cache_backend': 'sqlite',
+        })
+        c = Cache(hdl)
+        backend = c._get_backend()
+        backend.MAX_ENTRIES = 3
+        for k in range(5):
+            backend.store('test_cache', 'k%d' % k, '%d' % k)
+        self.assertEqual(backend.load('test_cache', 'k0'), None)
+        self.assertEqual(backend.load('test_cache', 'k1'), None)
+        self.assertEqual(backend.load('test_cache', 'k4')[0], '4')
+
+    def test_migration(self):
+        section_dir = os.path.join(self.test_dir, 'test_cache')
+        os.makedirs(section_dir)
+        with open(os.path.join(section_dir, 'k.json'), 'w') as f:
+            json.dump({'x': 1}, f)
+        hdl = FakeHDL({
+            'cachedir': self.test_dir,
+            'cache_backend': 'sqlite',
+        })
+        http_dir = os.path.join(self.test_dir, 'http')
+        os.makedirs(http_dir)
+        with open(os.path.join(http_dir, 'h.json'), 'w') as f:
+            json.dump({'url': 'http://example.com/'}, f)
+        c = Cache(hdl)
+        self.assertEqual(c.load('test_cache', 'k'), {'x': 1})
+        self.assertFalse(os.path.exists(section_dir))
+        # The HTTP cache is not made of entries
+        self.assertEqual(c.load('http', 'h'), None)
+        self.assertTrue(os.path.exists(os.path.join(http_dir, 'h.json')))
+        c._close_backend()
+
+        # Only done once
+        os.makedirs(section_dir)
+        with open(os.path.join(section_dir, 'k2.json'), 'w') as f:
+            json.dump({'x': 2}, f)
+        self.assertEqual(Cache(hdl).load('test_cache', 'k2'), None)
+        self.assertTrue(os.path.exists(os.path.join(section_dir, 'k2.json')))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# coding: utf-8
+from __future__ import unicode_literals
+
+# Allow direct execution
+import binascii
+import glob
+import io
+import json
+import os
+import re
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test.helper import http_server_port, try_rm
+from haruhi_dl import HaruhiDL
+from haruhi_dl.aes import aes_cbc_encrypt
+from haruhi_dl.compat import compat_http_server
+from haruhi_dl.downloader import get_suitable_downloader
+from haruhi_dl.downloader.dash import DashSegmentsFD
+from haruhi_dl.downloader.external import FFmpegFD
+from haruhi_dl.downloader.hls import HlsFD
+from haruhi_dl.utils import (
+    bytes_to_intlist,
+    encodeFilename,
+    intlist_to_bytes,
+)
+import threading
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAG_COUNT = 12
+
+
+def fragment_content(index):
+    return ('fragment %d;' % index).encode('ascii') * (index + 1)
+
+
+def hls_manifest(first=0, last=FRAG_COUNT, ended=True, target_duration=10):
+    return ''.join(
+        ['#EXTM3U\n#EXT-X-TARGETDURATION:%d\n#EXT-X-MEDIA-SEQUENCE:%d\n' % (target_duration, first)]
+        + ['#EXTINF:%d,\nfrag/%d\n' % (target_duration, i) for i in range(first, last)]
+        + (['#EXT-X-ENDLIST\n'] if ended else []))
+
+
+# Windows of fragments of the live playlist after each reload
+LIVE_WINDOWS = [(0, 4), (3, 7), (3, 7), (6, 10), (9, FRAG_COUNT)]
+
+INIT_SECTION = b'ftyp and moov 16'
+INIT_KEY = b'0123456789abcdef'
+INIT_IV = b'\0' * 15 + b'\1'
+# An encrypted initialization section, in the middle of its file
+INIT_DATA = b'head' + intlist_to_bytes(aes_cbc_encrypt(
+    bytes_to_intlist(INIT_SECTION), bytes_to_intlist(INIT_KEY), bytes_to_intlist(INIT_IV))) + b'tail'
+
+
+class HTTPTestRequestHandler(compat_http_server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_data(self, data, content_type='video/mp2t'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', len(data))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        mobj = re.match(r'^/frag/(\d+)$', self.path)
+        if self.path == '/index.m3u8':
+            with server.lock:
+                server.manifest_requests += 1
+            self.send_data(hls_manifest().encode('utf-8'), 'application/x-mpegURL')
+        elif self.path == '/fmp4.m3u8':
+            self.send_data(hls_manifest().replace(
+                '#EXTINF', '#EXT-X-KEY:METHOD=AES-128,URI="key",IV=0x%s\n'
+                '#EXT-X-MAP:URI="init",BYTERANGE="%d@4"\n'
+                '#EXT-X-KEY:METHOD=NONE\n#EXTINF' % (
+                    binascii.hexlify(INIT_IV).decode('ascii'), len(INIT_SECTION)), 1).encode('utf-8'),
+                'application/x-mpegURL')
+        elif self.path == '/key':
+            self.send_data(INIT_KEY, 'application/octet-stream')
+        elif self.path == '/init':
+            start, end = map(int, re.match(r'bytes=(\d+)-(\d+)', self.headers['Range']).groups())
+            self.send_response(206)
+            self.send_header('Content-Length', end - start + 1)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(INIT_DATA)))
+            self.end_headers()
+            self.wfile.write(INIT_DATA[start:end + 1])
+        elif self.path == '/live.m3u8':
+            with server.lock:
+                first, last = LIVE_WINDOWS[server.manifest_requests]
+                server.manifest_requests += 1
+            self.send_data(hls_manifest(
+                first, last, ended=last == FRAG_COUNT, target_duration=1).encode('utf-8'),
+                'application/x-mpegURL')
+        elif mobj:
+            index = int(mobj.group(1))
+            with server.lock:
+                server.requests.append(index)
+                attempt = server.requests.count(index)
+            if index in server.unavailable or attempt <= server.failures.get(index, 0):
+                self.send_error(404)
+                return
+            self.send_data(fragment_content(index))
+        else:
+            assert False
+
+
+class FakeLogger(object):
+    def debug(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+
+class TestFragmentFD(unittest.TestCase):
+    def setUp(self):
+        self.httpd = compat_http_server.HTTPServer(
+            ('127.0.0.1', 0), HTTPTestRequestHandler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = []
+        self.httpd.manifest_requests = 0
+        self.httpd.failures = {}
+        self.httpd.unavailable = set()
+        self.port = http_server_port(self.httpd)
+        self.server_thread = threading.Thread(target=self.httpd.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.filename = os.path.join(TEST_DIR, 'testdata', 'fragment_test.ts')
+        self._cleanup()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._cleanup()
+
+    def _cleanup(self):
+        for fn in glob.glob(self.filename + '*'):
+            try_rm(encodeFilename(fn))
+
+    def _url(self, path):
+        return 'http://127.0.0.1:%d/%s' % (self.port, path)
+
+    def download(self, fd_class, info_dict, params={}):
+        params = dict(params, logger=FakeLogger())
+        hdl = HaruhiDL(params)
+        fd = fd_class(hdl, params)
+        return fd.real_download(self.filename, info_dict)
+
+    def assert_content(self, skipped=()):
+        with open(encodeFilename(self.filename), 'rb') as f:
+            self.assertEqual(f.read(), b''.join(
+                fragment_content(i) for i in range(FRAG_COUNT) if i not in skipped))
+        self.assertFalse(os.path.exists(encodeFilename(self.filename + '.ytdl')))
+
+    def download_hls(self, params={}):
+        return self.download(HlsFD, {'url': self._url('index.m3u8')}, params)
+
+    def download_dash(self, params={}):
+        return self.download(DashSegmentsFD, {
+            'url': self._url('index.mpd'),
+            'fragment_base_url': self._url(''),
+            'fragments': [{'path': 'frag/%d' % i} for i in range(FRAG_COUNT)],
+        }, params)
+
+    def test_hls(self):
+        for concurrency in (1, 4):
+            self._cleanup()
+            self.assertTrue(self.download_hls({'concurrent_fragment_downloads': concurrency}))
+            self.assert_content()
+
+    def test_hls_manifest_from_extraction(self):
+        self.assertTrue(self.download(HlsFD, {
+            'url': self._url('index.m3u8'),
+            '_hls_manifest': {'url': self._url('index.m3u8'), 'data': hls_manifest()},
+        }))
+        self.assert_content()
+        self.assertEqual(self.httpd.manifest_requests, 0)
+
+        # The playlist is only reused for the URL it has been fetched from
+        self._cleanup()
+        self.assertTrue(self.download(HlsFD, {
+            'url': self._url('index.m3u8'),
+            '_hls_manifest': {'url': self._url('other.m3u8'), 'data': '#EXTM3U\n'},
+        }))
+        self.assert_content()
+        self.assertEqual(self.httpd.manifest_requests, 1)
+
+    def test_hls_live(self):
+        self.assertTrue(self.download(HlsFD, {
+            'url': self._url('live.m3u8'),
+            'is_live': True,
+        }, {'concurrent_fragment_downloads': 2}))
+        self.assert_content()
+        self.assertEqual(self.httpd.manifest_requests, len(LIVE_WINDOWS))
+        # Fragments still in the playlist after a reload are not downloaded again
+        self.assertEqual(sorted(self.httpd.requests), list(range(FRAG_COUNT)))
+
+    def test_hls_live_downloader(self):
+        info_dict = {'url': self._url('live.m3u8'), 'is_live': True}
+        for protocol in ('m3u8', 'm3u8_native'):
+            info_dict['protocol'] = protocol
+            # The native live recorder is opt-in
+            self.assertEqual(get_suitable_downloader(dict(info_dict)), FFmpegFD)
+            self.assertEqual(get_suitable_downloader(dict(info_dict), {'hls_prefer_native': False}), FFmpegFD)
+            self.assertEqual(get_suitable_downloader(dict(info_dict), {'hls_prefer_native': True}), HlsFD)
+
+    def test_hls_init_section(self):
+        self.assertTrue(self.download(HlsFD, {'url': self._url('fmp4.m3u8')}))
+        with open(encodeFilename(self.filename), 'rb') as f:
+            self.assertEqual(f.read(), INIT_SECTION + b''.join(
+                fragment_content(i) for i in range(FRAG_COUNT)))
+
+    def test_dash(self):
+        for concurrency in (1, 4):
+            self._cleanup()
+            self.assertTrue(self.download_dash({'concurrent_fragment_downloads': concurrency}))
+            self.assert_content()
+
+    def test_keep_fragments(self):
+        self.assertTrue(self.download_hls())
+        self.assert_content()
+        self.assertEqual(glob.glob(self.filename + '*-Frag*'), [])
+
+        self._cleanup()
+        self.assertTrue(self.download_hls({'keep_fragments': True}))
+        self.assert_content()
+        self.assertEqual(len(glob.glob(self.filename + '*-Frag*')), FRAG_COUNT)
+
+    def _write_incomplete(self, frags, extra_data, hdl_lines):
+        with open(encodeFilename(self.filename + '.part'), 'wb') as f:
+            f.write(b''.join(fragment_content(i) for i in frags) + extra_data)
+        with io.open(encodeFilename(self.filename + '.ytdl'), 'w', encoding='utf-8') as f:
+            f.write(hdl_lines)
+
+    def _journal(self, frags):
+        end = 0
+        lines = [json.dumps({'downloader': {'current_fragment': {'index': 0}, 'journal': 1}})]
+        for i in frags:
+            end += len(fragment_content(i))
+            lines.append(json.dumps({'index': i + 1, 'end': end}))
+        return '\n'.join(lines) + '\n'
+
+    def test_resume_journal(self):
+        # Interrupted while writing the sixth fragment
+        self._write_incomplete(range(5), b'garbage', self._journal(range(5)))
+        self.assertTrue(self.download_hls())
+        self.assert_content()
+        self.assertEqual(sorted(self.httpd.requests), list(range(5, FRAG_COUNT)))
+
+    def test_resume_empty_journal(self):
+        # Interrupted while writing the first fragment
+        self._write_incomplete([], fragment_content(0)[:10], self._journal([]))
+        self.assertTrue(self.download_hls())
+        self.assert_content()
+        self.assertEqual(sorted(self.httpd.requests), list(range(FRAG_COUNT)))
+
+    def test_resume_torn_journal(self):
+        # Interrupted while writing the journal after the fifth fragment
+        self._write_incomplete(range(5), b'', self._journal(range(4)) + '{"index": 5, "e')
+        self.assertTrue(self.download_dash({'concurrent_fragment_downloads': 2}))
+        self.assert_content()
+        self.assertEqual(sorted(self.httpd.requests), list(range(4, FRAG_COUNT)))
+
+    def test_resume_inconsistent(self):
+        # Incomplete file is shorter than the journal claims
+        self._write_incomplete(range(2), b'', self._journal(range(5))[:-1])
+        self.assertTrue(self.download_hls())
+        self.assert_content()
+        self.assertEqual(sorted(self.httpd.requests), list(range(2, FRAG_COUNT)))
+
+        self._cleanup()
+        self.httpd.requests = []
+        self._write_incomplete(range(2), b'', '{"downloader": {"current_fragment": {"index": 2}}}')
+        self.assertTrue(self.download_hls())
+        self.assert_content()
+        self.assertEqual(sorted(self.httpd.requests), list(range(2, FRAG_COUNT)))
+
+        self._cleanup()
+        self.httpd.requests = []
+        self._write_incomplete([], b'', '{"downloader": {"current_fragment": {"index": 3}}}')
+        self.assertTrue(self.download_hls())
+        self.assert_content()
+        self.assertEqual(sorted(self.httpd.requests), list(range(FRAG_COUNT)))
+
+    def test_retries(self):
+        self.httpd.failures = {3: 2, 7: 1}
+        self.assertTrue(self.download_hls({
+            'concurrent_fragment_downloads': 4,
+            'fragment_retries': 2,
+        }))
+        self.assert_content()
+        self.assertEqual(self.httpd.requests.count(3), 3)
+
+    def test_skip_unavailable(self):
+        self.httpd.unavailable = set([5, 9])
+        self.assertTrue(self.download_dash({
+            'concurrent_fragment_downloads': 3,
+            'fragment_retries': 1,
+            'skip_unavailable_fragments': True,
+        }))
+        self.assert_content(skipped=(5, 9))
+
+    def test_abort_on_unavailable(self):
+        self.httpd.unavailable = set([5])
+        for concurrency in (1, 3):
+            self.assertFalse(self.download_dash({
+                'concurrent_fragment_downloads': concurrency,
+                'fragment_retries': 0,
+                'skip_unavailable_fragments': False,
+                'ignoreerrors': True,
+            }))
+
+    def test_abort_closes_journal(self):
+        streams = []
+
+        class JournalDashFD(DashSegmentsFD):
+            def _write_hdl_file(self, ctx):
+                super(JournalDashFD, self)._write_hdl_file(ctx)
+                streams.append(ctx['hdl_stream'])
+
+            def _append_fragment(self, ctx, frag_content):
+                if ctx['fragment_index'] == 8:
+                    raise KeyboardInterrupt
+                super(JournalDashFD, self)._append_fragment(ctx, frag_content)
+
+        self.httpd.unavailable = set([5])
+        self.assertFalse(self.download(JournalDashFD, {
+            'url': self._url('index.mpd'),
+            'fragment_base_url': self._url(''),
+            'fragments': [{'path': 'frag/%d' % i} for i in range(FRAG_COUNT)],
+        }, {'skip_unavailable_fragments': False, 'ignoreerrors': True}))
+        self.httpd.unavailable = set()
+        self.assertRaises(KeyboardInterrupt, self.download, JournalDashFD, {
+            'url': self._url('index.mpd'),
+            'fragment_base_url': self._url(''),
+            'fragments': [{'path': 'frag/%d' % i} for i in range(FRAG_COUNT)],
+        }, {'concurrent_fragment_downloads': 3})
+        self.assertEqual(len(streams), 2)
+        self.assertTrue(all(stream.closed for stream in streams))
+
+
+if __name__ == '__main__':
+    unittest.main()
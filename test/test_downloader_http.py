@@ -20,6 +20,7 @@ TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 TEST_SIZE = 10 * 1024
+TEST_CONTENT = bytes(bytearray(i % 251 for i in range(TEST_SIZE)))
 
 
 class HTTPTestRequestHandler(compat_http_server.BaseHTTPRequestHandler):
@@ -40,18 +41,19 @@ class HTTPTestRequestHandler(compat_http_server.BaseHTTPRequestHandler):
             if total:
                 content_range += '/%d' % total
             self.send_header('Content-Range', content_range)
-        return (end - start + 1) if valid_range else total
+        return (start, end + 1) if valid_range else (0, total)
 
     def serve(self, range=True, content_length=True):
+        self.server.requests.append(self.headers.get('Range'))
         self.send_response(200)
         self.send_header('Content-Type', 'video/mp4')
-        size = TEST_SIZE
+        start, end = 0, TEST_SIZE
         if range:
-            size = self.send_content_range(TEST_SIZE)
+            start, end = self.send_content_range(TEST_SIZE)
         if content_length:
-            self.send_header('Content-Length', size)
+            self.send_header('Content-Length', end - start)
         self.end_headers()
-        self.wfile.write(b'#' * size)
+        self.wfile.write(TEST_CONTENT[start:end])
 
     def do_GET(self):
         if self.path == '/regular':
@@ -81,6 +83,7 @@ class TestHttpFD(unittest.TestCase):
     def setUp(self):
         self.httpd = compat_http_server.HTTPServer(
             ('127.0.0.1', 0), HTTPTestRequestHandler)
+        self.httpd.requests = []
         self.port = http_server_port(self.httpd)
         self.server_thread = threading.Thread(target=self.httpd.serve_forever)
         self.server_thread.daemon = True
@@ -95,7 +98,9 @@ class TestHttpFD(unittest.TestCase):
         self.assertTrue(downloader.real_download(filename, {
             'url': 'http://127.0.0.1:%d/%s' % (self.port, ep),
         }))
-        self.assertEqual(os.path.getsize(encodeFilename(filename)), TEST_SIZE)
+        with open(encodeFilename(filename), 'rb') as f:
+            self.assertEqual(f.read(), TEST_CONTENT)
+        self.assertFalse(os.path.exists(encodeFilename(filename + '.ytdl')))
         try_rm(encodeFilename(filename))
 
     def download_all(self, params):
@@ -110,6 +115,32 @@ class TestHttpFD(unittest.TestCase):
             'http_chunk_size': 1000,
         })
 
+    def test_segmented(self):
+        # Servers ignoring Range fall back to a single stream
+        self.download_all({
+            'http_chunk_size': 1000,
+            'http_connections': 4,
+        })
+
+    def test_segmented_resume(self):
+        filename = 'testfile.mp4'
+        # The first two pieces have been downloaded before the interruption
+        with open(encodeFilename(filename + '.part'), 'wb') as f:
+            f.write(TEST_CONTENT[:2000] + b'\0' * (TEST_SIZE - 2000))
+        with open(encodeFilename(filename + '.ytdl'), 'w') as f:
+            f.write(
+                '{"downloader": {"http_segments": {"total": %d, "piece_size": 1000}}}\n'
+                '{"piece": 0}\n{"piece": 1}\n{"pie' % TEST_SIZE)
+        try:
+            self.download({'http_connections': 2}, 'regular')
+        finally:
+            try_rm(encodeFilename(filename + '.part'))
+            try_rm(encodeFilename(filename + '.ytdl'))
+        ranges = self.httpd.requests[1:]
+        self.assertEqual(len(ranges), 9)
+        self.assertNotIn('bytes=0-999', ranges)
+        self.assertNotIn('bytes=1000-1999', ranges)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+from __future__ import unicode_literals
+
+# Allow direct execution
+import os
+import shutil
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test.helper import FakeHDL, gettestcases
+
+from haruhi_dl.extractor import gen_extractor_classes, _SH_CLASSES
+from haruhi_dl.extractor.common import InfoExtractor, SelfhostedInfoExtractor
+from haruhi_dl.extractor.dispatch import (
+    ExtractorIndex,
+    SelfhostedMatcher,
+    required_literals,
+)
+
+
+class TestRequiredLiterals(unittest.TestCase):
+    def test_literals(self):
+        self.assertEqual(
+            required_literals(r'https?://(?:www\.)?Example\.com/video/(?P<id>\d+)'),
+            [('http',), ('://',), ('example.com/video/',)])
+
+    def test_branch(self):
+        self.assertEqual(
+            required_literals(r'https?://(?:foo|bar\.baz)\.com/'),
+            [('http',), ('://',), ('foo', 'bar.baz'), ('.com/',)])
+        # An alternative without any literal makes the whole branch useless
+        self.assertEqual(
+            required_literals(r'https?://(?:foo|\w+)\.com/'),
+            [('http',), ('://',), ('.com/',)])
+
+    def test_repeat(self):
+        self.assertEqual(
+            required_literals(r'(?:abc)+x(?:def)*y(?:ghi)?z'),
+            [('abc',), ('x',), ('y',), ('z',)])
+
+    def test_character_class(self):
+        self.assertEqual(
+            required_literals(r'a[b]c[de]f'), [('abc',), ('f',)])
+
+
+class TestExtractorIndex(unittest.TestCase):
+    def test_candidates_order(self):
+        class FooIE(InfoExtractor):
+            _VALID_URL = r'https?://foo\.example/(?P<id>\d+)'
+
+        class BarIE(InfoExtractor):
+            _VALID_URL = r'https?://bar\.test/(?P<id>\d+)'
+
+        class AnyIE(InfoExtractor):
+            @classmethod
+            def suitable(cls, url):
+                return True
+
+        index = ExtractorIndex([FooIE, AnyIE, BarIE])
+        self.assertEqual(index.candidates('https://bar.test/1'), [AnyIE, BarIE])
+        self.assertEqual(index.candidates('https://FOO.example/1'), [FooIE, AnyIE])
+        self.assertEqual(index.candidates('https://other.org/1'), [AnyIE])
+
+        index.add(FooIE)
+        self.assertEqual(index.candidates('https://foo.example/1'), [FooIE, AnyIE, FooIE])
+
+    def test_no_suitable_extractor_missed(self):
+        ies = gen_extractor_classes()
+        index = ExtractorIndex(ies)
+        for tc in gettestcases(include_onlymatching=True):
+            url = tc['url']
+            candidates = index.candidates(url)
+            for ie in ies:
+                if ie.suitable(url):
+                    self.assertIn(ie, candidates, '%s not a candidate for %s' % (ie.ie_key(), url))
+
+    def test_extract_info_uses_index(self):
+        hdl = FakeHDL()
+        hdl.add_default_info_extractors()
+        # Not worth building for a few URLs
+        self.assertEqual(hdl._candidate_ies('https://example.com/'), hdl._ies)
+        self.assertIsNone(hdl._ies_index)
+        hdl._IES_INDEX_MIN_LOOKUPS = 3
+        hdl._candidate_ies('https://example.com/')
+        candidates = hdl._candidate_ies('https://example.com/')
+        self.assertIsNotNone(hdl._ies_index)
+        self.assertLess(len(candidates), len(hdl._ies))
+        self.assertIs(candidates[-1], gen_extractor_classes()[-1])
+        ie = hdl.get_info_extractor('Generic')
+        # Extractors added later are appended to the existing index
+        self.assertIs(hdl._candidate_ies('https://example.com/')[-1], ie)
+
+
+class TestSelfhostedMatcher(unittest.TestCase):
+    def test_same_as_suitable_selfhosted(self):
+        def first_suitable(url, webpage):
+            for ie in _SH_CLASSES:
+                if ie.suitable_selfhosted(url, webpage):
+                    return ie
+
+        matcher = SelfhostedMatcher(_SH_CLASSES)
+        filler = 'x' * 10000
+        pages = [None, filler]
+        for ie in _SH_CLASSES:
+            for string in ie._SH_VALID_CONTENT_STRINGS or ():
+                pages.append(filler + string + filler)
+        pages.append(
+            filler + '<script id=\'initial-state\' type="application/json">'
+            '{"meta":{"streaming_api_base_url":"wss://' + filler)
+        urls = ['https://example.com/video/1']
+        for ie in _SH_CLASSES:
+            urls.extend(tc['url'] for tc in ie().get_testcases(include_onlymatching=True))
+        for url in urls:
+            for webpage in pages:
+                self.assertIs(matcher.find(url, webpage), first_suitable(url, webpage))
+
+    def test_order(self):
+        class FirstSHIE(SelfhostedInfoExtractor):
+            _SH_VALID_URL = r'https?://(?P<host>[^/]+)/first/(?P<id>\d+)'
+            _SH_VALID_CONTENT_STRINGS = ('powered by Foo', )
+
+        class SecondSHIE(SelfhostedInfoExtractor):
+            _SH_VALID_URL = r'https?://(?P<host>[^/]+)/(?:first|second)/(?P<id>\d+)'
+            _SH_VALID_CONTENT_REGEXES = (r'<meta name="generator" content="(?:Foo|Bar)',
+                                         r'<title>Foo</title>')
+
+        class CustomSHIE(SelfhostedInfoExtractor):
+            @classmethod
+            def suitable_selfhosted(cls, url, webpage):
+                return 'custom' in url
+
+        matcher = SelfhostedMatcher([FirstSHIE, CustomSHIE, SecondSHIE])
+        webpage = '<title>Foo</title><meta name="generator" content="Bar"> powered by Foo'
+        self.assertIs(matcher.find('https://a.example/first/1', webpage), FirstSHIE)
+        self.assertIs(matcher.find('https://a.example/second/1', webpage), SecondSHIE)
+        self.assertIs(matcher.find('https://a.example/second/1', 'powered by Foo'), None)
+        self.assertIs(matcher.find('https://custom.example/second/1', webpage), CustomSHIE)
+        self.assertIs(matcher.find('https://a.example/first/1', None), FirstSHIE)
+
+        self.assertIs(matcher.find_on_instance('https://a.example/first/1', 'SecondSH'), SecondSHIE)
+        self.assertIs(matcher.find_on_instance('https://a.example/third/1', 'SecondSH'), None)
+        self.assertIs(matcher.find_on_instance('https://a.example/first/1', 'UnknownSH'), None)
+        self.assertTrue(matcher.matches_url('https://a.example/second/1'))
+        self.assertFalse(matcher.matches_url('https://a.example/third/1'))
+
+    def test_instance_siblings(self):
+        matcher = SelfhostedMatcher(_SH_CLASSES)
+        self.assertEqual(
+            matcher.find_on_instance(
+                'https://peertube.example/w/p/9c9de5e8-0a1e-484a-b099-e80766180a6d', 'PeerTubeSH').ie_key(),
+            'PeerTubePlaylistSH')
+        self.assertIs(matcher.find_on_instance('https://peertube.example/library/tracks/1', 'PeerTubeSH'), None)
+
+
+class TestGenericSelfhostedHosts(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'testdata', 'test_selfhosted_cache')
+        self.hdl = FakeHDL({'cachedir': self.test_dir})
+        self.hdl.add_default_info_extractors()
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_known_host(self):
+        url = 'https://peertube.example/w/9c9de5e8-0a1e-484a-b099-e80766180a6d'
+        self.hdl.cache.store('selfhosted', 'peertube.example', 'PeerTubeSH')
+        shie = self.hdl.get_info_extractor('PeerTubeSH')
+        calls = []
+        shie._selfhosted_extract = lambda url, webpage=None: calls.append((url, webpage)) or {'id': 'x'}
+        self.assertEqual(self.hdl.get_info_extractor('Generic')._real_extract(url), {'id': 'x'})
+        self.assertEqual(calls, [(url, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+from __future__ import unicode_literals
+
+# Allow direct execution
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haruhi_dl.extractor.generic import GenericIE
+from haruhi_dl.extractor.vimeo import VimeoIE
+
+
+class TestEmbedTags(unittest.TestCase):
+    WEBPAGE = '''<html><head>
+        <meta property="og:video" content="https://player.theplatform.com/p/abc/def/select/media/xyz">
+        <script src="https://content.jwplatform.com/players/nPripu9l-ALJ3XQCI.js"></script>
+        <script>var player = "<iframe src='https://player.vimeo.com/video/1'>";</iframe></script>
+        </head><body>
+        <p>Some <b>text</b></p>
+        <iframe data-title="a > b" src="https://player.vimeo.com/video/12345?h=1" width="640"></iframe>
+        <iframe title=Don't src="https://player.vimeo.com/video/123"></iframe>
+        <amp-iframe
+            src="https://video.foxnews.com/v/video-embed.html?video_id=3937480&d=video.foxnews.com"></amp-iframe>
+        <iframe width="100%" src="https://w.soundcloud.com/player/?url=https%3A//api.soundcloud.com/tracks/1"></iframe>
+        <video src="https://vimeo.com/54321" controls></video>
+        <IFRAME SRC="https://player.vimeo.com/video/999"></IFRAME>
+        </body></html>'''
+
+    def test_scan(self):
+        tags = GenericIE._scan_embed_tags(self.WEBPAGE)
+        self.assertIn(
+            '\n<iframe title=Don\'t src="https://player.vimeo.com/video/123">\n', tags)
+        # Cut at the first ">" just as the extractors' patterns are
+        self.assertIn('\n<iframe data-title="a >\n', tags)
+        self.assertIn('\n<amp-iframe\n            src="https://video.foxnews.com/', tags)
+        self.assertNotIn('<b>', tags)
+        self.assertNotIn('<p>', tags)
+
+    def test_same_embeds(self):
+        url = 'https://example.com/'
+        embed_tags = GenericIE._scan_embed_tags(self.WEBPAGE)
+        found = 0
+        for embie in GenericIE._TAG_EMBED_IES:
+            urls = embie._extract_urls(self.WEBPAGE, url=url)
+            self.assertEqual(embie._extract_urls(embed_tags, url=url), urls, embie.ie_key())
+            found += bool(urls)
+        self.assertEqual(found, 5)
+        self.assertIn(
+            'https://player.vimeo.com/video/123#', ' '.join(VimeoIE._extract_urls(embed_tags, url=url)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,13 +4,21 @@ from __future__ import unicode_literals
 
 # Allow direct execution
 import os
+import shutil
 import sys
 import unittest
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from test.helper import http_server_port
 from haruhi_dl import HaruhiDL
-from haruhi_dl.compat import compat_http_server, compat_urllib_request
+from haruhi_dl.compat import (
+    compat_http_client,
+    compat_http_server,
+    compat_urllib_error,
+    compat_urllib_request,
+)
+from haruhi_dl.extractor.common import InfoExtractor
+from haruhi_dl.utils import sanitized_Request
 import ssl
 import threading
 
@@ -162,5 +170,206 @@ class TestProxy(unittest.TestCase):
         self.assertEqual(response, 'normal: http://xn--fiq228c.tw/')
 
 
+class KeepAliveRequestHandler(compat_http_server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        compat_http_server.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/close':
+            # Drop the connection without telling the client
+            self.close_connection = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.posts += 1
+        self.do_GET()
+
+
+class TestKeepAlive(unittest.TestCase):
+    def setUp(self):
+        self.httpd = compat_http_server.HTTPServer(
+            ('127.0.0.1', 0), KeepAliveRequestHandler)
+        self.httpd.connections = 0
+        self.httpd.posts = 0
+        self.port = http_server_port(self.httpd)
+        self.server_thread = threading.Thread(target=self.httpd.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def test_reuse(self):
+        hdl = HaruhiDL({'logger': FakeLogger()})
+        for i in range(3):
+            path = '/%d' % i
+            r = hdl.urlopen('http://127.0.0.1:%d%s' % (self.port, path))
+            self.assertEqual(r.read().decode('utf-8'), path)
+        self.assertEqual(self.httpd.connections, 1)
+        self.assertEqual(hdl.connection_pool.stats(), {
+            'requests': 3,
+            'connections': 1,
+            'reused': 2,
+            'stale': 0,
+        })
+        hdl.connection_pool.close()
+
+    def test_stale_connection(self):
+        hdl = HaruhiDL({'logger': FakeLogger()})
+        r = hdl.urlopen('http://127.0.0.1:%d/close' % self.port)
+        self.assertEqual(r.read(), b'/close')
+        r = hdl.urlopen('http://127.0.0.1:%d/after' % self.port)
+        self.assertEqual(r.read(), b'/after')
+        stats = hdl.connection_pool.stats()
+        self.assertEqual(stats['connections'], 2)
+        self.assertEqual(stats['stale'], 1)
+        hdl.connection_pool.close()
+
+    def test_stale_connection_post(self):
+        hdl = HaruhiDL({'logger': FakeLogger()})
+        try:
+            r = hdl.urlopen('http://127.0.0.1:%d/close' % self.port)
+            self.assertEqual(r.read(), b'/close')
+            # The server might have received it, so it is not sent again
+            try:
+                hdl.urlopen(sanitized_Request(
+                    'http://127.0.0.1:%d/post' % self.port, data=b'x')).close()
+            except (compat_urllib_error.URLError, compat_http_client.HTTPException, ConnectionError):
+                pass
+            self.assertEqual(self.httpd.posts, 0)
+            self.assertEqual(hdl.connection_pool.stats()['stale'], 0)
+        finally:
+            # An open connection would keep the server from shutting down
+            hdl.connection_pool.close()
+
+    def test_unread_response_not_reused(self):
+        hdl = HaruhiDL({'logger': FakeLogger()})
+        hdl.urlopen('http://127.0.0.1:%d/unread' % self.port).close()
+        r = hdl.urlopen('http://127.0.0.1:%d/read' % self.port)
+        self.assertEqual(r.read(), b'/read')
+        self.assertEqual(hdl.connection_pool.stats()['reused'], 0)
+        hdl.connection_pool.close()
+
+
+class CachingRequestHandler(compat_http_server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/fresh':
+            self.send_response(200)
+            self.send_header('Cache-Control', 'max-age=3600')
+        elif self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+        elif self.path == '/no-store':
+            self.send_response(200)
+            self.send_header('Cache-Control', 'no-store')
+        else:
+            self.send_response(200)
+        body = ('%s %d' % (self.path, len(self.server.requests))).encode('utf-8')
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestHTTPCache(unittest.TestCase):
+    def setUp(self):
+        self.httpd = compat_http_server.HTTPServer(
+            ('127.0.0.1', 0), CachingRequestHandler)
+        self.httpd.requests = []
+        self.port = http_server_port(self.httpd)
+        self.server_thread = threading.Thread(target=self.httpd.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.cache_dir = os.path.join(TEST_DIR, 'testdata', 'test_http_cache')
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def _hdl(self, **params):
+        params.update({
+            'logger': FakeLogger(),
+            'cachedir': self.cache_dir,
+            'http_cache': True,
+        })
+        return HaruhiDL(params)
+
+    def _get(self, hdl, path, headers={}):
+        ie = InfoExtractor(hdl)
+        return ie._download_webpage(
+            'http://127.0.0.1:%d%s' % (self.port, path), None, note=False, headers=headers)
+
+    def test_fresh(self):
+        hdl = self._hdl()
+        self.assertEqual(self._get(hdl, '/fresh'), '/fresh 1')
+        self.assertEqual(self._get(hdl, '/fresh'), '/fresh 1')
+        # Even for another instance, opening the other cache entries too
+        other_hdl = self._hdl()
+        other_hdl.cache.load('test_http_cache', 'k')
+        self.assertEqual(self._get(other_hdl, '/fresh'), '/fresh 1')
+        self.assertEqual(len(self.httpd.requests), 1)
+        # Opting out
+        self.assertEqual(self._get(hdl, '/fresh', {'Cache-Control': 'no-cache'}), '/fresh 2')
+
+    def test_revalidate(self):
+        hdl = self._hdl()
+        self.assertEqual(self._get(hdl, '/etag'), '/etag 1')
+        self.assertEqual(self._get(hdl, '/etag'), '/etag 1')
+        self.assertEqual(self.httpd.requests, [('/etag', None), ('/etag', '"v1"')])
+
+    def test_not_stored(self):
+        hdl = self._hdl()
+        self.assertEqual(self._get(hdl, '/no-store'), '/no-store 1')
+        self.assertEqual(self._get(hdl, '/no-store'), '/no-store 2')
+        self.assertEqual(self._get(hdl, '/plain'), '/plain 3')
+        self.assertEqual(self._get(hdl, '/plain'), '/plain 4')
+        # Disabled by default
+        hdl = HaruhiDL({'logger': FakeLogger(), 'cachedir': self.cache_dir})
+        self._get(hdl, '/fresh')
+        self.assertEqual(self._get(hdl, '/fresh'), '/fresh 6')
+
+    def test_eviction(self):
+        hdl = self._hdl()
+        self._get(hdl, '/fresh')
+        http_dir = os.path.join(self.cache_dir, 'http')
+        entry_size = sum(os.path.getsize(os.path.join(http_dir, fn)) for fn in os.listdir(http_dir))
+        # Only one response fits
+        hdl.params['http_cache_size'] = entry_size * 3 // 2
+        self._get(hdl, '/etag')
+        self.assertEqual(len(os.listdir(http_dir)), 2)
+        self.assertEqual(self._get(hdl, '/fresh'), '/fresh 3')
+
+        # Bodies without metadata are evicted too
+        with open(os.path.join(http_dir, 'orphan.body'), 'wb') as f:
+            f.write(b'x')
+        self._get(hdl, '/etag')
+        self.assertNotIn('orphan.body', os.listdir(http_dir))
+
+
 if __name__ == '__main__':
     unittest.main()
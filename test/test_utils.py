@@ -11,8 +11,11 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
 # Various small unit tests
+import copy
 import io
 import json
+import threading
+import time
 import xml.etree.ElementTree
 
 from haruhi_dl.utils import (
@@ -45,6 +48,7 @@ from haruhi_dl.utils import (
     intlist_to_bytes,
     is_html,
     js_to_json,
+    LazyField,
     limit_length,
     merge_dicts,
     mimetype2ext,
@@ -631,13 +635,14 @@ class TestUtil(unittest.TestCase):
                 for i in range(firstid, upto):
                     yield i
 
-            pl = OnDemandPagedList(get_page, pagesize)
-            got = pl.getslice(*sliceargs)
-            self.assertEqual(got, expected)
+            for kwargs in ({}, {'prefetch': 2, 'cache_size': 1}):
+                pl = OnDemandPagedList(get_page, pagesize, **kwargs)
+                got = pl.getslice(*sliceargs)
+                self.assertEqual(got, expected)
 
-            iapl = InAdvancePagedList(get_page, size // pagesize + 1, pagesize)
-            got = iapl.getslice(*sliceargs)
-            self.assertEqual(got, expected)
+                iapl = InAdvancePagedList(get_page, size // pagesize + 1, pagesize, **kwargs)
+                got = iapl.getslice(*sliceargs)
+                self.assertEqual(got, expected)
 
         testPL(5, 2, (), [0, 1, 2, 3, 4])
         testPL(5, 2, (1,), [1, 2, 3, 4])
@@ -648,6 +653,63 @@ class TestUtil(unittest.TestCase):
         testPL(5, 2, (2, 99), [2, 3, 4])
         testPL(5, 2, (20, 99), [])
 
+    def test_paged_list_prefetch(self):
+        fetched = []
+        lock = threading.Lock()
+
+        def get_page(pagenum):
+            with lock:
+                fetched.append(pagenum)
+            if pagenum == 3:
+                raise ExtractorError('page 3 is broken')
+            # The later pages are the faster ones
+            time.sleep((4 - pagenum) * 0.01)
+            return [pagenum * 2, pagenum * 2 + 1]
+
+        thread_count = threading.active_count()
+        pl = OnDemandPagedList(get_page, 2, prefetch=3)
+        self.assertEqual(pl.getslice(0, 2), [0, 1])
+        # Nothing is prefetched past the end of the slice
+        self.assertEqual(fetched, [0])
+        self.assertEqual(pl.getslice(1, 6), [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(fetched), [0, 1, 2])
+        # The error of a prefetched page is raised once it is needed
+        self.assertRaises(ExtractorError, pl.getslice, 0)
+        self.assertTrue(set(fetched) <= set(range(7)))
+        # No prefetching thread is left behind
+        self.assertIsNone(pl._executor)
+        self.assertEqual(threading.active_count(), thread_count)
+
+        # Only the most recently used pages are kept
+        del fetched[:]
+        pl = InAdvancePagedList(get_page, 3, 2, use_cache=True, cache_size=2)
+        self.assertEqual(pl.getslice(), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(pl.getslice(2, 6), [2, 3, 4, 5])
+        self.assertEqual(pl.getslice(0, 1), [0])
+        self.assertEqual(fetched, [0, 1, 2, 0])
+
+        # Unlike OnDemandPagedList, InAdvancePagedList only caches on request
+        del fetched[:]
+        pl = InAdvancePagedList(get_page, 2, 2)
+        self.assertEqual(pl.getslice(), [0, 1, 2, 3])
+        self.assertEqual(pl.getslice(), [0, 1, 2, 3])
+        self.assertEqual(fetched, [0, 1, 0, 1])
+
+    def test_lazy_field(self):
+        calls = []
+
+        def compute(a, b=0):
+            calls.append((a, b))
+            return a + b
+
+        field = LazyField(compute, 1, b=2)
+        self.assertEqual(calls, [])
+        self.assertEqual(field.get(), 3)
+        self.assertIs(copy.deepcopy({'f': field})['f'], field)
+        self.assertEqual(field.get(), 3)
+        self.assertEqual(calls, [(1, 2)])
+        self.assertIsNone(field._args)
+
     def test_read_batch_urls(self):
         f = io.StringIO('''\xef\xbb\xbf foo
             bar\r
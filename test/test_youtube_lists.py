@@ -43,7 +43,7 @@ class TestYoutubeLists(unittest.TestCase):
         dl = FakeHDL()
         ie = YoutubePlaylistIE(dl)
         result = ie.extract('https://www.youtube.com/watch?v=W01L70IGBgE&index=2&list=RDOQpdSVF_k_w')
-        entries = result['entries']
+        entries = list(result['entries'])
         self.assertTrue(len(entries) >= 50)
         original_video = entries[0]
         self.assertEqual(original_video['id'], 'OQpdSVF_k_w')
@@ -54,7 +54,7 @@ class TestYoutubeLists(unittest.TestCase):
         dl = FakeHDL()
         ie = YoutubePlaylistIE(dl)
         result = ie.extract('https://www.youtube.com/playlist?list=MCUS')
-        entries = result['entries']
+        entries = list(result['entries'])
         self.assertEqual(len(entries), 100)
 
     def test_youtube_flat_playlist_titles(self):
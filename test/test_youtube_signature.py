@@ -94,6 +94,19 @@ class TestPlayerInfo(unittest.TestCase):
             self.assertEqual(player_id, expected_player_id)
 
 
+class TestSignaturePermutation(unittest.TestCase):
+    def test_same_as_stack(self):
+        ie = YoutubeIE(FakeHDL())
+        stack = [['splice', 3], ['mess', 29], ['reverse', None], ['mess', 66], ['splice', 1]]
+        for sig in (string.printable[:86], string.printable[:90]):
+            permutation = ie._signature_permutation('vflTest', stack, len(sig))
+            self.assertEqual(''.join(permutation(sig)), ie._do_decrypt_signature(sig, stack))
+        # Compiled once per player and signature length
+        self.assertIs(
+            ie._signature_permutation('vflTest', stack, 86),
+            ie._signature_permutation('vflTest', stack, 86))
+
+
 class TestSignature(unittest.TestCase):
     def setUp(self):
         TEST_DIR = os.path.dirname(os.path.abspath(__file__))